@@ -0,0 +1,70 @@
+"""Compare scanning messages with one regex per trigger against `TriggerMatcher`.
+
+Run with ``python -m benchmarks.bench_triggers``.
+"""
+
+import random
+import re
+import string
+import timeit
+
+from fbchatbot.trigger import TriggerMatcher, trigger
+
+MESSAGES = [
+    "hey does anyone want to get lunch at noon tomorrow?",
+    "lol that's the best thing I've read all week",
+    "thank you so much, the meeting moved to 5pm by the way",
+    "can someone remind me to water the plants in 2 hours",
+]
+
+
+def random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+
+
+def make_triggers(n: int, rng: random.Random):
+    triggers = []
+    for i in range(n):
+        if i % 10 == 0:
+            patterns = [rf"{random_word(rng)}\s+\d+"]
+            keywords = []
+        else:
+            patterns = []
+            keywords = [random_word(rng)]
+        triggers.append(trigger(*keywords, patterns=patterns)(lambda e: None))
+    # Make sure a few triggers actually fire.
+    triggers.append(trigger("lunch", "meeting")(lambda e: None))
+    return triggers
+
+
+def naive_regexes(triggers):
+    regexes = [re.compile(rf"\b{re.escape(k)}\b", re.I) for t in triggers for k in t.keywords]
+    regexes += [re.compile(p) for t in triggers for p in t.patterns]
+    return regexes
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'triggers':>8} {'naive us/msg':>14} {'matcher us/msg':>16}")
+    for n in (10, 100, 1000, 5000):
+        triggers = make_triggers(n, rng)
+        regexes = naive_regexes(triggers)
+        matcher = TriggerMatcher(triggers)
+
+        def naive():
+            for message in MESSAGES:
+                for regex in regexes:
+                    regex.search(message)
+
+        def combined():
+            for message in MESSAGES:
+                matcher.match(message)
+
+        number = max(1, 20000 // n)
+        naive_us = timeit.timeit(naive, number=number) / number / len(MESSAGES) * 1e6
+        matcher_us = timeit.timeit(combined, number=number) / number / len(MESSAGES) * 1e6
+        print(f"{n:>8} {naive_us:>14.1f} {matcher_us:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Check that a bot handling many unknown commands doesn't accumulate state.
+
+Sends a million commands with random names to a bot, and compares its
+`Chatbot.memory_audit` before and after. Exits with status 1 if anything grew.
+
+Run with ``python -m benchmarks.soak_registries``.
+"""
+
+from datetime import datetime, timezone
+import random
+import sys
+import time
+
+import attr
+import fbchat
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.core_events import CommandEvent
+
+
+def main(iterations: int = 1_000_000) -> int:
+    bot = ChatbotManager().add_bot("bot")
+    session = fbchat.Session(user_id="bot", fb_dtsg="", revision=1)
+    thread = fbchat.Group(session=session, id="123")
+    at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    template = CommandEvent(  # type: ignore
+        author=fbchat.User(session=session, id="456"),
+        thread=thread,
+        message=fbchat.MessageData(thread=thread, id="m", author="456", created_at=at),
+        at=at,
+        command="",
+        command_body="",
+        sent_by_bot=False,
+    )
+
+    bot.handle(template)
+    before = bot.memory_audit()
+    rng = random.Random(0)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        bot.handle(attr.evolve(template, command=f"{rng.getrandbits(40):x}"))
+    elapsed = time.perf_counter() - started
+
+    after = bot.memory_audit()
+    print(f"{iterations} unknown commands in {elapsed:.1f}s")
+    if after != before:
+        print(f"The bot's state grew:\nbefore: {before}\nafter:  {after}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""Benchmarks of the dispatch hot path, with regression checks against a baseline.
+
+Run with ``python -m benchmarks.suite``, or ``make bench``. Options:
+
+- ``--output results.json`` saves the results,
+- ``--baseline benchmarks/baseline.json`` compares them with a baseline, and exits
+  with status 1 if any benchmark is slower than its threshold allows,
+- ``--save-baseline`` overwrites the baseline with the new results,
+- ``-k <text>`` only runs benchmarks whose name contains the text.
+
+Every benchmark reports microseconds per operation, taking the best of several runs.
+The baseline maps benchmark names to ``{"us_per_op": ..., "threshold": ...}``, where
+the threshold is the slowdown allowed before a result counts as a regression (e.g.
+1.5 allows results up to 50% slower). Baselines depend on the machine, so refresh
+them with ``--save-baseline`` when moving to a new one.
+"""
+
+from contextlib import redirect_stdout
+from typing import Any, Callable, Dict, Optional, Tuple
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+
+import attr
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.command import command
+from fbchatbot.core_events import derive_dot_command, parse_event_from_message
+from fbchatbot.event_listener import listener
+from fbchatbot.testing import FakeBackend
+
+#: Slowdown allowed by default before a benchmark counts as a regression.
+DEFAULT_THRESHOLD = 1.5
+
+#: A benchmark's setup: returns a function running the benchmark, and the number of
+#: operations it performs.
+Setup = Callable[[], Tuple[Callable[[], Any], int]]
+
+BENCHMARKS: Dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> Callable[[Setup], Setup]:
+    def register(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+@attr.s(slots=True, frozen=True)
+class Ping:
+    """An event with no special handling, for listener benchmarks."""
+
+    n: int = attr.ib()
+
+
+def quiet_manager() -> ChatbotManager:
+    # Without a config, the manager doesn't configure logging.
+    return ChatbotManager()
+
+
+@benchmark("listener_execute")
+def listener_execute():
+    bot = quiet_manager().add_bot("bot")
+    l = listener(Ping)(lambda e: None)
+    event = Ping(0)
+    ops = 100_000
+
+    def run():
+        for _ in range(ops):
+            l.execute(event, bot)
+
+    return run, ops
+
+
+@benchmark("command_execute")
+def command_execute():
+    backend = FakeBackend()
+    bot = quiet_manager().add_bot("bot")
+    cmd = command("noop")(lambda e, b: None)
+    message = backend.message("t", "alice", ".noop with some args")
+    (event,) = derive_dot_command(parse_event_from_message(message))
+    ops = 100_000
+
+    def run():
+        for _ in range(ops):
+            cmd.execute(event, bot)
+
+    return run, ops
+
+
+def _fanout(n_listeners: int) -> Setup:
+    def setup():
+        bot = quiet_manager().add_bot("bot")
+        for _ in range(n_listeners):
+            bot.add_listener(listener(Ping)(lambda e: None), "bench")
+        events = [Ping(i) for i in range(1000)]
+        ops = 20_000 // max(1, n_listeners // 10)
+
+        def run():
+            for i in range(ops):
+                bot.handle(events[i % 1000])
+
+        return run, ops
+
+    return setup
+
+
+for _n in (1, 10, 100):
+    benchmark(f"handle_fanout_{_n}")(_fanout(_n))
+
+
+@benchmark("parse_event_from_message")
+def parse_message():
+    backend = FakeBackend()
+    events = [
+        backend.message("t", "alice", "hello there"),
+        backend.message("t", "alice", ".ping"),
+        backend.mention("t", "alice", "bot", "Bot", "ping"),
+        backend.message("t", "alice", ""),
+    ]
+    ops = 40_000
+
+    def run():
+        for i in range(ops):
+            parse_event_from_message(events[i % 4])
+
+    return run, ops
+
+
+@benchmark("core_cascade")
+def core_cascade():
+    """A raw message through the core listeners: parsing, mentions, commands and the
+    reply."""
+    backend = FakeBackend()
+    manager = quiet_manager()
+    bot = manager.add_bot("bot")
+    events = [
+        backend.message("t", "alice", "just chatting"),
+        backend.message("t", "alice", ".ping"),
+        backend.mention("t", "alice", "bot", "Bot", "ping"),
+        backend.message("t", "alice", ".unknown command"),
+    ]
+    ops = 10_000
+
+    def run():
+        for i in range(ops):
+            with manager.normalizer.shared():
+                bot.handle(events[i % 4])
+        backend.sent.clear()
+
+    return run, ops
+
+
+def _routing(n_bots: int, n_threads: int) -> Setup:
+    def setup():
+        manager = quiet_manager()
+        bots = [manager.add_bot(f"bot{i}") for i in range(n_bots)]
+        for t in range(n_threads):
+            manager.assign_thread(f"t{t}", bots[t % n_bots])
+        backend = FakeBackend()
+        ops = 5000
+        for i in range(ops):
+            text = ".ping" if i % 10 == 0 else "hello"
+            backend.message(f"t{i % (n_threads * 2)}", f"user{i % 50}", text)
+
+        def run():
+            with redirect_stdout(io.StringIO()):
+                manager.start(backend=backend)
+
+        return run, ops
+
+    return setup
+
+
+benchmark("manager_routing_10_bots_100_threads")(_routing(10, 100))
+
+
+def measure(setup: Setup, repeat: int = 5) -> float:
+    """Return the best time per operation over several runs, in microseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        run, ops = setup()
+        start = time.perf_counter()
+        run()
+        best = min(best, (time.perf_counter() - start) / ops)
+    return best * 1e6
+
+
+def compare(
+    results: Dict[str, float], baseline: Dict[str, Dict[str, float]]
+) -> Dict[str, Tuple[float, float]]:
+    """Return the regressions in the results: name -> (ratio to baseline, threshold)."""
+    regressions = {}
+    for name, us in results.items():
+        entry = baseline.get(name)
+        if entry is None:
+            continue
+        ratio = us / entry["us_per_op"]
+        threshold = entry.get("threshold", DEFAULT_THRESHOLD)
+        if ratio > threshold:
+            regressions[name] = (ratio, threshold)
+    return regressions
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="filter", default="")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    baseline: Dict[str, Dict[str, float]] = {}
+    if args.baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)["benchmarks"]
+        except FileNotFoundError:
+            pass
+
+    results: Dict[str, float] = {}
+    print(f"{'benchmark':<40} {'us/op':>10} {'baseline':>10} {'ratio':>7}")
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        us = results[name] = measure(setup, args.repeat)
+        line = f"{name:<40} {us:>10.2f}"
+        if name in baseline:
+            base = baseline[name]["us_per_op"]
+            line += f" {base:>10.2f} {us / base:>7.2f}"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "benchmarks": {n: {"us_per_op": us} for n, us in results.items()},
+                },
+                f,
+                indent=2,
+            )
+
+    if args.save_baseline:
+        assert args.baseline, "--save-baseline needs --baseline"
+        for name, us in results.items():
+            entry = baseline.setdefault(name, {"threshold": DEFAULT_THRESHOLD})
+            entry["us_per_op"] = round(us, 3)
+        with open(args.baseline, "w") as f:
+            json.dump({"benchmarks": baseline}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+
+    regressions = compare(results, baseline)
+    for name, (ratio, threshold) in regressions.items():
+        print(f"REGRESSION {name}: {ratio:.2f}x the baseline (threshold {threshold}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,18 +4,20 @@ from fbchatbot.core_events import CommandEvent, TextMessageEvent
 
 
 class TestPlugin(Plugin):
-    def __init__(self):
-        self.counter = 0
-
     @property
     def name(self):
         return "Test Plugin"
 
+    def on_load(self, bot: Bot):
+        # Persisted to config.STATE_DB, so the counter survives restarts.
+        self.state = bot.get_state(self.name)
+
     @command("inc")
     def count(self, event: CommandEvent):
         """increment"""
-        self.counter += 1
-        event.thread.send_text(f"Counter at {self.counter}")
+        counter = self.state.get("counter", 0) + 1
+        self.state["counter"] = counter
+        event.thread.send_text(f"Counter at {counter}")
 
 
 use_config(config)
@@ -4,6 +4,7 @@
 from .chatbot_manager import ChatbotManager
 from .event_listener import listener
 from .command import command
+from .trigger import trigger
 from .types_util import Bot
 
 #: Expose the Plugin class, used to define bot plugins
@@ -27,4 +28,5 @@ __all__ = [
     "start",
     "listener",
     "command",
+    "trigger",
 ]
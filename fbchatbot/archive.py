@@ -0,0 +1,199 @@
+"""A built-in plugin which archives every message and reaction to a SQLite database.
+
+Rows are written through a `db.WriteBehind` buffer, so archiving adds no I/O to the
+dispatch loop.
+
+Examples:
+
+    >>> from fbchatbot.archive import ArchivePlugin
+    >>> bot.load_plugin(ArchivePlugin("archive.db"))
+"""
+
+from datetime import datetime
+from typing import Any, List, Optional
+import atexit
+
+import attr
+
+from .core_events import MESSAGE_KINDS, MessageEvent, ReactionEvent
+from .db import WriteBehind, connect, to_millis
+from .event_listener import EventListener, listener
+from .plugin import Plugin
+from .types_util import Bot
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    author_id TEXT NOT NULL,
+    at INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT,
+    reply_to_id TEXT,
+    sent_by_bot INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_thread_at ON messages (thread_id, at);
+CREATE INDEX IF NOT EXISTS messages_author_at ON messages (author_id, at);
+CREATE INDEX IF NOT EXISTS messages_at ON messages (at);
+
+CREATE TABLE IF NOT EXISTS reactions (
+    message_id TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    author_id TEXT NOT NULL,
+    reaction TEXT,
+    at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reactions_message ON reactions (message_id);
+CREATE INDEX IF NOT EXISTS reactions_thread_at ON reactions (thread_id, at);
+"""
+
+_INSERT_MESSAGE = "INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+_INSERT_REACTION = "INSERT INTO reactions VALUES (?, ?, ?, ?, ?)"
+
+
+@attr.s(slots=True, frozen=True)
+class ArchivedMessage:
+    """A message, as stored in the archive."""
+
+    id: str = attr.ib()
+    thread_id: str = attr.ib()
+    author_id: str = attr.ib()
+    #: Milliseconds since the epoch
+    at: int = attr.ib()
+    kind: str = attr.ib()
+    text: Optional[str] = attr.ib()
+    reply_to_id: Optional[str] = attr.ib()
+    sent_by_bot: bool = attr.ib(converter=bool)
+
+
+class MessageArchive:
+    """A SQLite database of messages and reactions, with buffered writes."""
+
+    def __init__(self, path: str, flush_interval: float = 1.0, max_batch: int = 500):
+        conn = connect(path)
+        conn.executescript(_SCHEMA)
+        self.writer = WriteBehind(
+            conn, name="archive", flush_interval=flush_interval, max_batch=max_batch
+        )
+
+    def record_message(self, event: MessageEvent):
+        reply_to_id = event.message.reply_to_id
+        if reply_to_id is None and event.replied_to is not None:
+            reply_to_id = event.replied_to.id
+        self.writer.write(
+            _INSERT_MESSAGE,
+            (
+                event.message.id,
+                event.thread.id,
+                event.author.id,
+                to_millis(event.at),
+                MESSAGE_KINDS.get(type(event), "other"),
+                getattr(event, "text", None),
+                reply_to_id,
+                event.sent_by_bot,
+            ),
+        )
+
+    def record_reaction(self, event: ReactionEvent):
+        self.writer.write(
+            _INSERT_REACTION,
+            (
+                event.message.id,
+                event.thread.id,
+                event.author.id,
+                event.reaction,
+                to_millis(event.at),
+            ),
+        )
+
+    def messages(
+        self,
+        thread_id: Optional[str] = None,
+        author_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = 100,
+    ) -> List[ArchivedMessage]:
+        """Return the most recent archived messages matching all the given conditions,
+        newest first.
+
+        Pending writes are flushed first, so this shouldn't be called in a tight loop.
+        """
+        conditions = []
+        params: List[Any] = []
+        if thread_id is not None:
+            conditions.append("thread_id = ?")
+            params.append(thread_id)
+        if author_id is not None:
+            conditions.append("author_id = ?")
+            params.append(author_id)
+        if since is not None:
+            conditions.append("at >= ?")
+            params.append(to_millis(since))
+        if until is not None:
+            conditions.append("at < ?")
+            params.append(to_millis(until))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        self.writer.flush()
+        with self.writer.lock:
+            rows = self.writer.conn.execute(
+                f"SELECT * FROM messages {where} ORDER BY at DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [ArchivedMessage(*row) for row in rows]
+
+    def recent_ids(self, limit: int = 1000) -> List[str]:
+        """Return the ids of the threads and authors of the most recent messages,
+        most recently active first."""
+        self.writer.flush()
+        with self.writer.lock:
+            rows = self.writer.conn.execute(
+                "SELECT thread_id, author_id FROM messages ORDER BY at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        # dict preserves order, unlike set
+        return list(dict.fromkeys(id for row in rows for id in row))
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+class ArchivePlugin(Plugin):
+    """Records every message and reaction a bot receives into a `MessageArchive`.
+
+    Args:
+        path: Path of the SQLite database. Defaults to the bot's `db` if that's a
+            path, and to "archive.db" otherwise.
+        flush_interval: Seconds between writes to the database.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.archive: Optional[MessageArchive] = None
+
+    @property
+    def name(self) -> str:
+        return "Archive"
+
+    @property
+    def listeners(self) -> List[EventListener]:
+        return [listener(t)(self.record_message) for t in MESSAGE_KINDS] + [
+            listener(ReactionEvent)(self.record_reaction)
+        ]
+
+    def on_load(self, bot: Bot):
+        if self.archive is None:
+            path = self.path or (bot.db if isinstance(bot.db, str) else "archive.db")
+            self.archive = MessageArchive(path, flush_interval=self.flush_interval)
+            atexit.register(self.archive.close)
+
+    def record_message(self, event):
+        self.archive.record_message(event)  # type: ignore
+
+    def record_reaction(self, event):
+        self.archive.record_reaction(event)  # type: ignore
@@ -0,0 +1,225 @@
+"""Typed command arguments, parsed before the command runs.
+
+Commands can declare their arguments with a small schema, instead of splitting
+`command_body` by hand:
+
+    >>> @bot.command("remind", args="who:mention when:duration what:rest [--loud]")
+    >>> def remind(e: CommandEvent):
+    >>>     schedule(e.args["who"], e.args["when"], e.args["what"], e.args["loud"])
+
+The schema is a space separated list of:
+
+- ``name:type``, a required positional argument,
+- ``[name:type]``, an optional positional argument, None if missing,
+- ``[--name]``, a flag, True if present,
+- ``[--name:type]``, an option taking a value, None if missing.
+
+Positional arguments are given in order, while flags and options may appear
+anywhere. The types are:
+
+- ``str``: a single word, or a "quoted string",
+- ``int`` and ``float``,
+- ``duration``: e.g. 90s, 15m or 1h30m, as a `datetime.timedelta`,
+- ``mention``: an @mention, as the id of the mentioned user,
+- ``rest``: the rest of the command body, as is. Only valid as the last argument.
+
+Schemas are compiled into an `ArgParser` when the command is created. Invocations
+which don't match the schema are rejected with a usage message, without running the
+command.
+"""
+
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import re
+
+import attr
+
+
+class ArgumentError(Exception):
+    """A command was invoked with arguments which don't match its schema."""
+
+
+_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+_ESCAPE = re.compile(r"\\(.)")
+_DURATION = re.compile(r"(?:(\d+)d)?(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?")
+_WHITESPACE = re.compile(r"\s*")
+_PARAM = re.compile(r"(\[)?(--)?([A-Za-z_]\w*)(?::(\w+))?(\])?")
+
+
+def _int(token: str) -> int:
+    try:
+        return int(token)
+    except ValueError:
+        raise ArgumentError(f"'{token}' isn't a whole number")
+
+
+def _float(token: str) -> float:
+    try:
+        return float(token)
+    except ValueError:
+        raise ArgumentError(f"'{token}' isn't a number")
+
+
+def _duration(token: str) -> timedelta:
+    match = _DURATION.fullmatch(token)
+    if not token or not match:
+        raise ArgumentError(f"'{token}' isn't a duration, like 90s, 15m or 1h30m")
+    days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+#: Type name -> converter from a token, for the types which take a single token.
+CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    "str": str,
+    "int": _int,
+    "float": _float,
+    "duration": _duration,
+}
+
+
+@attr.s(frozen=True, slots=True)
+class Param:
+    name: str = attr.ib()
+    type: str = attr.ib()
+    optional: bool = attr.ib(False)
+    #: Flags and options have a name starting with "--" in the command body.
+    named: bool = attr.ib(False)
+
+    def usage(self) -> str:
+        if self.named:
+            if self.type == "flag":
+                return f"[--{self.name}]"
+            return f"[--{self.name} <{self.type}>]"
+        if self.type == "rest":
+            usage = f"<{self.name}...>"
+        else:
+            usage = f"<{self.name}:{self.type}>"
+        return f"[{usage}]" if self.optional else usage
+
+
+def _read_token(body: str, pos: int) -> Tuple[str, int]:
+    match = _TOKEN.match(body, pos)
+    assert match is not None
+    quoted, word = match.groups()
+    if quoted is not None:
+        return _ESCAPE.sub(r"\1", quoted), match.end()
+    return word, match.end()
+
+
+def _mention_offsets(event: Any) -> Dict[int, Tuple[int, str]]:
+    """Map the positions of mentions in an event's command body to their length and
+    the id of the mentioned user."""
+    message = getattr(event, "message", None)
+    mentions = getattr(message, "mentions", None)
+    if message is None or not mentions or not message.text:
+        return {}
+    # The body is the end of the message text, once trailing whitespace is stripped.
+    base = len(message.text.rstrip()) - len(event.command_body)
+    return {m.offset - base: (m.length, m.thread_id) for m in mentions}
+
+
+@attr.s(frozen=True, slots=True)
+class ArgParser:
+    """Parses command bodies according to a compiled schema."""
+
+    #: The schema the parser was compiled from.
+    schema: str = attr.ib()
+    positionals: Tuple[Param, ...] = attr.ib()
+    #: Name -> flag or option.
+    named: Dict[str, Param] = attr.ib()
+
+    @classmethod
+    def compile(cls, schema: str) -> "ArgParser":
+        positionals: List[Param] = []
+        named: Dict[str, Param] = {}
+        for spec in schema.split():
+            match = _PARAM.fullmatch(spec)
+            assert match, f"Invalid argument '{spec}' in schema '{schema}'"
+            open_, dashes, name, type_, close = match.groups()
+            assert bool(open_) == bool(close), f"Unbalanced brackets in '{spec}'"
+            assert name not in named and all(
+                p.name != name for p in positionals
+            ), f"Duplicate argument '{name}'"
+            if dashes:
+                assert open_, f"Flags and options are optional, write [{spec}]"
+                type_ = type_ or "flag"
+                assert type_ == "flag" or type_ in CONVERTERS, f"Unknown type {type_}"
+                named[name] = Param(name, type_, optional=True, named=True)
+                continue
+            type_ = type_ or "str"
+            assert type_ in CONVERTERS or type_ in (
+                "mention",
+                "rest",
+            ), f"Unknown type '{type_}'"
+            assert not positionals or positionals[-1].type != "rest", (
+                "Only the last argument can be of type rest"
+            )
+            assert open_ or not positionals or not positionals[-1].optional, (
+                "Required arguments can't follow optional ones"
+            )
+            positionals.append(Param(name, type_, optional=bool(open_)))
+        return cls(schema, tuple(positionals), named)
+
+    def usage(self, command_name: str) -> str:
+        params = [*self.positionals, *self.named.values()]
+        return " ".join([f".{command_name}", *(p.usage() for p in params)])
+
+    def parse(self, event: Any) -> Dict[str, Any]:
+        """Return the arguments of a `CommandEvent`, by name.
+
+        Raises:
+            ArgumentError: If the command body doesn't match the schema.
+        """
+        body: str = event.command_body
+        args: Dict[str, Any] = {
+            name: (False if p.type == "flag" else None) for name, p in self.named.items()
+        }
+        mentions: Optional[Dict[int, Tuple[int, str]]] = None
+        index = 0
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(body, pos).end()  # type: ignore
+            if pos >= len(body):
+                break
+
+            if body.startswith("--", pos) and self.named:
+                token, end = _read_token(body, pos)
+                param = self.named.get(token[2:])
+                if param is None:
+                    raise ArgumentError(f"Unknown option '{token}'")
+                if param.type == "flag":
+                    args[param.name] = True
+                    pos = end
+                    continue
+                pos = _WHITESPACE.match(body, end).end()  # type: ignore
+                if pos >= len(body):
+                    raise ArgumentError(f"Missing value for '{token}'")
+                value, pos = _read_token(body, pos)
+                args[param.name] = CONVERTERS[param.type](value)
+                continue
+
+            if index >= len(self.positionals):
+                raise ArgumentError(f"Unexpected '{_read_token(body, pos)[0]}'")
+            param = self.positionals[index]
+            index += 1
+            if param.type == "rest":
+                args[param.name] = body[pos:]
+                break
+            if param.type == "mention":
+                if mentions is None:
+                    mentions = _mention_offsets(event)
+                mention = mentions.get(pos)
+                if mention is None:
+                    raise ArgumentError(f"Expected a mention for {param.name}")
+                length, user_id = mention
+                args[param.name] = user_id
+                pos += length
+                continue
+            token, pos = _read_token(body, pos)
+            args[param.name] = CONVERTERS[param.type](token)
+
+        for param in self.positionals[index:]:
+            if not param.optional:
+                raise ArgumentError(f"Missing {param.name}")
+            args[param.name] = None
+        return args
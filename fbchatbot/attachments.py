@@ -0,0 +1,312 @@
+"""A shared, on-disk cache of image attachments, downloaded in the background.
+
+Instead of downloading the images of an `ImageMessageEvent` themselves, plugins ask
+the manager's `AttachmentStore`, which downloads each attachment once, however many
+plugins (or bots) want it:
+
+    >>> @bot.listener
+    >>> def on_image(e: ImageMessageEvent, b: Bot):
+    >>>     for future in b.get_attachments().fetch_all(e.image_attachments):
+    >>>         with future.result().mmap() as data:
+    >>>             ...
+
+Downloads run on a small thread pool and are streamed to disk. Files are stored
+under the SHA-256 of their content, so identical images sent in different messages
+are only stored once, and the least recently used files are deleted when the cache
+grows past `max_bytes`, along with the index entries of the attachments stored in
+them.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Set
+import atexit
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+
+import attr
+import fbchat
+import requests
+
+logger = logging.getLogger("fbchatbot")
+
+#: Downloads a url, yielding its content in chunks.
+Downloader = Callable[[str], Iterable[bytes]]
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def http_download(url: str) -> Iterator[bytes]:
+    with requests.get(url, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        yield from response.iter_content(_CHUNK_SIZE)
+
+
+def preview_url(attachment: fbchat.ImageAttachment) -> Optional[str]:
+    """Return the url of the largest preview of an image."""
+    previews = sorted(attachment.previews, key=lambda p: p.width or 0)
+    return previews[-1].url if previews else None
+
+
+@attr.s(slots=True, frozen=True)
+class CachedAttachment:
+    """An attachment stored in the cache."""
+
+    #: Path of the file. It may be deleted by eviction, but stays readable once
+    #: opened.
+    path: str = attr.ib()
+    #: SHA-256 of the content, in hex.
+    digest: str = attr.ib()
+    size: int = attr.ib()
+
+    def open(self) -> IO[bytes]:
+        """Open the file, to stream its content."""
+        return open(self.path, "rb")
+
+    @contextmanager
+    def mmap(self) -> Iterator[mmap.mmap]:
+        """Map the file into memory, read-only."""
+        with self.open() as f:
+            if self.size == 0:
+                # Empty files can't be mapped.
+                yield b""  # type: ignore
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+
+
+class AttachmentStore:
+    """Downloads attachments with bounded concurrency into a content-addressed cache.
+
+    Args:
+        root: Directory of the cache, created on the first fetch.
+        max_bytes: Size of the cache, beyond which the least recently used files are
+            deleted.
+        max_workers: Maximum number of concurrent downloads.
+        downloader: Downloads a url. Replace it to avoid network access in tests.
+    """
+
+    def __init__(
+        self,
+        root: str = "attachments",
+        max_bytes: int = 512 * 1024 * 1024,
+        max_workers: int = 4,
+        downloader: Downloader = http_download,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.downloader = downloader
+        #: Returns the url of an image's original, full size version. Set by the
+        #: manager when it starts; otherwise the largest preview is downloaded.
+        self.resolve_url: Optional[Callable[[str], str]] = None
+        #: Number of fetches served from the cache, and downloaded.
+        self.hits = 0
+        self.downloads = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Attachment id -> future of the download in progress.
+        self._inflight: Dict[str, Future] = {}
+        # Digest -> size of the file, least recently used first. None until the cache
+        # directory has been scanned.
+        self._files: Optional[Dict[str, int]] = None
+        # Digest -> ids of the attachments stored in the file, to delete their index
+        # entries along with it.
+        self._ids: Dict[str, Set[str]] = {}
+        self._total = 0
+
+    def fetch(self, attachment: fbchat.ImageAttachment) -> "Future[CachedAttachment]":
+        """Return a future of the cached attachment, downloading it if needed.
+
+        Concurrent fetches of the same attachment share a single download.
+        """
+        assert attachment.id is not None
+        with self._lock:
+            self._scan()
+            cached = self._lookup(attachment.id)
+            if cached is not None:
+                self.hits += 1
+                future: Future = Future()
+                future.set_result(cached)
+                return future
+            inflight = self._inflight.get(attachment.id)
+            if inflight is not None:
+                return inflight
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="fbchatbot-attachments"
+                )
+                atexit.register(self.shutdown)
+            future = self._executor.submit(self._download, attachment)
+            self._inflight[attachment.id] = future
+            return future
+
+    def fetch_all(
+        self, attachments: Iterable[fbchat.ImageAttachment]
+    ) -> List["Future[CachedAttachment]"]:
+        return [self.fetch(a) for a in attachments]
+
+    def get(self, attachment_id: str) -> Optional[CachedAttachment]:
+        """Return an attachment if it's cached, without downloading it."""
+        with self._lock:
+            self._scan()
+            return self._lookup(attachment_id)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """Stop downloading, waiting for the downloads in progress.
+
+        Args:
+            timeout: Seconds to wait for the downloads, after which they're left to
+                finish in the background, and those not started are cancelled.
+                Waits for all of them if None.
+
+        Returns:
+            Whether all the downloads finished.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            downloads = list(self._inflight.values())
+        if executor is None:
+            return True
+        if timeout is None:
+            executor.shutdown(wait=True)
+            return True
+        # Cancelling a download only succeeds if it hasn't started.
+        for future in downloads:
+            future.cancel()
+        executor.shutdown(wait=False)
+        _, not_done = wait(downloads, timeout)
+        return not not_done
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _index_path(self, attachment_id: str) -> str:
+        # Maps attachment ids to digests on disk, so the cache survives restarts.
+        return os.path.join(self.root, "index", attachment_id)
+
+    def _scan(self):
+        """Load the files already in the cache directory, oldest first."""
+        if self._files is not None:
+            return
+        self._files = OrderedDict()
+        os.makedirs(os.path.join(self.root, "index"), exist_ok=True)
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".part"):
+                    # Left over from an interrupted download.
+                    os.unlink(os.path.join(dirpath, name))
+                elif len(name) == 64 and dirpath.endswith(name[:2]):
+                    stat = os.stat(os.path.join(dirpath, name))
+                    found.append((stat.st_mtime, name, stat.st_size))
+        for _, digest, size in sorted(found):
+            self._files[digest] = size
+            self._total += size
+        index = os.path.join(self.root, "index")
+        for attachment_id in os.listdir(index):
+            path = os.path.join(index, attachment_id)
+            with open(path) as f:
+                digest = f.read()
+            if digest in self._files:
+                self._ids.setdefault(digest, set()).add(attachment_id)
+            else:
+                # Its file was evicted by a process which didn't know about it.
+                os.unlink(path)
+
+    def _lookup(self, attachment_id: str) -> Optional[CachedAttachment]:
+        assert self._files is not None
+        try:
+            with open(self._index_path(attachment_id)) as f:
+                digest = f.read()
+        except FileNotFoundError:
+            return None
+        if digest not in self._files:
+            return None
+        self._files.move_to_end(digest)  # type: ignore
+        return CachedAttachment(self._path(digest), digest, self._files[digest])
+
+    def _download(self, attachment: fbchat.ImageAttachment) -> CachedAttachment:
+        try:
+            url = None
+            if self.resolve_url is not None:
+                url = self.resolve_url(attachment.id)  # type: ignore
+            url = url or preview_url(attachment)
+            assert url is not None, f"No url for attachment {attachment.id}"
+
+            sha = hashlib.sha256()
+            size = 0
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in self.downloader(url):
+                        sha.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
+                digest = sha.hexdigest()
+                path = self._path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            with open(self._index_path(attachment.id), "w") as f:  # type: ignore
+                f.write(digest)
+
+            with self._lock:
+                self.downloads += 1
+                self._add(digest, size)
+                self._ids.setdefault(digest, set()).add(attachment.id)  # type: ignore
+                self._evict(keep=digest)
+            return CachedAttachment(path, digest, size)
+        except Exception:
+            logger.exception(f"Failed to download attachment {attachment.id}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(attachment.id, None)  # type: ignore
+
+    def _add(self, digest: str, size: int):
+        assert self._files is not None
+        if digest not in self._files:
+            self._total += size
+        self._files[digest] = size
+        self._files.move_to_end(digest)  # type: ignore
+
+    def _evict(self, keep: str):
+        assert self._files is not None
+        while self._total > self.max_bytes and len(self._files) > 1:
+            digest = next(iter(self._files))
+            if digest == keep:
+                break
+            size = self._files.pop(digest)
+            self._total -= size
+            try:
+                os.unlink(self._path(digest))
+            except FileNotFoundError:
+                pass
+            for attachment_id in self._ids.pop(digest, ()):
+                self._unindex(attachment_id, digest)
+
+    def _unindex(self, attachment_id: str, digest: str):
+        """Delete an attachment's index entry, unless it was since stored again
+        with different content."""
+        path = self._index_path(attachment_id)
+        try:
+            with open(path) as f:
+                if f.read() == digest:
+                    os.unlink(path)
+        except FileNotFoundError:
+            pass
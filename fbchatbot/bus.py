@@ -0,0 +1,112 @@
+"""Share events between the bots of a manager, through named topics.
+
+Bots subscribe to topics, and any bot or plugin can publish an event to a topic.
+Every bot subscribed to it then handles the event like any other, so listeners for
+the event's type are called:
+
+    >>> @attr.s(frozen=True)
+    ... class Forecast:
+    ...     city: str = attr.ib()
+    ...     text: str = attr.ib()
+    >>> reporter.subscribe("weather")
+    >>> @reporter.listener
+    ... def report(e: Forecast):
+    ...     ...
+    >>> forecaster.publish("weather", Forecast("Montreal", "Snow"))
+
+Events are delivered in the order they're published, on a background thread, so
+publishing never waits for the subscribers. The subscribers of each topic are kept
+in an index updated on (un)subscribing, so publishing costs the same however many
+bots don't subscribe to a topic.
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+import logging
+import threading
+
+logger = logging.getLogger("fbchatbot")
+
+
+class EventBus:
+    """Delivers events published to topics to their subscribers.
+
+    Args:
+        deliver: Called with a subscriber and an event to deliver the event.
+    """
+
+    def __init__(self, deliver: Callable[[Any, Any], None]):
+        self.deliver = deliver
+        #: Number of events published to topics with subscribers.
+        self.published = 0
+        #: Number of deliveries to subscribers.
+        self.delivered = 0
+        self._index: Dict[str, Tuple[Any, ...]] = {}
+        self._pending: Deque[Tuple[Tuple[Any, ...], Any]] = deque()
+        self._cond = threading.Condition()
+        self._delivering = False
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, topic: str, subscriber: Any):
+        with self._cond:
+            subscribers = self._index.get(topic, ())
+            if subscriber not in subscribers:
+                self._index[topic] = subscribers + (subscriber,)
+
+    def unsubscribe(self, topic: str, subscriber: Any):
+        with self._cond:
+            subscribers = tuple(
+                s for s in self._index.get(topic, ()) if s is not subscriber
+            )
+            if subscribers:
+                self._index[topic] = subscribers
+            else:
+                self._index.pop(topic, None)
+
+    def subscribers(self, topic: str) -> Tuple[Any, ...]:
+        return self._index.get(topic, ())
+
+    def publish(self, topic: str, event: Any) -> int:
+        """Queue an event for the subscribers of a topic. Returns the number of
+        subscribers it'll be delivered to."""
+        # Subscribers are resolved now, so later subscriptions don't see the event.
+        subscribers = self._index.get(topic, ())
+        if not subscribers:
+            return 0
+        with self._cond:
+            self.published += 1
+            self._pending.append((subscribers, event))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="event-bus", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify_all()
+        return len(subscribers)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every event published so far is delivered, for at most
+        `timeout` seconds. Returns whether they all were."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._delivering, timeout
+            )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                subscribers, event = self._pending.popleft()
+                self._delivering = True
+            try:
+                for subscriber in subscribers:
+                    try:
+                        self.deliver(subscriber, event)
+                        self.delivered += 1
+                    except Exception:
+                        name = getattr(subscriber, "name", subscriber)
+                        logger.exception(f"Failed to deliver {event!r} to {name}")
+            finally:
+                with self._cond:
+                    self._delivering = False
+                    self._cond.notify_all()
@@ -0,0 +1,90 @@
+"""A small thread-safe cache with per-entry expiry and least-recently-used eviction."""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+import threading
+import time
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Map keys to values which expire `ttl` seconds after being set.
+
+    When the cache holds `max_size` entries, setting a new key evicts the least
+    recently used entry. Expired entries are dropped lazily, when they are looked up
+    or evicted.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        assert max_size > 0
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # Key -> (expiry time, value), least recently used first.
+        self._entries: Dict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value for a key, or `default` if it's missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > self.clock():
+                    self._entries.move_to_end(key)  # type: ignore
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > self.clock()
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Set the value for a key, optionally with its own time to live."""
+        expires = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)  # type: ignore
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)  # type: ignore
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def remove_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Remove every entry whose key matches a predicate. Returns how many were
+        removed."""
+        with self._lock:
+            keys = [k for k in self._entries if predicate(k)]
+            for k in keys:
+                del self._entries[k]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def items(self) -> Iterator[Tuple[Hashable, Any, float]]:
+        """Yield (key, value, seconds left to live) for every entry which hasn't
+        expired."""
+        now = self.clock()
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, (expires, value) in entries:
+            if expires > now:
+                yield key, value, expires - now
@@ -1,27 +1,45 @@
 from typing import (
     Any,
+    Callable,
     Optional,
-    DefaultDict,
     Type,
+    Dict,
     List,
     Tuple,
     Iterable,
     TYPE_CHECKING,
 )
-from datetime import datetime
-from collections import defaultdict
 import logging
 import inspect
+import os
+import time
 
 import attr
 from fbchat import Client
 
 # from .base_plugin import base_plugin
 from .event_listener import listener, EventListener
-from .command import command, Command
-from .core_events import core_listeners, CommandEvent
+from .attachments import AttachmentStore
+from .command import command, CachePolicy, CacheStats, Command
+from .core_events import (
+    core_listeners,
+    CommandEvent,
+    MESSAGE_KINDS,
+    TextMessageEvent,
+    TriggerEvent,
+)
 from .core_commands import core_commands
+from .history import MessageHistory, ThreadHistory
+from .metadata import MetadataCache
+from .normalize import Rule
+from .dispatch import CORE_SOURCE, DispatchTable, DispatchTables, Policy, compile_tables
 from .plugin import Plugin
+from .profiling import ProfileRun
+from .registry import Registry
+from .state import State
+from .throttle import Throttle, ThrottlePolicy
+from .tracing import current_span, span
+from .trigger import trigger, Trigger
 from .types_util import Bot
 from .util import Colors
 
@@ -33,8 +51,8 @@ logger = logging.getLogger("fbchatbot")
 # Type synonyms
 CommandName = str
 Source = str
-CommandMap = DefaultDict[CommandName, List[Tuple[Command, Source]]]
-ListenerMap = DefaultDict[Type[Any], List[Tuple[EventListener, Source]]]
+CommandMap = Registry[CommandName, Command]
+ListenerMap = Registry[Type[Any], EventListener]
 
 
 @attr.s(eq=False)
@@ -48,14 +66,37 @@ class Chatbot:
 
     plugins: List[Plugin] = attr.ib(factory=list)
 
-    listeners: ListenerMap = attr.ib(factory=lambda: defaultdict(list))
+    listeners: ListenerMap = attr.ib(factory=Registry)
+
+    commands: CommandMap = attr.ib(factory=Registry)
+
+    triggers: List[Tuple[Trigger, Source]] = attr.ib(factory=list)
 
-    commands: CommandMap = attr.ib(factory=lambda: defaultdict(list))
+    #: Recent messages in the threads handled by the bot.
+    history: MessageHistory = attr.ib(factory=MessageHistory)
 
     has_loaded: bool = attr.ib(False)
 
     client: Optional[Client] = attr.ib(None)
 
+    #: Policy applied to every thread the bot handles.
+    policy: Policy = attr.ib(factory=Policy)
+
+    #: Additional restrictions for specific threads, layered on top of `policy`.
+    thread_policies: Dict[str, Policy] = attr.ib(factory=dict)
+
+    #: Rate limits on commands, checked before they run.
+    throttle: Throttle = attr.ib(factory=Throttle)
+
+    # Dispatch tables compiled from the listeners, commands and policies. Reset to
+    # None whenever any of those change, and recompiled on the next event.
+    _tables: Optional[DispatchTables] = attr.ib(None, init=False)
+
+    # The profile run in progress, if any, and how many `handle` calls are nested in
+    # the current one, so only top-level events are counted as profiled events.
+    _profile: Optional[ProfileRun] = attr.ib(None, init=False)
+    _depth: int = attr.ib(0, init=False)
+
     @classmethod
     def create(
         cls, name: str, manager: "ChatbotManager", db: Optional[Any]
@@ -64,26 +105,69 @@ class Chatbot:
         chatbot = cls(name=name, manager=manager, db=db)
 
         # Register core event listeners and commands
+        def record_history(event):
+            chatbot.history.record(event)
+
+        # Recorded first, so other listeners see the message in the history.
+        for message_type in MESSAGE_KINDS:
+            chatbot.add_listener(listener(message_type)(record_history), CORE_SOURCE)
+
         @listener
         def handle_command(event: CommandEvent, bot: Bot):
-            for command, _ in chatbot.commands[event.command]:
-                command.execute(event, bot)
-
-        chatbot.add_listener(handle_command, "core")
-        chatbot.add_listeners(core_listeners, "core")
-        chatbot.add_commands(core_commands, "core")
+            commands = chatbot.dispatch_table(event.thread.id).commands.get(
+                event.command, ()
+            )
+            # Unknown commands aren't throttled, so they don't take up buckets.
+            if not commands:
+                return
+            rejection = chatbot.throttle.check(
+                event.command, event.author.id, event.thread.id
+            )
+            if rejection is not None:
+                logger.info(f"Throttled {event.command} from {event.author.id}")
+                if rejection.notice is not None:
+                    event.thread.send_text(rejection.notice)
+                return
+            for command in commands:
+                with span(f"command {command.name}"):
+                    command.execute(event, bot)
+
+        @listener(sent_by_bot=False)
+        def handle_triggers(event: TextMessageEvent, bot: Bot):
+            matcher = chatbot.dispatch_table(event.thread.id).triggers
+            if matcher is None:
+                return
+            for trigger, matched in matcher.match(event.text):
+                trigger_event = TriggerEvent(  # type: ignore
+                    author=event.author,
+                    thread=event.thread,
+                    message=event.message,
+                    at=event.at,
+                    replied_to=event.replied_to,
+                    text=event.text,
+                    sent_by_bot=event.sent_by_bot,
+                    matched=matched,
+                )
+                trigger.execute(trigger_event, bot)
+
+        chatbot.add_listener(handle_command, CORE_SOURCE)
+        chatbot.add_listener(handle_triggers, CORE_SOURCE)
+        chatbot.add_listeners(core_listeners, CORE_SOURCE)
+        chatbot.add_commands(core_commands, CORE_SOURCE)
 
         return chatbot
 
     def add_command(self, command: Command, source: Source):
-        self.commands[command.name].append((command, source))
+        self.commands.add(command.name, command, source)
+        self._tables = None
         logger.info(
             f"Registered Command {command.pretty()} on {Colors.yellow(self.name)} from {Colors.yellow(source)}"
         )
         logger.debug(command)
 
     def add_listener(self, listener: EventListener, source: Source):
-        self.listeners[listener.event].append((listener, source))
+        self.listeners.add(listener.event, listener, source)
+        self._tables = None
         logger.info(
             f"Registered EventListener {listener.pretty()} on {Colors.yellow(self.name)} from {Colors.yellow(source)}"
         )
@@ -93,6 +177,14 @@ class Chatbot:
         # logging module.
         # print(f"Registered EventListener {event_listener.pretty()} on {self.name}")
 
+    def add_trigger(self, trigger: Trigger, source: Source):
+        self.triggers.append((trigger, source))
+        self._tables = None
+        logger.info(
+            f"Registered Trigger {trigger.pretty()} on {Colors.yellow(self.name)} from {Colors.yellow(source)}"
+        )
+        logger.debug(trigger)
+
     def add_commands(self, commands: Iterable[Command], source: Source):
         for command in commands:
             self.add_command(command, source)
@@ -101,30 +193,303 @@ class Chatbot:
         for listener in listeners:
             self.add_listener(listener, source)
 
-    def get_all_commands(self, specified_command: str = "") -> List[Tuple[str, str]]:
+    def add_triggers(self, triggers: Iterable[Trigger], source: Source):
+        for trigger in triggers:
+            self.add_trigger(trigger, source)
+
+    def get_all_commands(
+        self, specified_command: str = "", thread_id: Optional[str] = None
+    ) -> List[Tuple[str, str]]:
         """Return a list of commands and their docs registered to this EventsListener.
 
         Args:
             specified_command: If present, only return info for this command.
+            thread_id: If present, only return commands available in this thread.
 
         Returns:
-
-
+            A list of (name, docs) pairs.
         """
         names_and_docs = []
-        for name, commands in self.commands.items():
+        for name, commands in self.dispatch_table(thread_id).commands.items():
             if specified_command and name != specified_command:
                 continue
-            command, source = commands[0]
-            names_and_docs.append((name, command.docs))
+            names_and_docs.append((name, commands[0].help))
         return names_and_docs
 
+    def dispatch_table(self, thread_id: Optional[str] = None) -> DispatchTable:
+        """Return the compiled listeners and commands available in a thread."""
+        if self._tables is None:
+            self._tables = compile_tables(
+                self.listeners.snapshot(),
+                self.commands.snapshot(),
+                self.triggers,
+                self.policy,
+                self.thread_policies,
+            )
+        return self._tables.for_thread(thread_id)
+
     def handle(self, event: Any):
         """Call every registered listener for a provided event."""
-        print(f"{datetime.now().strftime('%b %d %Y %H:%M:%S')} [{self.name}]")
-        print(event)
-        for listener, _ in self.listeners[type(event)]:
-            listener.execute(event, self)
+        profile = self._profile
+        self._depth += 1
+        try:
+            if profile is not None and self._depth == 1:
+                profile.run(self._handle, event)
+                if profile.done:
+                    self._profile = None
+            else:
+                self._handle(event)
+        finally:
+            self._depth -= 1
+
+    def _handle(self, event: Any):
+        logger.debug("[%s] %s", self.name, event)
+        thread = getattr(event, "thread", None)
+        thread_id = thread.id if thread is not None else None
+        index = self.dispatch_table(thread_id).listeners.get(type(event))
+        if index is None:
+            return
+        if current_span() is None:
+            for listener in index.select(event, thread_id):
+                listener.execute(event, self)
+            return
+        with span(f"handle {type(event).__name__}", bot=self.name):
+            for listener in index.select(event, thread_id):
+                name = getattr(listener.func, "__name__", repr(listener.func))
+                with span(f"listener {name}"):
+                    listener.execute(event, self)
+
+    def memory_audit(self) -> Dict[str, Any]:
+        """Return the sizes of the bot's registries and caches, to check that a
+        long-running bot isn't accumulating state."""
+        tables = self._tables
+        return {
+            "listeners": self.listeners.audit(),
+            "commands": self.commands.audit(),
+            "triggers": len(self.triggers),
+            "thread_policies": len(self.thread_policies),
+            "dispatch_tables": 0
+            if tables is None
+            else len({id(t) for t in (tables.default, *tables.threads.values())}),
+            "history_threads": self.history.thread_count,
+            "history_messages": len(self.history),
+            "throttle_buckets": len(self.throttle),
+            "cached_replies": sum(s.size for s in self.cache_stats().values()),
+        }
+
+    def derive(self, rule: Rule, event: Any) -> Tuple[Any, ...]:
+        """Derive new events from an event using a pure function.
+
+        Bots handling the same event share the derived events, instead of each
+        deriving their own copies. See `normalize`.
+        """
+        return self.manager.normalizer.derive(rule, event)
+
+    def _update_policy(
+        self, threads: Tuple[str, ...], update: Callable[[Policy], Policy]
+    ) -> "Chatbot":
+        if not threads:
+            self.policy = update(self.policy)
+        else:
+            # Threads which end up with equal policies share a single Policy instance.
+            interned = {p: p for p in self.thread_policies.values()}
+            for thread_id in threads:
+                updated = update(self.thread_policies.get(thread_id, Policy()))
+                self.thread_policies[thread_id] = interned.setdefault(updated, updated)
+        self._tables = None
+        return self
+
+    def exclude_commands(self, commands: Iterable[str], *threads: str) -> "Chatbot":
+        """Make commands unavailable, either everywhere or only in the given threads.
+
+        Returns the bot for chaining.
+
+        Examples:
+
+            >>> bot.exclude_commands(["fire_rockets"])
+            >>> bot.exclude_commands(["ping"], "<thread id>")
+        """
+        names = frozenset(commands)
+        return self._update_policy(
+            threads, lambda p: attr.evolve(p, denied_commands=p.denied_commands | names)
+        )
+
+    def allow_commands(self, commands: Iterable[str], *threads: str) -> "Chatbot":
+        """Make only the given commands available, either everywhere or in the given
+        threads. Thread-level allow lists can only narrow down the bot-level one.
+
+        Returns the bot for chaining.
+        """
+        names = frozenset(commands)
+        return self._update_policy(
+            threads, lambda p: attr.evolve(p, allowed_commands=names)
+        )
+
+    def exclude_plugins(self, plugins: Iterable[str], *threads: str) -> "Chatbot":
+        """Disable the listeners and commands of plugins, either everywhere or only in
+        the given threads. Plugins are identified by name.
+
+        Returns the bot for chaining.
+        """
+        names = frozenset(plugins)
+        return self._update_policy(
+            threads, lambda p: attr.evolve(p, denied_sources=p.denied_sources | names)
+        )
+
+    def allow_plugins(self, plugins: Iterable[str], *threads: str) -> "Chatbot":
+        """Only enable the listeners and commands of the given plugins, either
+        everywhere or in the given threads. Core listeners are always enabled.
+
+        Returns the bot for chaining.
+        """
+        names = frozenset(plugins)
+        return self._update_policy(
+            threads, lambda p: attr.evolve(p, allowed_sources=names)
+        )
+
+    def reset_policy(self, *threads: str) -> "Chatbot":
+        """Remove the thread-level policies of the given threads, or of every thread and
+        the bot-level policy if no threads are given. Returns the bot for chaining."""
+        if threads:
+            for thread_id in threads:
+                self.thread_policies.pop(thread_id, None)
+        else:
+            self.policy = Policy()
+            self.thread_policies.clear()
+        self._tables = None
+        return self
+
+    def invalidate_cache(
+        self,
+        command_name: str,
+        thread_id: Optional[str] = None,
+        body: Optional[str] = None,
+    ) -> int:
+        """Forget the cached replies of a command, e.g. after the data it reports on
+        has changed. Optionally only forget the replies in a thread, or for a given
+        command body. Returns the number of replies forgotten.
+        """
+        return sum(
+            command.invalidate(thread_id, body)
+            for command, _ in self.commands.get(command_name)
+        )
+
+    def cache_stats(self) -> Dict[str, CacheStats]:
+        """Return the reply cache hits and misses of every cached command."""
+        stats = {}
+        for name, entries in self.commands.items():
+            for command, _ in entries:
+                command_stats = command.cache_stats()
+                if command_stats is not None:
+                    stats[name] = command_stats
+        return stats
+
+    def throttle_commands(self, policy: ThrottlePolicy, *commands: str) -> "Chatbot":
+        """Rate limit the given commands, or every command without a policy of its own
+        if none are given. Returns the bot for chaining.
+
+        Examples:
+
+            >>> bot.throttle_commands(ThrottlePolicy(per_author=Limit(10, per=60)))
+            >>> bot.throttle_commands(
+            >>>     ThrottlePolicy(per_thread=Limit(1, per=30), notice="Hold on..."),
+            >>>     "render",
+            >>> )
+        """
+        self.throttle.set_policy(policy, *commands)
+        return self
+
+    def get_state(self, namespace: str) -> State:
+        """Return the bot's persistent state in a namespace, e.g. a plugin's name.
+
+        See `state` for scoping state to threads and users.
+        """
+        return self.manager.get_state_store().namespace(f"{self.name}/{namespace}")
+
+    def subscribe(self, *topics: str) -> "Chatbot":
+        """Handle the events published to topics by any bot of the manager. Returns
+        the bot for chaining.
+
+        See `bus` for an example.
+        """
+        for topic in topics:
+            self.manager.bus.subscribe(topic, self)
+        return self
+
+    def unsubscribe(self, *topics: str) -> "Chatbot":
+        for topic in topics:
+            self.manager.bus.unsubscribe(topic, self)
+        return self
+
+    def publish(self, topic: str, event: Any) -> int:
+        """Have the bots subscribed to a topic handle an event, once the current
+        event is handled. Returns the number of bots it's delivered to."""
+        return self.manager.bus.publish(topic, event)
+
+    def submit_task(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        thread: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Run `func(*args, **kwargs)` in a worker process, without blocking.
+
+        When it finishes, the bot handles a `tasks.TaskResultEvent` with the result.
+        `func` and its arguments must be picklable.
+
+        Args:
+            thread: Passed on to the result event, e.g. to reply in the thread the
+                task was submitted from.
+
+        Returns:
+            The id of the task, also found on its result event.
+        """
+        return self.manager.tasks.submit(
+            lambda event: self.manager.post(self, event),
+            func,
+            *args,
+            thread=thread,
+            **kwargs,
+        )
+
+    def is_admin(self, user_id: str) -> bool:
+        """Return whether a user is one of the admins listed in the config's
+        ADMIN_IDS, either a collection of ids or a single id."""
+        admin_ids = getattr(self.manager.config, "ADMIN_IDS", None) or ()
+        if isinstance(admin_ids, (str, int)):
+            admin_ids = (admin_ids,)
+        return str(user_id) in {str(id) for id in admin_ids}
+
+    def start_profile(
+        self,
+        on_done: Callable[[str], None],
+        events: Optional[int] = None,
+        seconds: Optional[float] = None,
+    ) -> str:
+        """Profile the next events handled by the bot, for a number of events or
+        seconds, then write the stats to a file in the config's PROFILE_DIR and call
+        `on_done` with a summary. Returns the path of the file.
+
+        Replaces any profile run in progress, without writing its stats.
+        """
+        directory = getattr(self.manager.config, "PROFILE_DIR", None) or "."
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(directory, f"profile-{self.name}-{timestamp}.prof")
+        self._profile = ProfileRun(path, on_done, events=events, seconds=seconds)
+        return path
+
+    def get_history(self, thread_id: str) -> Optional[ThreadHistory]:
+        """Return the recent messages of a thread, or None if there aren't any."""
+        return self.history.thread(thread_id)
+
+    def get_attachments(self) -> AttachmentStore:
+        """Return the store of downloaded attachments, shared between bots."""
+        return self.manager.attachments
+
+    def get_metadata(self) -> MetadataCache:
+        """Return the cache of user and thread metadata, shared between bots."""
+        return self.manager.metadata
 
     # TODO make property?
     def get_client(self) -> Client:
@@ -134,20 +499,35 @@ class Chatbot:
         ), "Cannot call get_client until bot has started listening."
         return self.client  # type: ignore
 
-    def listener(self, arg):
-        """Convenience decorator for creating a listener and adding it to the bot."""
+    def listener(self, arg=None, **filters):
+        """Convenience decorator for creating a listener and adding it to the bot.
+
+        Accepts the same arguments as `event_listener.listener`.
+        """
         source = inspect.stack()[1].filename
 
+        if arg is not None and not inspect.isclass(arg):
+            # Used without arguments, i.e. directly on the handler
+            self.add_listener(listener(arg), source)
+            return arg
+
         def dec(x):
-            y = listener(arg)(x)
+            y = listener(arg, **filters)(x)
             self.add_listener(y, source)
+            return x
 
         return dec
 
-    def command(self, command_name):
+    def command(
+        self,
+        command_name: str,
+        cache: Optional[CachePolicy] = None,
+        args: Optional[str] = None,
+    ):
         """Convenience decorator for creating a command and adding it to the bot.
 
-        Use the decorator on a command handler.
+        Use the decorator on a command handler. Accepts the same arguments as
+        `command.command`.
 
         Examples:
 
@@ -159,8 +539,29 @@ class Chatbot:
         source = inspect.stack()[1].filename
 
         def dec(x):
-            y = command(command_name)(x)
+            y = command(command_name, cache=cache, args=args)(x)
             self.add_command(y, source)
+            return x
+
+        return dec
+
+    def trigger(self, *keywords: str, patterns: Iterable[str] = ()):
+        """Convenience decorator for creating a trigger and adding it to the bot.
+
+        Accepts the same arguments as `trigger.trigger`.
+
+        Examples:
+
+            >>> @bot.trigger("good bot")
+            >>> def thanks(e: TriggerEvent):
+            >>>     e.thread.send_text("<3")
+        """
+        source = inspect.stack()[1].filename
+
+        def dec(x):
+            y = trigger(*keywords, patterns=patterns)(x)
+            self.add_trigger(y, source)
+            return x
 
         return dec
 
@@ -180,6 +581,7 @@ class Chatbot:
         # decorator on top of a method in a plugin definition.
         method_listeners = []
         method_commands = []
+        method_triggers = []
         for attrib in dir(plugin):
             # TODO I guess it's more pythonic to get rid of the isinstance branching,
             # add them all to one list, and then determine if they are a command or a
@@ -192,9 +594,14 @@ class Chatbot:
                 method_command = getattr(plugin, attrib)
                 method_command.bind(plugin)
                 method_commands.append(method_command)
+            if isinstance(getattr(plugin, attrib), Trigger):
+                method_trigger = getattr(plugin, attrib)
+                method_trigger.bind(plugin)
+                method_triggers.append(method_trigger)
 
         self.add_listeners(plugin.listeners + method_listeners, plugin.name)
         self.add_commands(plugin.commands + method_commands, plugin.name)
+        self.add_triggers(plugin.triggers + method_triggers, plugin.name)
 
         self.plugins.append(plugin)
 
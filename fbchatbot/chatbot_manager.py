@@ -1,13 +1,79 @@
 import atexit
 import logging
-from typing import Any, Set, Optional, Dict
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Any, Set, Optional, Dict, Iterable, List, cast
 
 import attr
 import fbchat
 
 # from .base_plugin import base_plugin
 from .util import get_session, save_session
+from .attachments import AttachmentStore
+from .bus import EventBus
 from .chatbot import Chatbot
+from .checkpoint import Checkpoint
+from .ingest import IngestQueue
+from .metadata import MetadataCache
+from .normalize import Normalizer
+from .state import StateStore
+from .supervisor import Supervisor
+from .tasks import TaskQueue
+from .tracing import Tracer, instrument_sends
+from .types_util import Backend
+
+logger = logging.getLogger("fbchatbot")
+
+
+class FacebookBackend:
+    """Logs in to facebook with the credentials in a config, reusing the cookies
+    saved by the previous session if possible."""
+
+    def __init__(self, config: Any):
+        self.config = config
+
+    def connect(self):
+        return get_session(self.config)
+
+    def close(self, session):
+        """Save the session's cookies, so the next process doesn't log in again."""
+        save_session(session)
+
+    def listener(self, session):
+        # TODO Figure out what these kwargs do
+        return fbchat.Listener(session=session, chat_on=True, foreground=True)
+
+    def client(self, session):
+        return fbchat.Client(session=session)  # type: ignore
+
+    def fetch_messages(
+        self, session, thread_id: str, since: datetime, limit: int = 100
+    ) -> List[fbchat.MessageEvent]:
+        """Return events for the messages sent to a thread after a time, oldest
+        first."""
+        # Replies need to know whether the thread is a group or a user.
+        client = fbchat.Client(session=session)  # type: ignore
+        thread = next(iter(client.fetch_thread_info([thread_id])), None)
+        if thread is None:
+            return []
+        missed = []
+        # fbchat annotates the messages as Message, but they're MessageData.
+        messages = cast(
+            Iterable[fbchat.MessageData], thread.fetch_messages(limit=limit)
+        )
+        for message in messages:
+            if message.created_at <= since:
+                break
+            message = attr.evolve(message, thread=thread)  # type: ignore
+            author = fbchat.User(session=session, id=message.author)  # type: ignore
+            missed.append(
+                fbchat.MessageEvent(  # type: ignore
+                    author=author, thread=thread, message=message, at=message.created_at
+                )
+            )
+        return missed[::-1]
 
 
 @attr.s(eq=False, kw_only=True)
@@ -23,6 +89,48 @@ class ChatbotManager:
 
     thread_map: Dict[str, Chatbot] = attr.ib(factory=dict)
 
+    #: User and thread metadata, shared by all the bots.
+    metadata: MetadataCache = attr.ib(factory=MetadataCache)
+
+    #: Shares events derived from the same raw event between bots.
+    normalizer: Normalizer = attr.ib(factory=Normalizer)
+
+    #: Downloaded attachments, shared by all the bots.
+    attachments: AttachmentStore = attr.ib(factory=AttachmentStore)
+
+    #: Worker processes running the bots' tasks.
+    tasks: TaskQueue = attr.ib(factory=TaskQueue)
+
+    #: Held while a bot handles an event, so events from other threads (e.g. task
+    #: results) are handled one at a time too.
+    dispatch_lock: threading.RLock = attr.ib(factory=threading.RLock)
+
+    #: Delivers events published to topics to the bots subscribed to them.
+    bus: EventBus = attr.ib(
+        default=attr.Factory(lambda self: EventBus(self.post), takes_self=True),
+        init=False,
+    )
+
+    #: Restarts the listener when it fails, while `start` is running. Its `stats`
+    #: count reconnects and the time spent disconnected.
+    supervisor: Optional[Supervisor] = attr.ib(default=None, init=False)
+
+    #: Samples the handling of events and writes traces to ``TRACE_FILE``.
+    tracer: Tracer = attr.ib(factory=Tracer)
+
+    #: Events from the listener waiting to be dispatched, while `start` is running.
+    #: Its `stats` report its depth, lag and the events it dropped.
+    ingest: Optional[IngestQueue] = attr.ib(default=None, init=False)
+
+    #: The last message handled, saved to ``CHECKPOINT_FILE`` on shutdown.
+    last_message: Optional[fbchat.MessageData] = attr.ib(default=None, init=False)
+
+    # Monotonic time by which `start` stops handling events, once stopping.
+    _deadline: Optional[float] = attr.ib(default=None, init=False)
+
+    # Opened on first use, see `get_state_store`.
+    _state: Optional[StateStore] = attr.ib(default=None, init=False)
+
     def __attrs_post_init__(self):
         # Configure logging
         if self.config is not None:
@@ -59,18 +167,90 @@ class ChatbotManager:
         ), f"Already assigned {thread_id} to bot {assigned_bot.name}"
         self.thread_map[thread_id] = bot
 
-    def start(self, bot: Optional[Chatbot] = None):
+    def get_state_store(self) -> StateStore:
+        """Return the bots' persistent state, stored in ``STATE_DB`` ("state.db" by
+        default), which is opened on first use."""
+        if self._state is None:
+            self._state = StateStore(getattr(self.config, "STATE_DB", "state.db"))
+            atexit.register(self._state.close)
+        return self._state
+
+    def post(self, bot: Chatbot, event: Any):
+        """Have a bot handle an event from outside the listener loop, e.g. from
+        another thread."""
+        with self.dispatch_lock, self.normalizer.shared():
+            with self.tracer.trace(type(event).__name__):
+                bot.handle(event)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop listening, and have `start` return once the events already received
+        and the pending tasks are handled.
+
+        Safe to call from signal handlers and other threads.
+
+        Args:
+            timeout: Seconds to wait for the events and tasks before giving up on
+                them. Defaults to ``DRAIN_TIMEOUT`` from the config, or 10. Events
+                left unhandled are fetched again by the next process, if
+                ``CHECKPOINT_FILE`` is set.
+        """
+        if self._deadline is not None:
+            return
+        if timeout is None:
+            timeout = getattr(self.config, "DRAIN_TIMEOUT", 10.0)
+        self._deadline = time.monotonic() + timeout
+        if self.ingest is not None:
+            self.ingest.stop_at(self._deadline)
+        if self.supervisor is not None:
+            self.supervisor.stop()
+
+    def _on_signal(self, signum, frame):
+        if self._deadline is not None:
+            # Stop right away when signalled twice.
+            raise KeyboardInterrupt
+        print(f"Received {signal.Signals(signum).name}, stopping...")
+        self.stop()
+
+    def _shutdown(self, backend: Backend, session: Any, threads: Iterable[str]):
+        deadline = self._deadline if self._deadline is not None else time.monotonic()
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        if not self.bus.drain(max(0.0, deadline - time.monotonic())):
+            logger.warning("Gave up on undelivered bus events")
+        if not self.tasks.drain(max(0.0, deadline - time.monotonic())):
+            logger.warning(f"Gave up on {self.tasks.pending} pending tasks")
+        self.tasks.shutdown(wait=False)
+        if not self.attachments.shutdown(max(0.0, deadline - time.monotonic())):
+            logger.warning("Gave up on unfinished attachment downloads")
+        if self._state is not None and not self._state.flush():
+            logger.warning("Failed to save the bots' state, retrying on exit")
+        checkpoint_file = getattr(self.config, "CHECKPOINT_FILE", None)
+        if checkpoint_file and self.last_message is not None:
+            Checkpoint(
+                message_id=self.last_message.id,
+                at=self.last_message.created_at,
+                threads=sorted(threads),
+            ).save(checkpoint_file)
+        close = getattr(backend, "close", None)
+        if close is not None:
+            close(session)
+        self.tracer.close()
+
+    def start(self, bot: Optional[Chatbot] = None, backend: Optional[Backend] = None):
         """Log in to facebook messenger and start listening for and handling events.
-        
+
         This is a blocking method.
+
+        Args:
+            bot: If given, only this bot handles events.
+            backend: Source of the session, events and client. Defaults to logging in
+                to facebook; see `testing.FakeBackend` to run bots offline.
         """
-        session, status = get_session(self.config)
-        atexit.register(lambda: save_session(session))
+        if backend is None:
+            backend = FacebookBackend(self.config)
+        session, status = backend.connect()
         print(f"{status}, user {session.user.id}")
 
-        # TODO Figure out what these kwargs do
-        chat_listener = fbchat.Listener(session=session, chat_on=True, foreground=True)
-
         unassigned_bots = self.bots - set(self.thread_map.values())
         assert (
             len(unassigned_bots) <= 1
@@ -82,19 +262,92 @@ class ChatbotManager:
         available_bots = set([bot]) if bot else self.bots
         bots_for_event = available_bots.copy()
 
-        client = fbchat.Client(session=session)  # type: ignore
+        client = backend.client(session)
         for bot in available_bots:
             bot.client = client
 
+        self.metadata.fetch = client.fetch_thread_info
+        snapshot = getattr(self.config, "METADATA_SNAPSHOT", None)
+        if snapshot:
+            self.metadata.load_snapshot(snapshot)
+            atexit.register(lambda: self.metadata.save_snapshot(snapshot))
+        self.tasks.max_workers = getattr(self.config, "TASK_WORKERS", None)
+        self.attachments.resolve_url = client.fetch_image_url
+        attachment_dir = getattr(self.config, "ATTACHMENT_DIR", None)
+        if attachment_dir:
+            self.attachments.root = attachment_dir
+
+        trace_file = getattr(self.config, "TRACE_FILE", None)
+        if trace_file:
+            self.tracer = Tracer(
+                trace_file, getattr(self.config, "TRACE_SAMPLE_RATE", 0.01)
+            )
+            atexit.register(self.tracer.close)
+            instrument_sends(type(session))
+
+        def claimed_threads() -> Set[str]:
+            threads = {t for t, b in self.thread_map.items() if b in available_bots}
+            if fallback_bot in available_bots:
+                threads.update(fallback_bot.history.thread_ids())
+            return threads
+
+        self.supervisor = Supervisor(
+            backend,
+            session,
+            threads=claimed_threads,
+            initial_delay=getattr(self.config, "RECONNECT_DELAY", 1.0),
+            max_delay=getattr(self.config, "MAX_RECONNECT_DELAY", 300.0),
+        )
+
+        checkpoint_file = getattr(self.config, "CHECKPOINT_FILE", None)
+        checkpoint = Checkpoint.load(checkpoint_file) if checkpoint_file else None
+        if checkpoint is not None:
+            resumed_threads = set(checkpoint.threads)
+            self.supervisor.threads = lambda: claimed_threads() | resumed_threads
+            self.supervisor.resume(checkpoint.at, checkpoint.message_id)
+
+        self.ingest = IngestQueue(
+            max_size=getattr(self.config, "INGEST_QUEUE_SIZE", 1000),
+            max_age=getattr(self.config, "INGEST_MAX_AGE", None),
+        )
+        self.ingest.bot_id = str(session.user.id)
+        reader = threading.Thread(
+            target=self.ingest.run,
+            args=(self.supervisor.events(),),
+            name="listener",
+            daemon=True,
+        )
+
+        self._deadline = None
+        previous_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            # Not the bound method: signal.signal formats the repr of handlers it
+            # returns, and the manager's repr includes every bot.
+            def on_signal(signum, frame):
+                self._on_signal(signum, frame)
+
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                previous_handlers[signum] = signal.signal(signum, on_signal)
+
         # Listener event loop
         print("Listening...")
-        for event in chat_listener.listen():
-            if isinstance(event, fbchat.ThreadEvent):
-                b = self.thread_map.get(event.thread.id, fallback_bot)
-                if b:
-                    bots_for_event &= set([b])
-                else:
-                    bots_for_event.clear()
-            for b in bots_for_event:
-                b.handle(event)
-            bots_for_event |= available_bots
+        reader.start()
+        try:
+            for event in self.ingest:
+                if isinstance(event, fbchat.ThreadEvent):
+                    b = self.thread_map.get(event.thread.id, fallback_bot)
+                    if b:
+                        bots_for_event &= set([b])
+                    else:
+                        bots_for_event.clear()
+                with self.dispatch_lock, self.normalizer.shared():
+                    with self.tracer.trace(type(event).__name__):
+                        for b in bots_for_event:
+                            b.handle(event)
+                bots_for_event |= available_bots
+                if isinstance(event, (fbchat.MessageEvent, fbchat.MessageReplyEvent)):
+                    self.last_message = event.message
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            self._shutdown(backend, session, self.supervisor.threads())
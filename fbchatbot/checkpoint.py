@@ -0,0 +1,62 @@
+"""Remember the last message handled, so the next process can pick up from there.
+
+`ChatbotManager` saves a `Checkpoint` to ``CHECKPOINT_FILE`` when it stops, and
+when it starts again, fetches and handles the messages sent since then.
+"""
+
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+import json
+import logging
+import os
+
+import attr
+
+from .db import to_millis
+
+logger = logging.getLogger("fbchatbot")
+
+
+def _threads(threads: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(threads)
+
+
+@attr.s(slots=True, frozen=True)
+class Checkpoint:
+    #: Id of the last message handled.
+    message_id: str = attr.ib()
+    #: When that message was sent.
+    at: datetime = attr.ib()
+    #: Threads active recently, to fetch the messages missed from.
+    threads: Tuple[str, ...] = attr.ib(default=(), converter=_threads)
+
+    def save(self, path: str):
+        """Write the checkpoint to a file, replacing it atomically."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "message_id": self.message_id,
+                    "at": to_millis(self.at),
+                    "threads": list(self.threads),
+                },
+                f,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Checkpoint"]:
+        """Read a checkpoint, or return None if there is none."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return cls(
+                message_id=data["message_id"],
+                at=datetime.fromtimestamp(data["at"] / 1000, tz=timezone.utc),
+                threads=data.get("threads", ()),
+            )
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            logger.exception(f"Ignoring invalid checkpoint {path}")
+            return None
@@ -1,10 +1,12 @@
-from typing import Any, Optional, Protocol
-import inspect
+from typing import Any, List, Optional, Protocol, Tuple
 from types import MethodType
 
 import attr
 
+from .args import ArgParser, ArgumentError
+from .cache import TTLCache
 from .core_events import CommandEvent
+from .event_listener import _needs_bot_arg
 from .types_util import Bot
 from .util import Colors
 
@@ -15,6 +17,83 @@ class CommandHandler(Protocol):
         ...
 
 
+@attr.s(frozen=True, slots=True)
+class CachePolicy:
+    """How long to reuse the replies of a command, for commands whose replies only
+    depend on their arguments (and maybe their thread).
+
+    Invocations with the same `command_body`, up to whitespace, get the same replies
+    for `ttl` seconds without running the command again.
+    """
+
+    #: Seconds to reuse replies for.
+    ttl: float = attr.ib()
+    #: Whether replies are reused only in the thread they were sent to, or everywhere.
+    per_thread: bool = attr.ib(True)
+    #: Maximum number of invocations to keep the replies of.
+    max_size: int = attr.ib(256)
+
+
+@attr.s(frozen=True, slots=True)
+class CacheStats:
+    hits: int = attr.ib()
+    misses: int = attr.ib()
+    #: Number of invocations whose replies are cached.
+    size: int = attr.ib()
+
+
+# A call to one of a thread's send methods: (method name, args, kwargs).
+Send = Tuple[str, Tuple[Any, ...], dict]
+
+
+class _RecordingThread:
+    """Forwards everything to a thread, recording calls to its send methods.
+
+    It passes for the thread in ``isinstance`` checks and comparisons, so handlers
+    can't tell it apart from the thread.
+    """
+
+    def __init__(self, thread: Any, sends: List[Send]):
+        self._thread = thread
+        self._sends = sends
+
+    @property  # type: ignore
+    def __class__(self):
+        return self._thread.__class__
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, _RecordingThread):
+            other = other._thread
+        return self._thread == other
+
+    def __hash__(self) -> int:
+        return hash(self._thread)
+
+    def __repr__(self) -> str:
+        return repr(self._thread)
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._thread, name)
+        if not name.startswith("send_"):
+            return value
+
+        def send(*args, **kwargs):
+            self._sends.append((name, args, kwargs))
+            return value(*args, **kwargs)
+
+        return send
+
+
+def _replay(sends: Tuple[Send, ...], event: Any, original_message_id: Optional[str]):
+    for name, args, kwargs in sends:
+        if original_message_id is not None and (
+            kwargs.get("reply_to_id") == original_message_id
+        ):
+            # Reply to the new invocation rather than the one which was cached.
+            kwargs = {**kwargs, "reply_to_id": event.message.id}
+        getattr(event.thread, name)(*args, **kwargs)
+
+
 @attr.s
 class Command:
     #: The string which triggers the command
@@ -26,27 +105,115 @@ class Command:
     #: Function invoked when command is called.
     func: CommandHandler = attr.ib()
 
+    #: If set, replies are cached and reused instead of calling `func` again.
+    cache: Optional[CachePolicy] = attr.ib(None)
+
+    #: Parses the arguments of the command, if it declares any.
+    parser: Optional[ArgParser] = attr.ib(None)
+
+    #: Invocation key -> (replies, id of the invoking message). Only if `cache` is set.
+    replies: Optional[TTLCache] = attr.ib(init=False, repr=False, eq=False)
+
+    # Whether `func` takes the bot as an argument, computed once.
+    _needs_bot_arg: bool = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self._needs_bot_arg = _needs_bot_arg(self.func)
+        self.replies = None
+        if self.cache is not None:
+            self.replies = TTLCache(max_size=self.cache.max_size, ttl=self.cache.ttl)
+
     def bind(self, obj):
         self.func = MethodType(self.func, obj)
+        self._needs_bot_arg = _needs_bot_arg(self.func)
+
+    @property
+    def usage(self) -> Optional[str]:
+        return self.parser.usage(self.name) if self.parser is not None else None
+
+    @property
+    def help(self) -> str:
+        """The docs of the command, preceded by its usage if it declares arguments."""
+        if self.parser is None:
+            return self.docs
+        return f"{self.usage}\n{self.docs}" if self.docs else self.usage  # type: ignore
 
     def execute(self, event: Any, bot: Bot):
-        spec = inspect.getfullargspec(self.func)
-        if type(self.func) == MethodType:
-            needs_bot_arg = len(spec.args) == 3
-        else:
-            needs_bot_arg = len(spec.args) == 2
-        self.func(event, bot) if needs_bot_arg else self.func(event)
+        if self.parser is not None:
+            try:
+                args = self.parser.parse(event)
+            except ArgumentError as e:
+                event.thread.send_text(f"{e}. Usage: {self.usage}")
+                return
+            event = attr.evolve(event, args=args)
+
+        if self.replies is None:
+            self._call(event, bot)
+            return
+
+        key = self._cache_key(event)
+        cached = self.replies.get(key)
+        if cached is not None:
+            cached_sends, cached_message_id = cached
+            _replay(cached_sends, event, cached_message_id)
+            return
+        sends: List[Send] = []
+        self._call(attr.evolve(event, thread=_RecordingThread(event.thread, sends)), bot)
+        if sends:
+            # Handlers which didn't reply may do something else, so run them again.
+            message_id = event.message.id if event.message is not None else None
+            self.replies.set(key, (tuple(sends), message_id))
+
+    def _call(self, event: Any, bot: Bot):
+        self.func(event, bot) if self._needs_bot_arg else self.func(event)
+
+    def _cache_key(self, event: Any) -> Tuple[Optional[str], str]:
+        assert self.cache is not None
+        thread_id = event.thread.id if self.cache.per_thread else None
+        return thread_id, " ".join(event.command_body.split())
+
+    def cache_stats(self) -> Optional[CacheStats]:
+        if self.replies is None:
+            return None
+        return CacheStats(
+            hits=self.replies.hits, misses=self.replies.misses, size=len(self.replies)
+        )
+
+    def invalidate(
+        self, thread_id: Optional[str] = None, body: Optional[str] = None
+    ) -> int:
+        """Forget cached replies, optionally only those for a thread and/or command
+        body. Returns the number of replies forgotten."""
+        if self.replies is None:
+            return 0
+        if body is not None:
+            body = " ".join(body.split())
+
+        def matches(key: Any) -> bool:
+            key_thread, key_body = key
+            return (thread_id is None or key_thread in (thread_id, None)) and (
+                body is None or key_body == body
+            )
+
+        return self.replies.remove_where(matches)
 
     def pretty(self):
         """Pretty print command, for info-level logging."""
         return f"{Colors.blue(self.name)} ⟶  {Colors.green(self.func.__name__)}"
 
 
-def command(cmd_name: str):
+def command(
+    cmd_name: str, cache: Optional[CachePolicy] = None, args: Optional[str] = None
+):
     """Decorator for defining commands.
 
     Args:
         cmd_name (str): The string used to invoke the command in a chat session.
+        cache (Optional[CachePolicy]): If given, replies sent through
+            `event.thread` are reused for repeated invocations, instead of calling
+            the function again.
+        args (Optional[str]): Schema of the command's arguments, which are parsed
+            into `CommandEvent.args`. See `fbchatbot.args`.
 
     Decorate a callback function to call it when a user issues a command to the bot.
     The decorated function may take either 1 or 2 arguments; either just the
@@ -74,6 +241,22 @@ def command(cmd_name: str):
         >>>     \"\"\"Trigger event\"\"\"
         >>>     b.handle(MyEvent())
 
+        Parse typed arguments:
+
+        >>> @bot.command("roll", args="sides:int [times:int]")
+        >>> def roll(e: CommandEvent):
+        >>>     \"\"\"Roll a die\"\"\"
+        >>>     times = e.args["times"] or 1
+        >>>     rolls = [random.randint(1, e.args["sides"]) for _ in range(times)]
+        >>>     e.thread.send_text(", ".join(map(str, rolls)))
+
+        Cache the replies of an expensive command for a minute, in each thread:
+
+        >>> @bot.command("stats", cache=CachePolicy(ttl=60))
+        >>> def stats(e: CommandEvent):
+        >>>     \"\"\"Show message stats\"\"\"
+        >>>     e.thread.send_text(compute_stats(e.command_body))
+
     """
 
     def decorator(func: CommandHandler):
@@ -83,6 +266,7 @@ def command(cmd_name: str):
         # Strip any indentation on the docstring
         docs = (func.__doc__ or "").strip()
 
-        return Command(name=cmd_name, docs=docs, func=func)
+        parser = ArgParser.compile(args) if args is not None else None
+        return Command(name=cmd_name, docs=docs, func=func, cache=cache, parser=parser)
 
     return decorator
@@ -12,7 +12,7 @@ def help_cmd(event: CommandEvent, bot: Bot):
     """Show all commands, or use '.help <cmd>' to show help for the command with name <cmd>.
     """
     command = event.command_body
-    commands = bot.get_all_commands(command)
+    commands = bot.get_all_commands(command, event.thread.id)
 
     message = ""
     for name, doc in commands:
@@ -30,4 +30,32 @@ def ping_cmd(event: CommandEvent):
     event.thread.send_text("PONG")
 
 
-core_commands: List[Command] = [help_cmd, ping_cmd]
+@command("profile", args="[events:int] [--seconds:float]")
+def profile_cmd(event: CommandEvent, bot: Bot):
+    """Admins only. Profile the next <events> events (100 by default) or the next
+    --seconds seconds, and reply with the most expensive functions."""
+    if not bot.is_admin(event.author.id):
+        event.thread.send_text("Only admins can profile the bot.")
+        return
+    events = event.args["events"]  # type: ignore
+    seconds = event.args["seconds"]  # type: ignore
+    if events is None and seconds is None:
+        events = 100
+    if (events is not None and events < 1) or (seconds is not None and seconds <= 0):
+        event.thread.send_text(
+            f"Profile at least 1 event, for more than 0s. Usage: {profile_cmd.usage}"
+        )
+        return
+    thread = event.thread
+
+    def on_done(summary: str):
+        thread.send_text(f"Profile written to {path}\n{summary}")
+
+    path = bot.start_profile(on_done, events=events, seconds=seconds)
+    if seconds is not None:
+        thread.send_text(f"Profiling for {seconds:g}s...")
+    else:
+        thread.send_text(f"Profiling the next {events} events...")
+
+
+core_commands: List[Command] = [help_cmd, ping_cmd, profile_cmd]
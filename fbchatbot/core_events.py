@@ -5,7 +5,7 @@ writing a chatbot, as well as events which power the command-handling functional
 of `fbchatbot`.
 """
 
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import re
 from datetime import datetime
 
@@ -75,9 +75,6 @@ class OtherMessageEvent(MessageEvent):
     `fbchatbot.MessageEvent`s
     """
 
-    #: The sticker
-    sticker: fbchat.Sticker = attr.ib()
-
 
 @attr.s(slots=True, kw_only=True, frozen=True)
 class MentionEvent(MessageEvent):
@@ -102,6 +99,18 @@ class CommandEvent(MessageEvent):
     #: The body of the command, ie text after the command string.
     command_body: str = attr.ib()
 
+    #: The arguments parsed from the body, by name, if the command declares them.
+    #: See `fbchatbot.args`.
+    args: Optional[Dict[str, Any]] = attr.ib(None)
+
+
+@attr.s(slots=True, kw_only=True, frozen=True)
+class TriggerEvent(TextMessageEvent):
+    """Represents a text message which fired a trigger. See `fbchatbot.trigger`."""
+
+    #: The part of the text which fired the trigger.
+    matched: str = attr.ib()
+
 
 @attr.s(slots=True, kw_only=True, frozen=True)
 class ReactionEvent(fbchat.ReactionEvent):
@@ -114,6 +123,17 @@ class ReactionEvent(fbchat.ReactionEvent):
     at: datetime = attr.ib()
 
 
+#: The concrete types of message events, with a short name for each kind of message.
+#: Listeners are called for exact event types, so listeners for every message should
+#: be registered on each of these.
+MESSAGE_KINDS = {
+    TextMessageEvent: "text",
+    ImageMessageEvent: "image",
+    StickerMessageEvent: "sticker",
+    OtherMessageEvent: "other",
+}
+
+
 def parse_event_from_message(
     event: fbchat.MessageEvent, reply: Optional[fbchat.MessageData] = None
 ) -> MessageEvent:
@@ -167,28 +187,29 @@ def parse_event_from_message(
     )
 
 
-@listener
-def _fbReaction_to_reaction(event: fbchat.ReactionEvent, bot: Bot):
-    at = datetime.utcnow()
-    bot.handle(
+# Core events are derived from other events by pure functions, which are applied
+# through `Bot.derive`. When the same event is handled by several bots, this lets the
+# manager derive each event once and share the results between bots.
+
+
+def derive_reaction(event: fbchat.ReactionEvent) -> List[ReactionEvent]:
+    return [
         ReactionEvent(  # type: ignore
             author=event.author,
             thread=event.thread,
             message=event.message,
             reaction=event.reaction,
-            at=at,
+            at=datetime.utcnow(),
         )
-    )
+    ]
 
 
-@listener
-def _fbMessage_to_message(event: fbchat.MessageEvent, bot: Bot):
-    bot.handle(parse_event_from_message(event))
+def derive_message(event: fbchat.MessageEvent) -> List[MessageEvent]:
+    return [parse_event_from_message(event)]
 
 
-@listener
-def _fbMessageReply_to_message(event: fbchat.MessageReplyEvent, bot: Bot):
-    bot.handle(
+def derive_reply(event: fbchat.MessageReplyEvent) -> List[MessageEvent]:
+    return [
         parse_event_from_message(
             fbchat.MessageEvent(  # type: ignore
                 author=event.author,
@@ -199,67 +220,105 @@ def _fbMessageReply_to_message(event: fbchat.MessageReplyEvent, bot: Bot):
             # BUG this doesn't seem to be populated when you reply to yourself
             reply=event.replied_to,
         )
-    )
+    ]
+
+
+def derive_mentions(event: TextMessageEvent) -> List[MentionEvent]:
+    bot_id = str(event.thread.session.user.id)
+    return [
+        MentionEvent(  # type: ignore
+            author=event.author,
+            thread=event.thread,
+            message=event.message,
+            at=event.at,
+            replied_to=event.replied_to,
+            sent_by_bot=event.sent_by_bot,
+            mention=mention,
+        )
+        for mention in event.message.mentions
+        if mention.thread_id == bot_id
+    ]
+
+
+cmd_regex = re.compile(r"^(\S+)(.*)")
+cmd_regex_dot = re.compile(r"^\.(\S+)(.*)")
+
+
+def derive_mention_command(event: MentionEvent) -> List[CommandEvent]:
+    # Don't allow commands to be triggered by the bot itself.
+    if event.sent_by_bot or event.mention.offset != 0:
+        return []
+    match = cmd_regex.match(event.message.text[event.mention.length :].strip())
+    if not match:
+        return []
+    command, body = match.groups()
+    return [
+        CommandEvent(  # type: ignore
+            author=event.author,
+            thread=event.thread,
+            message=event.message,
+            at=event.at,
+            command=command,
+            command_body=body.strip(),
+            sent_by_bot=False,
+            replied_to=event.replied_to,
+        )
+    ]
+
+
+def derive_dot_command(event: TextMessageEvent) -> List[CommandEvent]:
+    match = cmd_regex_dot.match(event.text)
+    if not match:
+        return []
+    command, body = match.groups()
+    return [
+        CommandEvent(  # type: ignore
+            author=event.author,
+            thread=event.thread,
+            message=event.message,
+            at=event.at,
+            command=command,
+            command_body=body.strip(),
+            sent_by_bot=False,
+            replied_to=event.replied_to,
+        )
+    ]
 
 
 @listener
-def _message_to_mention(event: TextMessageEvent, bot: Bot):
-    bot_id = event.thread.session.user.id
-    for mention in event.message.mentions:
-        if mention.thread_id == str(bot_id):
-            bot.handle(
-                MentionEvent(  # type: ignore
-                    author=event.author,
-                    thread=event.thread,
-                    message=event.message,
-                    at=event.at,
-                    mention=mention,
-                )
-            )
+def _fbReaction_to_reaction(event: fbchat.ReactionEvent, bot: Bot):
+    for derived in bot.derive(derive_reaction, event):
+        bot.handle(derived)
 
 
-cmd_regex = re.compile("^(\S+)(.*)")
-cmd_regex_dot = re.compile("^\.(\S+)(.*)")
+@listener
+def _fbMessage_to_message(event: fbchat.MessageEvent, bot: Bot):
+    for derived in bot.derive(derive_message, event):
+        bot.handle(derived)
+
+
+@listener
+def _fbMessageReply_to_message(event: fbchat.MessageReplyEvent, bot: Bot):
+    for derived in bot.derive(derive_reply, event):
+        bot.handle(derived)
+
+
+@listener
+def _message_to_mention(event: TextMessageEvent, bot: Bot):
+    for derived in bot.derive(derive_mentions, event):
+        bot.handle(derived)
 
 
 @listener
 def _mention_to_command(event: MentionEvent, bot: Bot):
-    # Don't allow commands to be triggered by the bot itself.
-    if event.sent_by_bot:
-        return
-    if event.mention.offset == 0:
-        match = cmd_regex.match(event.message.text[event.mention.length :].strip())
-        if match:
-            command, body = match.groups()
-            bot.handle(
-                CommandEvent(  # type: ignore
-                    author=event.author,
-                    thread=event.thread,
-                    message=event.message,
-                    at=event.at,
-                    command=command,
-                    command_body=body.strip(),
-                )
-            )
+    for derived in bot.derive(derive_mention_command, event):
+        bot.handle(derived)
 
 
 @listener
 def _message_to_command(event: TextMessageEvent, bot: Bot):
-    match = cmd_regex_dot.match(event.text)
-    if match:
-        command, body = match.groups()
-        bot.handle(
-            CommandEvent(  # type: ignore
-                author=event.author,
-                thread=event.thread,
-                message=event.message,
-                at=event.at,
-                command=command,
-                command_body=body.strip(),
-                sent_by_bot=False,
-                replied_to=event.replied_to,
-            )
-        )
+    for derived in bot.derive(derive_dot_command, event):
+        bot.handle(derived)
 
 
 core_listeners: List[EventListener] = [
@@ -0,0 +1,140 @@
+"""SQLite helpers shared by the built-in stores.
+
+The dispatch loop must never wait on disk, so stores queue their writes on a
+`WriteBehind` buffer, which a background thread flushes in batches, each batch in a
+single transaction.
+"""
+
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Any, List, Sequence, Tuple
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger("fbchatbot")
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a SQLite database in WAL mode, usable from multiple threads.
+
+    WAL lets readers proceed while a batch is being written, and synchronous=NORMAL
+    only syncs at checkpoints, which is safe in WAL mode.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def to_millis(at: datetime) -> int:
+    """Convert a datetime to milliseconds since the epoch. Naive datetimes are UTC."""
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return int(at.timestamp() * 1000)
+
+
+Write = Tuple[str, Sequence[Any]]
+
+
+class WriteBehind:
+    """Buffer writes in memory and flush them to the database from a background thread.
+
+    `write` only appends to a list, so it is safe to call from event handlers. The
+    buffer is flushed every `flush_interval` seconds, or as soon as it holds
+    `max_batch` writes. Each flush runs in a single transaction, with consecutive
+    writes of the same statement batched with `executemany`.
+
+    A batch which fails to be written is retried with the next flush, ahead of the
+    writes queued since, and only dropped after failing `max_retries` more times.
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        name: str = "write-behind",
+        flush_interval: float = 1.0,
+        max_batch: int = 500,
+        max_retries: int = 3,
+    ):
+        self.conn = conn
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        #: Number of writes written, and dropped after failing too many times.
+        self.written = 0
+        self.dropped = 0
+
+        #: Held while using the connection. Readers should hold it too.
+        self.lock = threading.RLock()
+
+        self._pending: List[Write] = []
+        self._pending_lock = threading.Lock()
+        # Number of times in a row flushing failed.
+        self._failures = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def write(self, sql: str, params: Sequence[Any]):
+        """Queue a statement to be executed on the next flush."""
+        assert not self._closed, "Cannot write after the buffer was closed"
+        with self._pending_lock:
+            self._pending.append((sql, params))
+            pending = len(self._pending)
+        if pending >= self.max_batch:
+            self._wake.set()
+
+    def pending(self) -> int:
+        """The number of writes waiting to be flushed."""
+        return len(self._pending)
+
+    def flush(self) -> bool:
+        """Write everything buffered so far, in a single transaction. Returns whether
+        it was written; if not, it's retried with the next flush."""
+        with self.lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return True
+            try:
+                with self.conn:
+                    for sql, writes in groupby(batch, key=lambda w: w[0]):
+                        self.conn.executemany(sql, [params for _, params in writes])
+            except sqlite3.Error:
+                self._failures += 1
+                if self._failures > self.max_retries:
+                    self._failures = 0
+                    self.dropped += len(batch)
+                    logger.exception(f"Dropped a batch of {len(batch)} writes")
+                else:
+                    with self._pending_lock:
+                        self._pending[:0] = batch
+                    logger.exception(f"Failed to write {len(batch)} writes, will retry")
+                return False
+            self._failures = 0
+            self.written += len(batch)
+            return True
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """Flush any remaining writes, stop the background thread and close the
+        connection."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        if not self.flush():
+            with self._pending_lock:
+                lost, self._pending = self._pending, []
+            self.dropped += len(lost)
+            logger.error(f"Dropped {len(lost)} writes which failed to be written")
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,249 @@
+"""Per-thread dispatch policies and the dispatch tables compiled from them.
+
+A `Policy` decides which commands and which plugins (sources of listeners, commands
+and triggers) a bot exposes. A bot has a default policy, and may layer extra
+restrictions on top of it for individual threads. Whenever the registered handlers or
+the policies change, the bot compiles one `DispatchTable` per distinct effective
+policy, so event handling never has to filter anything at event time. Threads with
+identical policies share the same table, which keeps memory flat as the number of
+configured threads grows.
+
+Within a table, the listeners for each event type are further indexed by the thread
+and `sent_by_bot` conditions of their `ListenerFilter`, see `ListenerIndex`.
+"""
+
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
+
+import attr
+
+from .command import Command
+from .event_listener import EventListener, is_sent_by_bot
+from .trigger import Trigger, TriggerMatcher
+
+#: The source used for listeners and commands which are built in to every bot.
+CORE_SOURCE = "core"
+
+
+def _frozen(names: Optional[Iterable[str]]) -> Optional[FrozenSet[str]]:
+    return None if names is None else frozenset(names)
+
+
+def _frozenset(names: Iterable[str]) -> FrozenSet[str]:
+    return frozenset(names)
+
+
+@attr.s(frozen=True, slots=True)
+class Policy:
+    """Allow and deny lists restricting the commands and plugins a bot exposes.
+
+    An allow list of `None` means everything is allowed. Sources are the names of the
+    plugins (or files) listeners and commands were registered from. Core listeners
+    can never be filtered out, since the bot relies on them to work at all, but core
+    commands may be excluded by name.
+    """
+
+    #: If not None, only these commands are available.
+    allowed_commands: Optional[FrozenSet[str]] = attr.ib(None, converter=_frozen)
+
+    #: Commands which are never available.
+    denied_commands: FrozenSet[str] = attr.ib(frozenset(), converter=_frozenset)
+
+    #: If not None, only listeners and commands from these sources are available.
+    allowed_sources: Optional[FrozenSet[str]] = attr.ib(None, converter=_frozen)
+
+    #: Sources whose listeners and commands are never available.
+    denied_sources: FrozenSet[str] = attr.ib(frozenset(), converter=_frozenset)
+
+    def allows_source(self, source: str) -> bool:
+        if source == CORE_SOURCE:
+            return True
+        if self.allowed_sources is not None and source not in self.allowed_sources:
+            return False
+        return source not in self.denied_sources
+
+    def allows_command(self, name: str, source: str) -> bool:
+        if self.allowed_commands is not None and name not in self.allowed_commands:
+            return False
+        return name not in self.denied_commands and self.allows_source(source)
+
+    def restrict(self, other: "Policy") -> "Policy":
+        """Combine two policies. The result only allows what both policies allow."""
+        return Policy(
+            allowed_commands=_intersect(self.allowed_commands, other.allowed_commands),
+            denied_commands=self.denied_commands | other.denied_commands,
+            allowed_sources=_intersect(self.allowed_sources, other.allowed_sources),
+            denied_sources=self.denied_sources | other.denied_sources,
+        )
+
+
+def _intersect(
+    a: Optional[FrozenSet[str]], b: Optional[FrozenSet[str]]
+) -> Optional[FrozenSet[str]]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a & b
+
+
+Listeners = Tuple[EventListener, ...]
+
+
+def _split_by_sender(listeners: Iterable[EventListener]) -> Tuple[Listeners, Listeners]:
+    listeners = list(listeners)
+    return (
+        tuple(l for l in listeners if l.filters.sent_by_bot is not True),
+        tuple(l for l in listeners if l.filters.sent_by_bot is not False),
+    )
+
+
+@attr.s(frozen=True, slots=True)
+class ListenerIndex:
+    """The listeners for one event type, indexed by their filters.
+
+    Each bucket is a pair of listener tuples: the listeners for events not sent by the
+    bot, and the listeners for events sent by the bot. There is a bucket for every
+    thread named in a listener filter, holding the listeners for that thread as well
+    as the listeners for any thread, and a default bucket for all other threads.
+    Registration order is preserved within a bucket.
+    """
+
+    #: Every listener in the index, in registration order.
+    all: Listeners = attr.ib()
+
+    default: Tuple[Listeners, Listeners] = attr.ib()
+
+    by_thread: Mapping[str, Tuple[Listeners, Listeners]] = attr.ib()
+
+    #: Whether selecting a bucket needs to know if the bot sent the event.
+    checks_sender: bool = attr.ib()
+
+    #: Whether any listener has conditions which must be checked per event.
+    has_residual: bool = attr.ib()
+
+    @classmethod
+    def build(cls, listeners: Listeners) -> "ListenerIndex":
+        thread_ids: Set[str] = set()
+        for l in listeners:
+            thread_ids.update(l.filters.threads or ())
+        return cls(
+            all=listeners,
+            default=_split_by_sender(l for l in listeners if l.filters.threads is None),
+            by_thread={
+                thread_id: _split_by_sender(
+                    l
+                    for l in listeners
+                    if l.filters.threads is None or thread_id in l.filters.threads
+                )
+                for thread_id in thread_ids
+            },
+            checks_sender=any(l.filters.sent_by_bot is not None for l in listeners),
+            has_residual=any(l.filters.has_residual for l in listeners),
+        )
+
+    def select(self, event: Any, thread_id: Optional[str]) -> Listeners:
+        """Return the listeners whose filters match an event."""
+        bucket = self.default
+        if thread_id is not None and self.by_thread:
+            bucket = self.by_thread.get(thread_id, bucket)
+        sent = self.checks_sender and is_sent_by_bot(event)
+        listeners = bucket[1] if sent else bucket[0]
+        if self.has_residual:
+            listeners = tuple(
+                l
+                for l in listeners
+                if not l.filters.has_residual or l.filters.matches_residual(event)
+            )
+        return listeners
+
+
+@attr.s(frozen=True, slots=True)
+class DispatchTable:
+    """Listeners and commands available under a single `Policy`."""
+
+    #: Event type -> index of the listeners for that type.
+    listeners: Mapping[Type[Any], ListenerIndex] = attr.ib()
+
+    #: Command name -> commands with that name, in registration order.
+    commands: Mapping[str, Tuple[Command, ...]] = attr.ib()
+
+    #: The triggers available under the policy, or None if there are none.
+    triggers: Optional[TriggerMatcher] = attr.ib()
+
+
+def compile_table(
+    listeners: Mapping[Type[Any], Sequence[Tuple[EventListener, str]]],
+    commands: Mapping[str, Sequence[Tuple[Command, str]]],
+    triggers: Sequence[Tuple[Trigger, str]],
+    policy: Policy,
+) -> DispatchTable:
+    """Filter registered listeners and commands through a policy, ahead of time."""
+    compiled_listeners = {}
+    for event_type, entries in listeners.items():
+        allowed = tuple(l for l, source in entries if policy.allows_source(source))
+        if allowed:
+            compiled_listeners[event_type] = ListenerIndex.build(allowed)
+
+    compiled_commands = {}
+    for name, cmd_entries in commands.items():
+        allowed_cmds = tuple(
+            c for c, source in cmd_entries if policy.allows_command(name, source)
+        )
+        if allowed_cmds:
+            compiled_commands[name] = allowed_cmds
+
+    allowed_triggers = [t for t, source in triggers if policy.allows_source(source)]
+
+    return DispatchTable(
+        listeners=compiled_listeners,
+        commands=compiled_commands,
+        triggers=TriggerMatcher(allowed_triggers) if allowed_triggers else None,
+    )
+
+
+@attr.s(slots=True)
+class DispatchTables:
+    """The compiled tables of a bot: a default table and per-thread overrides."""
+
+    default: DispatchTable = attr.ib()
+
+    #: Thread id -> table, only for threads with their own policy.
+    threads: Dict[str, DispatchTable] = attr.ib(factory=dict)
+
+    def for_thread(self, thread_id: Optional[str]) -> DispatchTable:
+        if thread_id is None or not self.threads:
+            return self.default
+        return self.threads.get(thread_id, self.default)
+
+
+def compile_tables(
+    listeners: Mapping[Type[Any], Sequence[Tuple[EventListener, str]]],
+    commands: Mapping[str, Sequence[Tuple[Command, str]]],
+    triggers: Sequence[Tuple[Trigger, str]],
+    default_policy: Policy,
+    thread_policies: Mapping[str, Policy],
+) -> DispatchTables:
+    """Compile one table per distinct effective policy, shared between threads."""
+    by_policy: Dict[Policy, DispatchTable] = {}
+
+    def table_for(policy: Policy) -> DispatchTable:
+        table = by_policy.get(policy)
+        if table is None:
+            table = by_policy[policy] = compile_table(listeners, commands, triggers, policy)
+        return table
+
+    tables = DispatchTables(default=table_for(default_policy))
+    for thread_id, thread_policy in thread_policies.items():
+        tables.threads[thread_id] = table_for(default_policy.restrict(thread_policy))
+    return tables
@@ -1,5 +1,5 @@
 import inspect
-from typing import Any, Optional, Protocol, Type
+from typing import Any, Callable, FrozenSet, Iterable, Optional, Protocol, Type
 from types import MethodType
 
 import attr
@@ -14,6 +14,77 @@ class ListenerHandler(Protocol):
         ...
 
 
+def _frozen(ids: Optional[Iterable[Any]]) -> Optional[FrozenSet[str]]:
+    return None if ids is None else frozenset(str(i) for i in ids)
+
+
+def is_sent_by_bot(event: Any) -> bool:
+    """Return True if an event was authored by the bot's own account."""
+    sent = getattr(event, "sent_by_bot", None)
+    if sent is not None:
+        return sent
+    author = getattr(event, "author", None)
+    thread = getattr(event, "thread", None)
+    if author is None or thread is None:
+        return False
+    return author.id == thread.session.user.id
+
+
+def event_text(event: Any) -> Optional[str]:
+    """Return the text of an event's message, if there is one."""
+    text = getattr(event, "text", None)
+    if text is None:
+        message = getattr(event, "message", None)
+        text = getattr(message, "text", None)
+    return text
+
+
+@attr.s(frozen=True, slots=True)
+class ListenerFilter:
+    """Declarative conditions an event must meet for a listener to be called.
+
+    Filters are evaluated by the dispatcher, not the listener: the thread and
+    `sent_by_bot` conditions are used to index listeners, so listeners which don't
+    match an event are never invoked. A condition of `None` always matches.
+    """
+
+    #: Ids of the threads the listener responds to.
+    threads: Optional[FrozenSet[str]] = attr.ib(None, converter=_frozen)
+
+    #: Ids of the users the listener responds to.
+    authors: Optional[FrozenSet[str]] = attr.ib(None, converter=_frozen)
+
+    #: Only respond to events sent by the bot (True) or not sent by the bot (False).
+    sent_by_bot: Optional[bool] = attr.ib(None)
+
+    #: Only respond to messages whose text starts with this string.
+    text_prefix: Optional[str] = attr.ib(None)
+
+    @property
+    def has_residual(self) -> bool:
+        """True if the filter has conditions which aren't covered by indexing."""
+        return self.authors is not None or self.text_prefix is not None
+
+    def matches_residual(self, event: Any) -> bool:
+        """Check the conditions which aren't covered by indexing."""
+        if self.authors is not None:
+            author = getattr(event, "author", None)
+            if author is None or author.id not in self.authors:
+                return False
+        if self.text_prefix is not None:
+            text = event_text(event)
+            if text is None or not text.startswith(self.text_prefix):
+                return False
+        return True
+
+
+def _needs_bot_arg(func: Callable) -> bool:
+    spec = inspect.getfullargspec(func)
+    if type(func) == MethodType:
+        return len(spec.args) == 3
+    return len(spec.args) == 2
+
+
 @attr.s
 class EventListener:
     """A function associated with an event type which triggers it."""
@@ -25,16 +96,22 @@ class EventListener:
     # instance and a reference to the `Bot` which received the event.
     func: ListenerHandler = attr.ib()
 
+    #: Conditions on the events `func` is called with.
+    filters: ListenerFilter = attr.ib(factory=ListenerFilter)
+
+    # Whether `func` takes the bot as an argument. Inspecting the signature is slow, so
+    # it is done once rather than on every event.
+    _needs_bot_arg: bool = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self._needs_bot_arg = _needs_bot_arg(self.func)
+
     def bind(self, obj):
         self.func = MethodType(self.func, obj)
+        self._needs_bot_arg = _needs_bot_arg(self.func)
 
     def execute(self, event: Any, bot: Bot):
-        spec = inspect.getfullargspec(self.func)
-        if type(self.func) == MethodType:
-            needs_bot_arg = len(spec.args) == 3
-        else:
-            needs_bot_arg = len(spec.args) == 2
-        self.func(event, bot) if needs_bot_arg else self.func(event)
+        self.func(event, bot) if self._needs_bot_arg else self.func(event)
 
     def pretty(self):
         """Pretty print event handler, for info-level logging."""
@@ -57,7 +134,14 @@ _mismatch_error = """
 """
 
 
-def listener(arg):
+def listener(
+    arg=None,
+    *,
+    threads: Optional[Iterable[str]] = None,
+    authors: Optional[Iterable[str]] = None,
+    sent_by_bot: Optional[bool] = None,
+    text_prefix: Optional[str] = None,
+):
     """Decorator for defining event listeners.
 
     An event listener is  a function which is called whenever a particular type of
@@ -67,6 +151,17 @@ def listener(arg):
     but if the event type is specified using both methods at the same time, the
     provided types must match.
 
+    The keyword arguments restrict which events the listener is called with. They
+    are checked by the bot before calling the listener, which is cheaper than
+    checking them in the listener itself.
+
+    Args:
+        threads: Only respond to events in these threads.
+        authors: Only respond to events from these users.
+        sent_by_bot: Only respond to events sent by the bot (True) or not sent by
+            the bot (False).
+        text_prefix: Only respond to messages whose text starts with this string.
+
     Examples:
         Using type hints to specify the events listened for:
 
@@ -80,13 +175,28 @@ def listener(arg):
         >>> def handle_message(event):
         >>>     print(event.message.text)
 
+        Ignoring messages sent by the bot:
+
+        >>> @plugin.listener(sent_by_bot=False)
+        >>> def handle_message(event: TextMessageEvent):
+        >>>     print(event.text)
+
     """
+    filters = ListenerFilter(
+        threads=threads,
+        authors=authors,
+        sent_by_bot=sent_by_bot,
+        text_prefix=text_prefix,
+    )
 
     # This logic supports the ability to call the listener decorator with or without an
     # event type argument.
     event_type = None
     event_in_decorator = False
-    if inspect.isclass(arg):  # i.e. isinstance(arg, type)
+    if arg is None:
+        # Only filters were passed to the decorator
+        event_in_decorator = True
+    elif inspect.isclass(arg):  # i.e. isinstance(arg, type)
         # The argument is the event
         event_in_decorator = True
         event_type = arg
@@ -105,7 +215,7 @@ def listener(arg):
 
         assert _event_type is not None, _no_event_type_error
 
-        return EventListener(event=_event_type, func=func)
+        return EventListener(event=_event_type, func=func, filters=filters)
 
     if event_in_decorator:
         return decorator
@@ -0,0 +1,150 @@
+"""Recent message history, kept in memory per thread.
+
+Plugins which need conversational context (the last few messages, who said what,
+what a reply is replying to) can get it from the bot instead of the network:
+
+    >>> history = bot.get_history(event.thread.id)
+    >>> original = history.get(event.message.reply_to_id)
+
+Each thread keeps a bounded ring buffer of compact `HistoryEntry`s, with O(1) append
+and lookup by message id. Memory is bounded per thread and globally; when the global
+bound is exceeded, the threads which have been idle the longest are evicted first.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+import attr
+
+from .core_events import MESSAGE_KINDS, MessageEvent
+
+
+@attr.s(slots=True, frozen=True)
+class HistoryEntry:
+    """A message, reduced to the fields needed for context."""
+
+    id: str = attr.ib()
+    thread_id: str = attr.ib()
+    author_id: str = attr.ib()
+    at: datetime = attr.ib()
+    #: One of the values of `core_events.MESSAGE_KINDS`
+    kind: str = attr.ib()
+    text: Optional[str] = attr.ib()
+    reply_to_id: Optional[str] = attr.ib()
+    sent_by_bot: bool = attr.ib()
+
+    @classmethod
+    def from_event(cls, event: MessageEvent) -> "HistoryEntry":
+        reply_to_id = event.message.reply_to_id
+        if reply_to_id is None and event.replied_to is not None:
+            reply_to_id = event.replied_to.id
+        return cls(
+            id=event.message.id,
+            thread_id=event.thread.id,
+            author_id=event.author.id,
+            at=event.at,
+            kind=MESSAGE_KINDS.get(type(event), "other"),
+            text=getattr(event, "text", None),
+            reply_to_id=reply_to_id,
+            sent_by_bot=event.sent_by_bot,
+        )
+
+
+class ThreadHistory:
+    """The most recent messages in a thread, oldest first."""
+
+    __slots__ = ("thread_id", "_entries")
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        # Message id -> entry, in the order messages were received.
+        self._entries: Dict[str, HistoryEntry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[HistoryEntry]:
+        return iter(self._entries.values())
+
+    def get(self, message_id: Optional[str]) -> Optional[HistoryEntry]:
+        """Return the message with the given id, if it's still in the history."""
+        return self._entries.get(message_id) if message_id is not None else None
+
+    def recent(self, n: int) -> List[HistoryEntry]:
+        """Return the last `n` messages, oldest first."""
+        newest_first = list(islice(reversed(self._entries.values()), max(n, 0)))
+        return newest_first[::-1]
+
+    def replied_to(self, entry: HistoryEntry) -> Optional[HistoryEntry]:
+        """Return the message a message is replying to, if it's still in the history."""
+        return self.get(entry.reply_to_id)
+
+    def _append(self, entry: HistoryEntry) -> int:
+        """Add an entry, returning the change in the number of entries."""
+        existed = entry.id in self._entries
+        self._entries[entry.id] = entry
+        return 0 if existed else 1
+
+    def _evict(self, n: int) -> int:
+        """Drop up to `n` of the oldest entries, returning how many were dropped."""
+        dropped = 0
+        while dropped < n and self._entries:
+            self._entries.popitem(last=False)  # type: ignore
+            dropped += 1
+        return dropped
+
+
+class MessageHistory:
+    """Per-thread message histories, with a bound on the total number of messages.
+
+    Args:
+        per_thread: Maximum number of messages kept for each thread.
+        max_messages: Maximum number of messages kept across all threads.
+    """
+
+    def __init__(self, per_thread: int = 50, max_messages: int = 10000):
+        assert 0 < per_thread <= max_messages
+        self.per_thread = per_thread
+        self.max_messages = max_messages
+        # Thread id -> history, least recently active first.
+        self._threads: Dict[str, ThreadHistory] = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        """The total number of messages kept."""
+        return self._size
+
+    @property
+    def thread_count(self) -> int:
+        """The number of threads with a history."""
+        return len(self._threads)
+
+    def thread_ids(self) -> List[str]:
+        """The ids of the threads with a history, least recently active first."""
+        return list(self._threads)
+
+    def thread(self, thread_id: str) -> Optional[ThreadHistory]:
+        """Return the history of a thread, or None if nothing is known about it."""
+        return self._threads.get(thread_id)
+
+    def record(self, event: MessageEvent):
+        entry = HistoryEntry.from_event(event)
+        history = self._threads.get(entry.thread_id)
+        if history is None:
+            history = self._threads[entry.thread_id] = ThreadHistory(entry.thread_id)
+        else:
+            self._threads.move_to_end(entry.thread_id)  # type: ignore
+
+        self._size += history._append(entry)
+        if len(history) > self.per_thread:
+            self._size -= history._evict(len(history) - self.per_thread)
+
+        while self._size > self.max_messages:
+            idle = next(iter(self._threads.values()))
+            if idle is history:
+                self._size -= history._evict(self._size - self.max_messages)
+            else:
+                del self._threads[idle.thread_id]
+                self._size -= len(idle)
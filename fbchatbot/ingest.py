@@ -0,0 +1,236 @@
+"""A bounded queue between the listener and the bots, which sheds load under bursts.
+
+The listener runs on a background thread and puts its events on an `IngestQueue`,
+while `ChatbotManager.start` takes them off and dispatches them. When events arrive
+faster than the bots handle them, the queue fills up, and rather than falling
+further and further behind it drops the events which matter least:
+
+- Passive events (reactions, typing notifications, read receipts, ...) are shed as
+  soon as the queue is more than `shed_at` full.
+- When the queue is full, queued passive events make room for new events. If there
+  are none, the listener waits for the bots to catch up.
+- Events waiting longer than `max_age` seconds are dropped, unless they're essential.
+
+Essential events, i.e. messages which may be commands or mention the bot, are never
+dropped.
+"""
+
+from collections import deque
+from typing import Any, Callable, Deque, Iterator, Optional, Tuple
+import logging
+import threading
+import time
+
+import attr
+import fbchat
+
+logger = logging.getLogger("fbchatbot")
+
+#: Priorities of events, from least to most important.
+PASSIVE = 0
+NORMAL = 1
+ESSENTIAL = 2
+
+#: Events which can be shed first.
+PASSIVE_EVENTS = (
+    fbchat.ReactionEvent,
+    fbchat.Typing,
+    fbchat.Presence,
+    fbchat.MessagesDelivered,
+    fbchat.ThreadsRead,
+    fbchat.LiveLocationEvent,
+    fbchat.UserStatusEvent,
+)
+
+
+def priority(event: Any, bot_id: Optional[str]) -> int:
+    """Return how important it is to handle an event from the listener."""
+    if isinstance(event, PASSIVE_EVENTS):
+        return PASSIVE
+    if isinstance(event, (fbchat.MessageEvent, fbchat.MessageReplyEvent)):
+        message = event.message
+        if (message.text or "").startswith(".") or any(
+            m.thread_id == bot_id for m in message.mentions
+        ):
+            return ESSENTIAL
+    return NORMAL
+
+
+@attr.s(slots=True, frozen=True)
+class IngestStats:
+    #: Number of events waiting to be dispatched.
+    depth: int = attr.ib()
+    #: Largest depth reached.
+    max_depth: int = attr.ib()
+    #: Seconds the last dispatched event waited in the queue.
+    lag: float = attr.ib()
+    received: int = attr.ib()
+    dispatched: int = attr.ib()
+    #: Passive events dropped because the queue was too full.
+    shed: int = attr.ib()
+    #: Events dropped because they waited longer than the maximum age.
+    stale: int = attr.ib()
+
+
+# A queued event, its priority and when it was queued.
+_Entry = Tuple[Any, int, float]
+
+
+class IngestQueue:
+    """Hands events from the listener thread to the dispatch loop, shedding passive
+    events when overloaded.
+
+    Args:
+        max_size: Number of events the queue holds.
+        shed_at: Fraction of `max_size` from which new passive events are shed.
+        max_age: Drop events which waited longer than this many seconds, unless
+            they're essential. Never drop them if None.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        shed_at: float = 0.5,
+        max_age: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        assert max_size > 0, "The queue must hold at least one event"
+        self.max_size = max_size
+        self.shed_at = shed_at
+        self.max_age = max_age
+        self.clock = clock
+        #: User id of the bots, to recognize mentions of them.
+        self.bot_id: Optional[str] = None
+
+        self._entries: Deque[_Entry] = deque()
+        self._cond = threading.Condition()
+        # Whether the dispatch loop or the listener is waiting, to only notify them
+        # when needed.
+        self._getter_waiting = False
+        self._putter_waiting = False
+        self._closed = False
+        # Time by which iterating stops, once stopping.
+        self._deadline: Optional[float] = None
+        self._error: Optional[BaseException] = None
+        self._shedding = False
+        self._max_depth = 0
+        self._lag = 0.0
+        self._received = 0
+        self._dispatched = 0
+        self._shed = 0
+        self._stale = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> IngestStats:
+        return IngestStats(
+            depth=len(self._entries),
+            max_depth=self._max_depth,
+            lag=self._lag,
+            received=self._received,
+            dispatched=self._dispatched,
+            shed=self._shed,
+            stale=self._stale,
+        )
+
+    def put(self, event: Any):
+        """Queue an event, unless it's shed. Waits while the queue is full of events
+        which can't be shed."""
+        level = priority(event, self.bot_id)
+        with self._cond:
+            self._received += 1
+            if level == PASSIVE and len(self._entries) >= self.max_size * self.shed_at:
+                self._shed_one()
+                return
+            while len(self._entries) >= self.max_size:
+                if self._evict_passive():
+                    break
+                self._putter_waiting = True
+                self._cond.wait()
+            self._entries.append((event, level, self.clock()))
+            if len(self._entries) > self._max_depth:
+                self._max_depth = len(self._entries)
+            if self._getter_waiting:
+                self._getter_waiting = False
+                self._cond.notify_all()
+
+    def close(self, error: Optional[BaseException] = None):
+        """Stop accepting events. Iterating the queue stops once it's empty, raising
+        the error if there is one."""
+        with self._cond:
+            self._closed = True
+            self._error = error
+            self._cond.notify_all()
+
+    def stop_at(self, deadline: float):
+        """Stop iterating at a time of `clock`, even if events are left or more are
+        coming. Events queued in the meantime are still yielded."""
+        with self._cond:
+            self._deadline = deadline
+            self._cond.notify_all()
+
+    def __iter__(self) -> Iterator[Any]:
+        """Yield events until the queue is closed and empty, or the deadline set by
+        `stop_at` passes."""
+        while True:
+            with self._cond:
+                while not self._entries and not self._closed:
+                    self._getter_waiting = True
+                    if self._deadline is None:
+                        self._cond.wait()
+                    elif not self._cond.wait(self._deadline - self.clock()):
+                        break
+                if self._deadline is not None and self.clock() >= self._deadline:
+                    if self._entries:
+                        logger.warning(
+                            f"Stopped with {len(self._entries)} events unhandled"
+                        )
+                    return
+                if not self._entries:
+                    break
+                event, level, queued_at = self._entries.popleft()
+                if self._putter_waiting:
+                    self._putter_waiting = False
+                    self._cond.notify_all()
+                waited = self.clock() - queued_at
+                if self.max_age is not None and waited > self.max_age:
+                    if level != ESSENTIAL:
+                        self._stale += 1
+                        continue
+                self._lag = waited
+                self._dispatched += 1
+                if self._shedding and len(self._entries) < self.max_size * self.shed_at:
+                    self._shedding = False
+                    logger.warning(f"Caught up, shed {self._shed} events so far")
+            yield event
+        if self._error is not None:
+            raise self._error
+
+    def run(self, events: Iterator[Any]):
+        """Queue events, e.g. from the listener, then close the queue. Meant to run
+        on its own thread."""
+        try:
+            for event in events:
+                self.put(event)
+        except BaseException as e:
+            self.close(e)
+        else:
+            self.close()
+
+    def _shed_one(self):
+        self._shed += 1
+        if not self._shedding:
+            self._shedding = True
+            logger.warning(
+                f"Falling behind with {len(self._entries)} events queued,"
+                " shedding passive events"
+            )
+
+    def _evict_passive(self) -> bool:
+        for i, (_, level, _) in enumerate(self._entries):
+            if level == PASSIVE:
+                del self._entries[i]
+                self._shed_one()
+                return True
+        return False
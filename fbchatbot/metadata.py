@@ -0,0 +1,261 @@
+"""A cache of user and thread metadata: names, nicknames, participants and admins.
+
+Fetching metadata from facebook takes a network round-trip, so handlers should use
+the cache shared by all of a manager's bots instead of the client:
+
+    >>> info = bot.get_metadata().get(event.author.id)
+    >>> event.thread.send_text(f"Hi {info.first_name}!")
+
+Concurrent misses for the same id share a single fetch, and misses for different ids
+within `batch_window` seconds of each other are fetched together in one request. The
+cache can be warm-started from a snapshot file, or from the ids of recently active
+users and threads in a `archive.MessageArchive`.
+"""
+
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    TYPE_CHECKING,
+    cast,
+)
+import json
+import logging
+import threading
+import time
+
+import attr
+import fbchat
+
+from .cache import TTLCache
+
+if TYPE_CHECKING:
+    from .archive import MessageArchive
+
+logger = logging.getLogger("fbchatbot")
+
+#: Fetches the info of several threads (or users) at once, like
+#: `fbchat.Client.fetch_thread_info`.
+Fetcher = Callable[[List[str]], Iterable[Any]]
+
+_MISSING = object()
+
+
+def _ids(ids: Iterable[str]) -> FrozenSet[str]:
+    return frozenset(ids)
+
+
+def _nicknames(nicknames: Mapping[str, str]) -> Dict[str, str]:
+    return dict(nicknames)
+
+
+@attr.s(slots=True, frozen=True)
+class ThreadInfo:
+    """Metadata about a user, page or group. In fbchat, users are threads too."""
+
+    id: str = attr.ib()
+    #: One of "user", "page" or "group"
+    kind: str = attr.ib()
+    name: Optional[str] = attr.ib(None)
+    #: Only for users
+    first_name: Optional[str] = attr.ib(None)
+    #: Only for users; the user's nickname in their conversation with the bot
+    nickname: Optional[str] = attr.ib(None)
+    #: Only for groups
+    participants: FrozenSet[str] = attr.ib(frozenset(), converter=_ids)
+    #: Only for groups; user id -> nickname
+    nicknames: Mapping[str, str] = attr.ib(factory=dict, converter=_nicknames)
+    #: Only for groups
+    admins: FrozenSet[str] = attr.ib(frozenset(), converter=_ids)
+
+    @classmethod
+    def from_fbchat(cls, data: Any) -> "ThreadInfo":
+        if isinstance(data, fbchat.GroupData):
+            # fbchat annotates participants as ids, but they're User, Page or
+            # Group objects.
+            participants = cast(Iterable[Any], data.participants)
+            return cls(
+                id=data.id,
+                kind="group",
+                name=data.name,
+                participants=(p.id for p in participants),
+                nicknames=data.nicknames,
+                admins=data.admins,
+            )
+        if isinstance(data, fbchat.UserData):
+            return cls(
+                id=data.id,
+                kind="user",
+                name=data.name,
+                first_name=data.first_name,
+                nickname=data.nickname,
+            )
+        return cls(id=data.id, kind="page", name=getattr(data, "name", None))
+
+    def to_json(self) -> Dict[str, Any]:
+        d = attr.asdict(self)
+        for key in ("participants", "admins"):
+            d[key] = sorted(d[key])
+        return d
+
+
+class MetadataCache:
+    """TTL and LRU bounded cache of `ThreadInfo`s, with coalesced, batched fetches.
+
+    Args:
+        fetch: Used to fetch missing info. Set by the manager when it starts.
+        ttl: Seconds before cached info is fetched again.
+        max_size: Maximum number of cached users and threads.
+        batch_window: Seconds to wait for other misses to join a fetch.
+        miss_ttl: Seconds before ids facebook didn't know about are fetched again.
+    """
+
+    def __init__(
+        self,
+        fetch: Optional[Fetcher] = None,
+        ttl: float = 3600,
+        max_size: int = 10000,
+        batch_window: float = 0.01,
+        miss_ttl: float = 60,
+    ):
+        self.fetch = fetch
+        self.batch_window = batch_window
+        self.miss_ttl = miss_ttl
+        # Unknown ids are cached as None.
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+        #: Number of requests made to `fetch`.
+        self.fetches = 0
+        self._lock = threading.Lock()
+        # Id -> future for its info, for every id being (or waiting to be) fetched.
+        self._inflight: Dict[str, Future] = {}
+        # Ids waiting for the current batch window to close.
+        self._pending: List[str] = []
+
+    def get(self, id: str) -> Optional[ThreadInfo]:
+        """Return the info of a user or thread, fetching it if it isn't cached.
+
+        Returns None if facebook doesn't know about the id.
+        """
+        return self.get_many([id]).get(id)
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, ThreadInfo]:
+        """Return the info of several users or threads, fetching the missing ones in a
+        single request."""
+        found: Dict[str, ThreadInfo] = {}
+        waiting: Dict[str, Future] = {}
+        lead = False
+        with self._lock:
+            for id in ids:
+                info = self.cache.get(id, _MISSING)
+                if info is not _MISSING:
+                    if info is not None:
+                        found[id] = info
+                    continue
+                future = self._inflight.get(id)
+                if future is None:
+                    future = self._inflight[id] = Future()
+                    # The first miss of a window fetches the whole batch.
+                    lead = lead or not self._pending
+                    self._pending.append(id)
+                waiting[id] = future
+
+        if lead:
+            if self.batch_window > 0:
+                time.sleep(self.batch_window)
+            with self._lock:
+                batch, self._pending = self._pending, []
+            self._fetch(batch)
+
+        for id, future in waiting.items():
+            info = future.result()
+            if info is not None:
+                found[id] = info
+        return found
+
+    def _fetch(self, ids: List[str]):
+        results: Dict[str, Optional[ThreadInfo]] = {id: None for id in ids}
+        error: Optional[BaseException] = None
+        try:
+            assert self.fetch is not None, "Cannot fetch metadata until bot has started."
+            self.fetches += 1
+            for data in self.fetch(ids):
+                info = ThreadInfo.from_fbchat(data)
+                results[info.id] = info
+                self.cache.set(info.id, info)
+            for id, result in results.items():
+                if result is None:
+                    self.cache.set(id, None, ttl=self.miss_ttl)
+        except Exception as e:
+            logger.exception(f"Failed to fetch metadata for {ids}")
+            error = e
+
+        with self._lock:
+            futures = [self._inflight.pop(id) for id in ids]
+        for id, future in zip(ids, futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[id])
+
+    def nickname(self, thread_id: str, user_id: str) -> Optional[str]:
+        """Return what to call a user in a thread: their nickname if they have one,
+        otherwise their first name."""
+        infos = self.get_many([thread_id, user_id])
+        thread = infos.get(thread_id)
+        if thread is not None and user_id in thread.nicknames:
+            return thread.nicknames[user_id]
+        user = infos.get(user_id)
+        if user is None:
+            return None
+        return user.nickname or user.first_name or user.name
+
+    def is_admin(self, thread_id: str, user_id: str) -> bool:
+        thread = self.get(thread_id)
+        return thread is not None and user_id in thread.admins
+
+    def invalidate(self, id: str):
+        """Forget the cached info of a user or thread, e.g. after a NicknameSet event."""
+        self.cache.pop(id)
+
+    def save_snapshot(self, path: str):
+        """Write the cached info to a file, to warm-start the next process."""
+        now = time.time()
+        entries = [
+            {"info": info.to_json(), "expires": now + ttl}
+            for _, info, ttl in self.cache.items()
+            if info is not None
+        ]
+        with open(path, "w") as f:
+            json.dump(entries, f)
+
+    def load_snapshot(self, path: str) -> int:
+        """Load info saved by `save_snapshot`, skipping anything which has expired
+        since. Returns the number of entries loaded."""
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return 0
+        now = time.time()
+        loaded = 0
+        for entry in entries:
+            ttl = entry["expires"] - now
+            if ttl > 0:
+                info = ThreadInfo(**entry["info"])
+                self.cache.set(info.id, info, ttl=min(ttl, self.cache.ttl))
+                loaded += 1
+        return loaded
+
+    def warm_from_archive(self, archive: "MessageArchive", limit: int = 1000) -> int:
+        """Fetch the info of recently active users and threads, in one request.
+        Returns the number of entries fetched."""
+        ids = [id for id in archive.recent_ids(limit) if id not in self.cache]
+        if not ids:
+            return 0
+        return len(self.get_many(ids))
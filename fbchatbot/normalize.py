@@ -0,0 +1,49 @@
+"""Sharing derived events between the bots which handle the same raw event.
+
+Listeners which turn one event into others (e.g. a `fbchat.MessageEvent` into a
+`core_events.TextMessageEvent`) do so with a pure function, applied with `Bot.derive`.
+While the manager dispatches a raw event to several bots, the `Normalizer` memoizes
+those functions, so each derived event is created once and the same immutable
+instance is handled by every bot. The cost of normalizing an event then doesn't grow
+with the number of bots.
+"""
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+#: A pure function deriving new events from an event.
+Rule = Callable[[Any], Iterable[Any]]
+
+
+class Normalizer:
+    def __init__(self):
+        # (id of the source event, rule) -> derived events, while sharing.
+        self._memo: Optional[Dict[Tuple[int, Rule], Tuple[Any, ...]]] = None
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        """Share derived events until the end of the block.
+
+        Every event derived inside the block is kept alive by the memo until it ends,
+        so event ids can't be reused for different events in the meantime.
+        """
+        if self._memo is not None:
+            # Already sharing, e.g. a bot handling an event in response to another.
+            yield
+            return
+        self._memo = {}
+        try:
+            yield
+        finally:
+            self._memo = None
+
+    def derive(self, rule: Rule, event: Any) -> Tuple[Any, ...]:
+        """Apply a rule to an event, or return its result from earlier in the block."""
+        memo = self._memo
+        if memo is None:
+            return tuple(rule(event))
+        key = (id(event), rule)
+        derived = memo.get(key)
+        if derived is None:
+            derived = memo[key] = tuple(rule(event))
+        return derived
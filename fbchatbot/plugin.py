@@ -3,6 +3,7 @@ from typing import List
 
 from .command import Command
 from .event_listener import EventListener
+from .trigger import Trigger
 from .types_util import Bot
 
 
@@ -24,6 +25,10 @@ class Plugin(ABC):
     def commands(self) -> List[Command]:
         return []
 
+    @property
+    def triggers(self) -> List[Trigger]:
+        return []
+
     def on_load(self, bot: Bot):
         # Do nothing by default
         pass
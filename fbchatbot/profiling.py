@@ -0,0 +1,87 @@
+"""Profile a running bot, e.g. with the admin-only ``.profile`` core command.
+
+A `ProfileRun` profiles the events a bot handles with `cProfile`, until it has
+handled a number of events or a number of seconds have passed. The stats are then
+written to a file, which can be explored with `pstats` or tools like snakeviz, and a
+summary of the most expensive functions is passed to a callback.
+"""
+
+from typing import Callable, List, Optional
+import cProfile
+import os
+import pstats
+import time
+
+#: Number of functions listed in summaries.
+SUMMARY_LENGTH = 10
+
+
+def summarize(stats: pstats.Stats, n: int = SUMMARY_LENGTH) -> str:
+    """Return the functions with the most cumulative time, one per line."""
+    rows = sorted(
+        stats.stats.items(),  # type: ignore
+        key=lambda item: item[1][3],
+        reverse=True,
+    )
+    lines: List[str] = []
+    for (filename, line, func), (_, calls, _, cumulative, _) in rows[:n]:
+        location = f"{os.path.basename(filename)}:{line}" if line else filename
+        lines.append(f"{cumulative * 1000:8.1f}ms {calls:>7} {func} ({location})")
+    return "\n".join(lines)
+
+
+class ProfileRun:
+    """Profiles calls to `run`, until enough events or time have passed.
+
+    Args:
+        path: Where to write the stats.
+        on_done: Called with a summary of the stats once they're written.
+        events: Stop after this many events.
+        seconds: Stop after the first event handled this many seconds after the run
+            started.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        on_done: Callable[[str], None],
+        events: Optional[int] = None,
+        seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        assert (events is not None and events > 0) or (
+            seconds is not None and seconds > 0
+        ), "Profile runs need a positive number of events or seconds"
+        self.path = path
+        self.on_done = on_done
+        self.events_left = events
+        self.deadline = clock() + seconds if seconds else None
+        self.clock = clock
+        self.done = False
+        #: Number of events profiled so far.
+        self.profiled = 0
+        self._profile = cProfile.Profile()
+
+    def run(self, handle: Callable[[object], None], event: object):
+        """Call `handle(event)` under the profiler."""
+        try:
+            self._profile.runcall(handle, event)
+        finally:
+            self.profiled += 1
+            if self.events_left is not None:
+                self.events_left -= 1
+            if self.events_left == 0 or (
+                self.deadline is not None and self.clock() >= self.deadline
+            ):
+                self.finish()
+
+    def finish(self):
+        if self.done:
+            return
+        self.done = True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._profile.dump_stats(self.path)
+        stats = pstats.Stats(self.path)
+        self.on_done(summarize(stats))
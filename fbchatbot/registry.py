@@ -0,0 +1,82 @@
+"""Registries of the listeners and commands registered on a bot."""
+
+from types import MappingProxyType
+from typing import Dict, Generic, Iterator, List, Mapping, Optional, Tuple, TypeVar
+import sys
+
+import attr
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+#: An item registered in a registry, along with the source it was registered from.
+Entry = Tuple[V, str]
+
+
+@attr.s(frozen=True, slots=True)
+class RegistryAudit:
+    """Memory used by a registry."""
+
+    #: Number of keys, e.g. event types or command names.
+    keys: int = attr.ib()
+    #: Number of registered items, over all keys.
+    entries: int = attr.ib()
+    #: Approximate size in bytes of the registry's containers (not of the items).
+    size: int = attr.ib()
+
+
+class Registry(Generic[K, V]):
+    """Items registered under keys, e.g. event listeners under the event type.
+
+    Lookups are read-only: looking up a key with nothing registered returns an empty
+    tuple without storing anything, so lookups of unknown keys (an unheard-of event
+    type, a mistyped command) never make the registry grow.
+    """
+
+    def __init__(self):
+        self._entries: Dict[K, List[Entry]] = {}
+        self._snapshot: Optional[Mapping[K, Tuple[Entry, ...]]] = None
+
+    def add(self, key: K, item: V, source: str):
+        self._entries.setdefault(key, []).append((item, source))
+        self._snapshot = None
+
+    def get(self, key: K) -> Tuple[Entry, ...]:
+        """Return the items registered under a key, with their sources."""
+        entries = self._entries.get(key)
+        return tuple(entries) if entries else ()
+
+    __getitem__ = get
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self._entries)
+
+    def items(self) -> Iterator[Tuple[K, Tuple[Entry, ...]]]:
+        return iter(self.snapshot().items())
+
+    def snapshot(self) -> Mapping[K, Tuple[Entry, ...]]:
+        """Return a read-only copy of the registry, for compiling dispatch tables.
+
+        The snapshot is cached until something is added to the registry.
+        """
+        if self._snapshot is None:
+            self._snapshot = MappingProxyType(
+                {key: tuple(entries) for key, entries in self._entries.items()}
+            )
+        return self._snapshot
+
+    def audit(self) -> RegistryAudit:
+        size = sys.getsizeof(self._entries) + sum(
+            sys.getsizeof(entries) for entries in self._entries.values()
+        )
+        return RegistryAudit(
+            keys=len(self._entries),
+            entries=sum(len(entries) for entries in self._entries.values()),
+            size=size,
+        )
@@ -0,0 +1,159 @@
+"""Persistent key-value state for bots and plugins, scoped by thread and user.
+
+State lives in memory, and is written back to a SQLite database by a `db.WriteBehind`
+buffer, so it survives restarts without adding I/O to the dispatch loop. Each
+namespace is read from the database the first time it's used, and from memory after
+that.
+
+Examples:
+
+    >>> class Counter(Plugin):
+    ...     def on_load(self, bot: Bot):
+    ...         self.state = bot.get_state(self.name)
+    ...
+    ...     @command("inc")
+    ...     def inc(self, event: CommandEvent):
+    ...         state = self.state.scoped(thread=event.thread.id)
+    ...         state["count"] = state.get("count", 0) + 1
+
+Values must be JSON serializable. Mutating a value in place isn't saved: set it
+again instead.
+"""
+
+from typing import Any, Dict, Iterator, Optional, Tuple
+import json
+import threading
+
+from .db import WriteBehind, connect
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    namespace TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (namespace, scope, key)
+);
+"""
+
+_UPSERT = "INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)"
+_DELETE = "DELETE FROM state WHERE namespace = ? AND scope = ? AND key = ?"
+
+
+def scope_of(thread: Optional[str] = None, user: Optional[str] = None) -> str:
+    """Return the scope of the state of a thread, a user, or a user in a thread."""
+    parts = []
+    if thread is not None:
+        parts.append(f"thread:{thread}")
+    if user is not None:
+        parts.append(f"user:{user}")
+    return "/".join(parts)
+
+
+class StateStore:
+    """A SQLite database of namespaced key-value state, cached in memory."""
+
+    def __init__(self, path: str, flush_interval: float = 1.0, max_batch: int = 500):
+        conn = connect(path)
+        conn.executescript(_SCHEMA)
+        self.writer = WriteBehind(
+            conn, name="state", flush_interval=flush_interval, max_batch=max_batch
+        )
+        # namespace -> scope -> key -> value
+        self._cache: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._load_lock = threading.Lock()
+
+    def namespace(self, namespace: str) -> "State":
+        """Return the global state of a namespace. See `State.scoped` for the state
+        of threads and users."""
+        return State(self, namespace, "")
+
+    def _scopes(self, namespace: str) -> Dict[str, Dict[str, Any]]:
+        scopes = self._cache.get(namespace)
+        if scopes is not None:
+            return scopes
+        with self._load_lock:
+            scopes = self._cache.get(namespace)
+            if scopes is None:
+                # Writes only happen to cached namespaces, so none are pending here.
+                with self.writer.lock:
+                    rows = self.writer.conn.execute(
+                        "SELECT scope, key, value FROM state WHERE namespace = ?",
+                        (namespace,),
+                    ).fetchall()
+                scopes = {}
+                for scope, key, value in rows:
+                    scopes.setdefault(scope, {})[key] = json.loads(value)
+                self._cache[namespace] = scopes
+        return scopes
+
+    def _values(self, namespace: str, scope: str) -> Dict[str, Any]:
+        return self._scopes(namespace).get(scope, {})
+
+    def _set(self, namespace: str, scope: str, key: str, value: Any):
+        encoded = json.dumps(value)
+        self._scopes(namespace).setdefault(scope, {})[key] = value
+        self.writer.write(_UPSERT, (namespace, scope, key, encoded))
+
+    def _delete(self, namespace: str, scope: str, key: str):
+        scopes = self._scopes(namespace)
+        values = scopes.get(scope)
+        if values is None or key not in values:
+            return
+        del values[key]
+        if not values:
+            del scopes[scope]
+        self.writer.write(_DELETE, (namespace, scope, key))
+
+    def flush(self) -> bool:
+        """Write the state changed so far. Returns whether it was written."""
+        return self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+class State:
+    """The state of a namespace, in a scope. Reads and writes never wait on disk,
+    except for the first read of a namespace."""
+
+    def __init__(self, store: StateStore, namespace: str, scope: str):
+        self.store = store
+        self.namespace = namespace
+        self.scope = scope
+
+    def scoped(
+        self, thread: Optional[str] = None, user: Optional[str] = None
+    ) -> "State":
+        """Return the state of a thread, a user, or a user in a thread, in the same
+        namespace."""
+        return State(self.store, self.namespace, scope_of(thread, user))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.store._values(self.namespace, self.scope).get(key, default)
+
+    def set(self, key: str, value: Any):
+        self.store._set(self.namespace, self.scope, key, value)
+
+    def delete(self, key: str):
+        self.store._delete(self.namespace, self.scope, key)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return iter(list(self.store._values(self.namespace, self.scope).items()))
+
+    def __getitem__(self, key: str) -> Any:
+        return self.store._values(self.namespace, self.scope)[key]
+
+    def __setitem__(self, key: str, value: Any):
+        self.set(key, value)
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self.delete(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.store._values(self.namespace, self.scope)
+
+    def __len__(self) -> int:
+        return len(self.store._values(self.namespace, self.scope))
@@ -0,0 +1,203 @@
+"""Keep listening through dropped connections, and recover the messages missed.
+
+`fbchat.Listener` reconnects by itself when the MQTT connection drops, but any error
+it raises ends the listening loop. The `Supervisor` wraps listeners from a backend:
+when a listener fails, it starts a new one on the same session, after an
+exponentially increasing delay. Whenever the stream of events was interrupted, it
+asks the backend for the messages sent in the meantime to the claimed threads, and
+yields those it hadn't seen before.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+import logging
+import threading
+import time
+
+import attr
+import fbchat
+
+from .types_util import Backend
+
+logger = logging.getLogger("fbchatbot")
+
+
+@attr.s(slots=True)
+class SupervisorStats:
+    #: Number of times the listener connected, including the first time.
+    connects: int = attr.ib(0)
+    #: Number of times the listener was restarted after failing.
+    restarts: int = attr.ib(0)
+    #: Number of connections lost, either by failing or as reported by the listener.
+    disconnects: int = attr.ib(0)
+    #: Total seconds spent disconnected.
+    downtime: float = attr.ib(0.0)
+    #: Number of missed messages recovered after reconnecting.
+    backfilled: int = attr.ib(0)
+
+
+def _message_of(event: Any) -> Optional[Any]:
+    if isinstance(event, (fbchat.MessageEvent, fbchat.MessageReplyEvent)):
+        return event.message
+    return None
+
+
+class Supervisor:
+    """Yields the events of a backend's listeners, restarting them when they fail.
+
+    Args:
+        backend: Creates listeners, and optionally fetches missed messages with a
+            ``fetch_messages(session, thread_id, since)`` method.
+        session: Reused by every listener.
+        threads: Returns the ids of the threads to recover missed messages for.
+        initial_delay: Seconds to wait before the first restart.
+        max_delay: Maximum seconds to wait between restarts.
+        max_restarts: Give up after this many consecutive failed restarts, by
+            raising the last error. Never give up if None.
+        sleep: Waits between restarts. Defaults to a wait which `stop` cuts short.
+    """
+
+    #: Number of message ids remembered, to avoid handling backfilled messages twice.
+    SEEN_IDS = 2000
+
+    def __init__(
+        self,
+        backend: Backend,
+        session: Any,
+        threads: Callable[[], Iterable[str]] = lambda: (),
+        initial_delay: float = 1.0,
+        max_delay: float = 300.0,
+        max_restarts: Optional[int] = None,
+        sleep: Optional[Callable[[float], Any]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.backend = backend
+        self.session = session
+        self.threads = threads
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.max_restarts = max_restarts
+        self._wake = threading.Event()
+        self.sleep = sleep if sleep is not None else self._wake.wait
+        self.clock = clock
+        self.stats = SupervisorStats()
+        #: The current listener, while listening.
+        self.listener: Optional[Any] = None
+        self._stopped = False
+        # Monotonic time the connection was lost, while disconnected.
+        self._down_since: Optional[float] = None
+        # When the last message was sent, to know where to backfill from.
+        self._last_seen: Optional[datetime] = None
+        self._seen: Dict[str, None] = OrderedDict()
+        # Whether to backfill on the first connection, see `resume`.
+        self._resuming = False
+
+    def resume(self, since: datetime, message_id: Optional[str] = None):
+        """Backfill the messages sent after a time once connected, e.g. those
+        missed while the previous process was restarting.
+
+        Args:
+            since: When the last message handled was sent.
+            message_id: Id of that message, so it isn't handled again.
+        """
+        self._last_seen = since
+        if message_id is not None:
+            self._seen[message_id] = None
+        self._resuming = True
+
+    def stop(self):
+        """Stop listening. `events` returns once the current listener stops."""
+        self._stopped = True
+        self._wake.set()
+        if self.listener is not None:
+            self.listener.disconnect()
+
+    def events(self) -> Iterator[Any]:
+        """Yield events until the listener is stopped, or restarts fail too often."""
+        delay = self.initial_delay
+        failures = 0
+        while not self._stopped:
+            self.listener = self.backend.listener(self.session)
+            try:
+                for event in self.listener.listen():
+                    if isinstance(event, fbchat.Connect):
+                        delay = self.initial_delay
+                        failures = 0
+                        yield event
+                        yield from self._reconnected()
+                        continue
+                    if isinstance(event, fbchat.Disconnect):
+                        logger.warning(f"Disconnected: {event.reason}")
+                        self._disconnected()
+                    elif not self._remember(event):
+                        continue  # Already backfilled
+                    yield event
+                # The listener only stops by itself when it's disconnected on purpose.
+                self.listener = None
+                return
+            except (fbchat.NotLoggedIn, fbchat.PleaseRefresh):
+                # The session is no longer valid, so new listeners would fail too.
+                raise
+            except Exception:
+                self.listener = None
+                if self._stopped:
+                    return
+                failures += 1
+                if self.max_restarts is not None and failures > self.max_restarts:
+                    raise
+                logger.exception(f"Listener failed, restarting in {delay:g}s")
+                self._disconnected()
+                self.sleep(delay)
+                if self._stopped:
+                    return
+                delay = min(delay * 2, self.max_delay)
+                self.stats.restarts += 1
+
+    def _disconnected(self):
+        if self._down_since is None:
+            self._down_since = self.clock()
+            self.stats.disconnects += 1
+
+    def _reconnected(self) -> Iterator[Any]:
+        self.stats.connects += 1
+        if self._down_since is not None:
+            self.stats.downtime += self.clock() - self._down_since
+            self._down_since = None
+        elif not self._resuming:
+            return
+        self._resuming = False
+        yield from self._backfill()
+
+    def _backfill(self) -> Iterator[Any]:
+        fetch = getattr(self.backend, "fetch_messages", None)
+        if fetch is None or self._last_seen is None:
+            # Without a message to start from, there's no telling what was missed.
+            return
+        since = self._last_seen
+        for thread_id in list(self.threads()):
+            try:
+                missed = list(fetch(self.session, thread_id, since))
+            except Exception:
+                logger.exception(f"Failed to backfill messages of thread {thread_id}")
+                continue
+            for event in missed:
+                if self._remember(event):
+                    self.stats.backfilled += 1
+                    yield event
+
+    def _remember(self, event: Any) -> bool:
+        """Record an event as seen. Returns False if it already was."""
+        message = _message_of(event)
+        if message is None:
+            return True
+        if message.id in self._seen:
+            return False
+        self._seen[message.id] = None
+        while len(self._seen) > self.SEEN_IDS:
+            self._seen.popitem(last=False)  # type: ignore
+        if message.created_at is not None and (
+            self._last_seen is None or message.created_at > self._last_seen
+        ):
+            self._last_seen = message.created_at
+        return True
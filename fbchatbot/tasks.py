@@ -0,0 +1,142 @@
+"""Run CPU-heavy work in worker processes, so it doesn't block event dispatch.
+
+A handler submits a task through its bot, and returns straight away. When the task
+finishes, its result is handled by the bot as a `TaskResultEvent`:
+
+    >>> @bot.command("blur")
+    >>> def blur(e: CommandEvent, b: Bot):
+    >>>     b.submit_task(blur_image, e.command_body, thread=e.thread)
+    >>>
+    >>> @bot.listener
+    >>> def on_blurred(e: TaskResultEvent):
+    >>>     if e.name == "blur_image" and e.error is None:
+    >>>         e.thread.send_local_files([(e.result, "image/png")])
+
+Tasks run in a `concurrent.futures.ProcessPoolExecutor` shared by all of a manager's
+bots, so their functions and arguments must be picklable: use module-level functions.
+"""
+
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+import atexit
+import itertools
+import logging
+import threading
+
+import attr
+import fbchat
+
+logger = logging.getLogger("fbchatbot")
+
+
+@attr.s(slots=True, kw_only=True, frozen=True)
+class TaskResultEvent:
+    """The outcome of a task submitted with `Bot.submit_task`."""
+
+    #: Id returned by `submit_task`.
+    id: str = attr.ib()
+
+    #: Name of the task's function.
+    name: str = attr.ib()
+
+    #: What the function returned, if it didn't raise.
+    result: Any = attr.ib(None)
+
+    #: What the function raised, if it did.
+    error: Optional[BaseException] = attr.ib(None)
+
+    #: The thread given to `submit_task`, usually where the results should go.
+    thread: Optional[fbchat.ThreadABC] = attr.ib(None)
+
+
+class TaskQueue:
+    """Runs tasks on a pool of worker processes, started on the first submission.
+
+    Args:
+        max_workers: Number of worker processes. Defaults to the number of CPUs.
+        executor_factory: Creates the executor, given `max_workers`.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        executor_factory: Callable[[Optional[int]], Executor] = ProcessPoolExecutor,
+    ):
+        self.max_workers = max_workers
+        self.executor_factory = executor_factory
+        #: Number of tasks submitted but not finished.
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def submit(
+        self,
+        deliver: Callable[[TaskResultEvent], None],
+        func: Callable[..., Any],
+        *args: Any,
+        thread: Optional[fbchat.ThreadABC] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Run `func(*args, **kwargs)` on a worker, and pass its `TaskResultEvent` to
+        `deliver` when it's done. Returns the id of the task."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = self.executor_factory(self.max_workers)
+                atexit.register(self.shutdown)
+            executor = self._executor
+            task_id = str(next(self._ids))
+            self.pending += 1
+        name = getattr(func, "__name__", repr(func))
+
+        def done(future: Future):
+            try:
+                deliver_result(future)
+            finally:
+                with self._lock:
+                    self.pending -= 1
+                    self._idle.notify_all()
+
+        def deliver_result(future: Future):
+            error = future.exception()
+            if error is not None:
+                logger.warning(f"Task {name} ({task_id}) failed: {error!r}")
+            event = TaskResultEvent(  # type: ignore
+                id=task_id,
+                name=name,
+                result=None if error is not None else future.result(),
+                error=error,
+                thread=thread,
+            )
+            try:
+                deliver(event)
+            except Exception:
+                logger.exception(f"Failed to handle the result of task {name}")
+
+        try:
+            future = executor.submit(func, *args, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                self.pending -= 1
+                self._idle.notify_all()
+                if isinstance(e, BrokenProcessPool) and self._executor is executor:
+                    # A worker died; start a new pool on the next submission.
+                    self._executor = None
+            raise
+        future.add_done_callback(done)
+        return task_id
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every pending task is finished and its result handled, for at
+        most `timeout` seconds. Returns whether there are no pending tasks left."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self.pending == 0, timeout)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers, by default after waiting for the pending tasks."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,296 @@
+"""An in-memory stand-in for facebook, to test and benchmark bots offline.
+
+`FakeBackend` plugs into `ChatbotManager.start` in place of a facebook login. Events
+queued on it are real `fbchat` events, so they go through the same parsing as live
+ones, and anything the bots send through their threads is recorded instead of being
+posted:
+
+    >>> backend = FakeBackend()
+    >>> backend.message("thread", "alice", ".ping")
+    >>> manager.start(backend=backend)  # Returns once every event is handled
+    >>> [m.text for m in backend.sent]
+    ['PONG']
+
+Threads are plain `fbchat.Group`s and `fbchat.User`s bound to a `FakeSession`, so
+every send method records its message. Other requests to facebook, such as reacting
+or setting nicknames, are recorded in `FakeSession.posts` and answered with an empty
+response.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+import itertools
+import queue
+
+import attr
+import fbchat
+
+#: Timestamp of the first fake event. Later events are a second apart.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+@attr.s(slots=True, frozen=True)
+class SentMessage:
+    """A message sent by a bot through a `FakeSession`."""
+
+    id: str = attr.ib()
+    thread_id: str = attr.ib()
+    text: Optional[str] = attr.ib()
+    reply_to_id: Optional[str] = attr.ib()
+    #: Everything fbchat would have posted to facebook.
+    data: Mapping[str, Any] = attr.ib(repr=False)
+
+
+@attr.s(slots=True, kw_only=True, repr=False, eq=False)
+class FakeSession(fbchat.Session):
+    """A session which records the messages it sends instead of posting them."""
+
+    _user_id: str = attr.ib("bot")
+    _fb_dtsg: str = attr.ib("")
+    _revision: int = attr.ib(1)
+    #: Messages sent through the session, oldest first.
+    sent: List[SentMessage] = attr.ib(factory=list)
+    #: Other requests made through the session, as (url, data), oldest first.
+    posts: List[Tuple[str, Mapping[str, Any]]] = attr.ib(factory=list)
+    _ids: Iterator[int] = attr.ib(factory=lambda: itertools.count(1))
+
+    def _do_send_request(self, data):
+        thread_id = data.get("thread_fbid") or data.get("other_user_fbid")
+        message = SentMessage(
+            id=f"sent.{next(self._ids)}",
+            thread_id=thread_id,
+            text=data.get("body"),
+            reply_to_id=data.get("replied_to_message_id"),
+            data=dict(data),
+        )
+        self.sent.append(message)
+        return message.id, thread_id
+
+    def _post(self, url, data, files=None, as_graphql=False):
+        self.posts.append((url, dict(data)))
+        return [] if as_graphql else {}
+
+    def _payload_post(self, url, data, files=None):
+        self.posts.append((url, dict(data)))
+        return {}
+
+
+@attr.s(slots=True, frozen=True)
+class _Failure:
+    """Queued to make the listener raise an error."""
+
+    error: Exception = attr.ib()
+
+
+class FakeListener:
+    """Yields queued events, like `fbchat.Listener`.
+
+    Args:
+        events: Queue of the events to yield.
+        stop_when_idle: If True, stop listening once the queue is empty. Otherwise,
+            wait for more events until `disconnect` is called.
+    """
+
+    _STOP = object()
+
+    def __init__(self, events: "queue.Queue[Any]", stop_when_idle: bool = True):
+        self.events = events
+        self.stop_when_idle = stop_when_idle
+
+    def listen(self) -> Iterator[fbchat.Event]:
+        yield fbchat.Connect()
+        while True:
+            try:
+                event = self.events.get(block=not self.stop_when_idle)
+            except queue.Empty:
+                return
+            if event is self._STOP:
+                return
+            if isinstance(event, _Failure):
+                raise event.error
+            yield event
+
+    def disconnect(self):
+        self.events.put(self._STOP)
+
+
+class FakeClient:
+    """Answers the client requests bots make, from data registered on a backend."""
+
+    def __init__(self, session: FakeSession, threads: Dict[str, Any]):
+        self.session = session
+        self.threads = threads
+
+    def fetch_thread_info(self, ids: Iterable[str]) -> Iterator[Any]:
+        for id in ids:
+            if id in self.threads:
+                yield self.threads[id]
+
+    def fetch_image_url(self, image_id: str) -> str:
+        return f"https://fake.invalid/images/{image_id}"
+
+
+class FakeBackend:
+    """Fake facebook, for `ChatbotManager.start`.
+
+    Args:
+        bot_id: User id of the bot.
+        stop_when_idle: If True, `start` returns once every queued event has been
+            handled. Otherwise it waits for events until `disconnect` is called.
+    """
+
+    def __init__(self, bot_id: str = "bot", stop_when_idle: bool = True):
+        self.session = FakeSession(user_id=bot_id)
+        self.events: "queue.Queue[Any]" = queue.Queue()
+        self.stop_when_idle = stop_when_idle
+        #: User and thread data returned by `FakeClient.fetch_thread_info`.
+        self.thread_data: Dict[str, Any] = {}
+        #: Every message event created, including missed ones, oldest first.
+        self.history: List[fbchat.MessageEvent] = []
+        self._message_ids = itertools.count(1)
+        self._clock = itertools.count()
+
+    # The interface used by `ChatbotManager.start`
+
+    def connect(self) -> Tuple[FakeSession, str]:
+        return self.session, "Using fake backend"
+
+    def listener(self, session: FakeSession) -> FakeListener:
+        return FakeListener(self.events, self.stop_when_idle)
+
+    def client(self, session: FakeSession) -> FakeClient:
+        return FakeClient(session, self.thread_data)
+
+    def fetch_messages(
+        self, session: FakeSession, thread_id: str, since: datetime
+    ) -> List[fbchat.MessageEvent]:
+        return [
+            e
+            for e in self.history
+            if e.thread.id == thread_id and e.message.created_at > since
+        ]
+
+    # Building and queueing events
+
+    @property
+    def sent(self) -> List[SentMessage]:
+        return self.session.sent
+
+    def sent_to(self, thread_id: str) -> List[SentMessage]:
+        return [m for m in self.sent if m.thread_id == thread_id]
+
+    def disconnect(self):
+        """Stop the listener, once the events queued so far are handled."""
+        self.events.put(FakeListener._STOP)
+
+    def fail(self, error: Exception):
+        """Make the listener raise an error, once the events queued so far are
+        handled."""
+        self.events.put(_Failure(error))
+
+    def thread(self, thread_id: str) -> fbchat.ThreadABC:
+        """Return a thread: a group, unless a user with that id was added."""
+        if isinstance(self.thread_data.get(thread_id), fbchat.UserData):
+            return fbchat.User(session=self.session, id=thread_id)  # type: ignore
+        return fbchat.Group(session=self.session, id=thread_id)  # type: ignore
+
+    def add_user(self, user_id: str, name: str, **kwargs: Any) -> fbchat.UserData:
+        """Register a user, for metadata lookups and one-to-one threads."""
+        data = fbchat.UserData(  # type: ignore
+            session=self.session,
+            id=user_id,
+            photo=None,
+            name=name,
+            is_friend=True,
+            first_name=kwargs.pop("first_name", name.split()[0]),
+            **kwargs,
+        )
+        self.thread_data[user_id] = data
+        return data
+
+    def add_group(
+        self, thread_id: str, participants: Iterable[str], **kwargs: Any
+    ) -> fbchat.GroupData:
+        """Register a group, for metadata lookups."""
+        data = fbchat.GroupData(  # type: ignore
+            session=self.session,
+            id=thread_id,
+            participants={
+                fbchat.User(session=self.session, id=p)  # type: ignore
+                for p in participants
+            },
+            **kwargs,
+        )
+        self.thread_data[thread_id] = data
+        return data
+
+    def message(
+        self,
+        thread_id: str,
+        author_id: str,
+        text: str,
+        mentions: Iterable[fbchat.Mention] = (),
+        reply_to: Optional[fbchat.MessageData] = None,
+        attachments: Iterable[Any] = (),
+        missed: bool = False,
+    ) -> fbchat.MessageEvent:
+        """Queue a message, and return its event.
+
+        If ``missed`` is True, the message isn't queued, as if it was sent while the
+        listener was disconnected. It can still be fetched to backfill missed
+        messages.
+        """
+        thread = self.thread(thread_id)
+        at = EPOCH + timedelta(seconds=next(self._clock))
+        message = fbchat.MessageData(  # type: ignore
+            thread=thread,
+            id=f"mid.{next(self._message_ids)}",
+            author=author_id,
+            created_at=at,
+            text=text,
+            mentions=list(mentions),
+            attachments=list(attachments),
+            reply_to_id=reply_to.id if reply_to is not None else None,
+        )
+        author = fbchat.User(session=self.session, id=author_id)  # type: ignore
+        event: fbchat.MessageEvent
+        if reply_to is not None:
+            event = fbchat.MessageReplyEvent(  # type: ignore
+                author=author, thread=thread, message=message, replied_to=reply_to
+            )
+        else:
+            event = fbchat.MessageEvent(  # type: ignore
+                author=author, thread=thread, message=message, at=at
+            )
+        self.history.append(event)
+        if not missed:
+            self.events.put(event)
+        return event
+
+    def mention(
+        self, thread_id: str, author_id: str, user_id: str, name: str, text: str = ""
+    ) -> fbchat.MessageEvent:
+        """Queue a message starting with a mention of a user, e.g. of the bot."""
+        mention = fbchat.Mention(  # type: ignore
+            thread_id=user_id, offset=0, length=len(name) + 1
+        )
+        return self.message(
+            thread_id, author_id, f"@{name} {text}".rstrip(), mentions=[mention]
+        )
+
+    def react(
+        self, message: fbchat.MessageData, author_id: str, reaction: Optional[str]
+    ) -> fbchat.ReactionEvent:
+        """Queue a reaction to a message."""
+        event = fbchat.ReactionEvent(  # type: ignore
+            author=fbchat.User(session=self.session, id=author_id),  # type: ignore
+            thread=message.thread,
+            message=message,
+            reaction=reaction,
+        )
+        self.events.put(event)
+        return event
+
+    def put(self, event: Any):
+        """Queue any event."""
+        self.events.put(event)
@@ -0,0 +1,171 @@
+"""Inbound rate limiting of commands, using token buckets.
+
+Commands run one at a time, so a single user spamming a command slows the bot down
+for every thread. A `Throttle` decides, before a command runs, whether its author,
+thread and the command itself still have budget left:
+
+    >>> bot.throttle_commands(ThrottlePolicy(per_author=Limit(5, per=60)))
+    >>> bot.throttle_commands(
+    >>>     ThrottlePolicy(per_thread=Limit(1, per=30), notice="Give me {wait:.0f}s!"),
+    >>>     "render",
+    >>> )
+
+Rejected commands are dropped, after sending the policy's notice (if any) once per
+cooldown. Buckets are kept for the `max_keys` most recently active keys only; a
+forgotten bucket is simply full again the next time it's needed.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import threading
+import time
+
+import attr
+
+
+@attr.s(frozen=True, slots=True)
+class Limit:
+    """Allow `count` commands every `per` seconds, in bursts of up to `count`."""
+
+    count: int = attr.ib()
+    per: float = attr.ib(60.0)
+
+    def __attrs_post_init__(self):
+        assert self.count > 0 and self.per > 0
+
+    @property
+    def rate(self) -> float:
+        """Tokens regained per second."""
+        return self.count / self.per
+
+
+@attr.s(frozen=True, slots=True)
+class ThrottlePolicy:
+    """Limits applied to a command, or to every command by default."""
+
+    #: Limit on the commands of each author.
+    per_author: Optional[Limit] = attr.ib(None)
+    #: Limit on the commands sent in each thread.
+    per_thread: Optional[Limit] = attr.ib(None)
+    #: Limit on the commands sent by everyone, everywhere.
+    overall: Optional[Limit] = attr.ib(None)
+    #: Sent when a command is rejected, at most once per cooldown. Can refer to the
+    #: seconds until the command is allowed again as {wait}. If None, rejected
+    #: commands are dropped silently.
+    notice: Optional[str] = attr.ib(None)
+
+    @property
+    def limits_anything(self) -> bool:
+        return any((self.per_author, self.per_thread, self.overall))
+
+
+@attr.s(frozen=True, slots=True)
+class Rejection:
+    """Why a command was rejected."""
+
+    #: Seconds until the command would be allowed.
+    wait: float = attr.ib()
+    #: Notice to send to the thread, or None to stay silent.
+    notice: Optional[str] = attr.ib()
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "notified")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        # Whether a notice was sent since the bucket was last drawn from.
+        self.notified = False
+
+
+class Throttle:
+    """Token buckets for commands, keyed by author, thread and command.
+
+    Args:
+        default: Policy for commands without a policy of their own.
+        max_keys: Maximum number of buckets kept.
+    """
+
+    def __init__(
+        self,
+        default: ThrottlePolicy = ThrottlePolicy(),
+        max_keys: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        assert max_keys > 0
+        self.default = default
+        self.max_keys = max_keys
+        self.clock = clock
+        #: Command name -> policy replacing the default for that command.
+        self.policies: Dict[str, ThrottlePolicy] = {}
+        #: Number of commands rejected.
+        self.rejected = 0
+        # Least recently used first.
+        self._buckets: Dict[Tuple[Any, ...], _Bucket] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """The number of buckets kept."""
+        return len(self._buckets)
+
+    def set_policy(self, policy: ThrottlePolicy, *commands: str):
+        """Set the policy of some commands, or the default policy if none are given."""
+        if not commands:
+            self.default = policy
+        for name in commands:
+            self.policies[name] = policy
+
+    def policy_for(self, command: str) -> ThrottlePolicy:
+        return self.policies.get(command, self.default)
+
+    def check(self, command: str, author_id: str, thread_id: str) -> Optional[Rejection]:
+        """Take a token for a command from each of its buckets, and return None if
+        there were enough, or a `Rejection` otherwise.
+
+        Tokens are only taken if every bucket has one to spare.
+        """
+        policy = self.policy_for(command)
+        if not policy.limits_anything:
+            return None
+        # Commands with their own policy don't share buckets with the default one.
+        scope = command if command in self.policies else None
+        keyed: List[Tuple[Tuple[Any, ...], Limit]] = []
+        if policy.per_author is not None:
+            keyed.append((("author", scope, author_id), policy.per_author))
+        if policy.per_thread is not None:
+            keyed.append((("thread", scope, thread_id), policy.per_thread))
+        if policy.overall is not None:
+            keyed.append((("overall", scope), policy.overall))
+
+        now = self.clock()
+        with self._lock:
+            buckets = [(self._refill(key, limit, now), limit) for key, limit in keyed]
+            empty = [(b, limit) for b, limit in buckets if b.tokens < 1]
+            if not empty:
+                for bucket, _ in buckets:
+                    bucket.tokens -= 1
+                    bucket.notified = False
+                return None
+
+            self.rejected += 1
+            wait = max((1 - b.tokens) / limit.rate for b, limit in empty)
+            notice = None
+            if policy.notice is not None and not all(b.notified for b, _ in empty):
+                notice = policy.notice.format(wait=wait)
+                for bucket, _ in empty:
+                    bucket.notified = True
+            return Rejection(wait=wait, notice=notice)
+
+    def _refill(self, key: Tuple[Any, ...], limit: Limit, now: float) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(limit.count, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)  # type: ignore
+        else:
+            self._buckets.move_to_end(key)  # type: ignore
+            elapsed = now - bucket.updated
+            bucket.tokens = min(limit.count, bucket.tokens + elapsed * limit.rate)
+            bucket.updated = now
+        return bucket
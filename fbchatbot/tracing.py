@@ -0,0 +1,238 @@
+"""Trace where the time goes from a raw fbchat event to the bot's replies.
+
+A raw event turns into derived events (`MessageEvent`, `TextMessageEvent`,
+`CommandEvent`, ...) through nested calls to `Chatbot.handle`. When a `Tracer`
+samples a raw event, every handled event, listener, command and message sent while
+handling it is timed as a span, whose parent is the span it happened in. Spans are
+tracked with a context variable, so code deeper in the call stack doesn't need to be
+passed anything.
+
+Completed traces are written to a file, one JSON object per line:
+
+    {"trace_id": "9f2c...", "name": "MessageEvent", "duration_ms": 1.52, "spans": [
+        {"id": 1, "parent": null, "name": "MessageEvent", "start_ms": 0.0,
+         "duration_ms": 1.52},
+        {"id": 2, "parent": 1, "name": "handle MessageEvent", "bot": "bot", ...},
+        ...
+    ]}
+
+Unsampled events only cost a context variable lookup per span.
+"""
+
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, TextIO
+import functools
+import itertools
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+
+import attr
+
+logger = logging.getLogger("fbchatbot")
+
+
+@attr.s(slots=True)
+class Span:
+    trace: "Trace" = attr.ib(repr=False)
+    id: int = attr.ib()
+    parent_id: Optional[int] = attr.ib()
+    name: str = attr.ib()
+    #: Seconds since the start of the trace.
+    start: float = attr.ib()
+    duration: Optional[float] = attr.ib(None)
+    attributes: Dict[str, Any] = attr.ib(factory=dict)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "start_ms": round(self.start * 1000, 3),
+            "duration_ms": None
+            if self.duration is None
+            else round(self.duration * 1000, 3),
+            **self.attributes,
+        }
+
+
+@attr.s(slots=True)
+class Trace:
+    id: str = attr.ib()
+    started: float = attr.ib()
+    clock: Callable[[], float] = attr.ib(repr=False)
+    spans: List[Span] = attr.ib(factory=list)
+    _ids: Any = attr.ib(factory=lambda: itertools.count(1), repr=False)
+
+    def to_json(self) -> Dict[str, Any]:
+        root = self.spans[0]
+        return {
+            "trace_id": self.id,
+            "name": root.name,
+            "duration_ms": root.to_json()["duration_ms"],
+            "spans": [s.to_json() for s in self.spans],
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("fbchatbot_span", default=None)
+
+_NOT_TRACED = nullcontext()
+
+
+def current_span() -> Optional[Span]:
+    """Return the span the caller runs in, or None if it isn't traced."""
+    return _current.get()
+
+
+class _SpanContext:
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, *exc_info):
+        span = self.span
+        span.duration = span.trace.clock() - span.trace.started - span.start
+        if exc_info[0] is not None:
+            span.attributes["error"] = repr(exc_info[1])
+        _current.reset(self._token)
+
+
+def span(name: str, **attributes: Any):
+    """Return a context manager timing a span, as a child of the current span.
+
+    Does nothing outside of a sampled trace.
+
+    Examples:
+
+        >>> with span("render", size=len(data)):
+        ...     render(data)
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NOT_TRACED
+    trace = parent.trace
+    child = Span(
+        trace,
+        next(trace._ids),
+        parent.id,
+        name,
+        trace.clock() - trace.started,
+        attributes=attributes,
+    )
+    trace.spans.append(child)
+    return _SpanContext(child)
+
+
+class _TraceContext:
+    __slots__ = ("tracer", "span", "_token")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, *exc_info):
+        span = self.span
+        span.duration = span.trace.clock() - span.trace.started
+        if exc_info[0] is not None:
+            span.attributes["error"] = repr(exc_info[1])
+        _current.reset(self._token)
+        self.tracer.write(span.trace)
+
+
+class Tracer:
+    """Samples traces, and writes them to a JSON lines file.
+
+    Args:
+        path: File the traces are appended to. Nothing is traced if None, unless a
+            sink is given.
+        sample_rate: Fraction of traces recorded, between 0 and 1.
+        sink: Called with each completed trace, instead of writing it to `path`.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        sample_rate: float = 0.01,
+        sink: Optional[Callable[[Trace], None]] = None,
+        rng: Callable[[], float] = random.random,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        assert 0 <= sample_rate <= 1, "The sample rate must be between 0 and 1"
+        self.path = path
+        self.sample_rate = sample_rate if path or sink else 0.0
+        self.sink = sink
+        self.rng = rng
+        self.clock = clock
+        #: Number of traces written.
+        self.written = 0
+        self._file: Optional[TextIO] = None
+        self._lock = threading.Lock()
+
+    def trace(self, name: str, **attributes: Any):
+        """Return a context manager starting a trace, if it's sampled.
+
+        Inside an existing trace, starts a span of it instead.
+        """
+        if _current.get() is not None:
+            return span(name, **attributes)
+        if self.sample_rate <= 0 or self.rng() >= self.sample_rate:
+            return _NOT_TRACED
+        trace = Trace(secrets.token_hex(8), self.clock(), self.clock)
+        root = Span(trace, next(trace._ids), None, name, 0.0, attributes=attributes)
+        trace.spans.append(root)
+        return _TraceContext(self, root)
+
+    def write(self, trace: Trace):
+        if self.sink is not None:
+            self.sink(trace)
+            self.written += 1
+            return
+        line = json.dumps(trace.to_json(), default=str)
+        with self._lock:
+            try:
+                if self._file is None:
+                    assert self.path is not None
+                    self._file = open(self.path, "a", buffering=1)
+                self._file.write(line + "\n")
+                self.written += 1
+            except OSError:
+                logger.exception(f"Failed to write a trace to {self.path}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def instrument_sends(session_type: type):
+    """Time the messages sent through sessions of a type as spans.
+
+    Every ``ThreadABC.send_*`` method goes through ``Session._do_send_request``, so
+    wrapping it covers them all. Instrumenting a type twice does nothing.
+    """
+    send = getattr(session_type, "_do_send_request", None)
+    if send is None or getattr(send, "_traced", False):
+        return
+
+    @functools.wraps(send)
+    def traced_send(self, data):
+        thread_id = data.get("thread_fbid") or data.get("other_user_fbid")
+        with span("send", thread_id=thread_id):
+            return send(self, data)
+
+    traced_send._traced = True  # type: ignore
+    session_type._do_send_request = traced_send  # type: ignore
@@ -0,0 +1,286 @@
+"""Keyword and regex triggers, matched against every text message in a single pass.
+
+A trigger is like a command, except that it fires whenever a message contains one of
+its keywords or matches one of its regular expressions. All the triggers available in
+a thread are compiled together into a `TriggerMatcher`, which scans each message once
+no matter how many triggers exist: keywords, and the literal prefixes of regexes, are
+found with an Aho-Corasick automaton, and the regexes without a literal prefix are
+only run on messages which a single alternation of all of them matches.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Protocol, Sequence, Tuple
+from types import MethodType
+import re
+
+import attr
+
+from .core_events import TriggerEvent
+from .event_listener import _needs_bot_arg
+from .types_util import Bot
+from .util import Colors
+
+
+def _strings(items: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(items)
+
+
+class TriggerHandler(Protocol):
+    def __call__(self, event: TriggerEvent, bot: Optional[Bot] = None):
+        ...
+
+
+@attr.s
+class Trigger:
+    #: Keywords which fire the trigger. Matched case-insensitively, on whole words.
+    keywords: Tuple[str, ...] = attr.ib(converter=_strings)
+
+    #: Regular expressions which fire the trigger.
+    patterns: Tuple[str, ...] = attr.ib(converter=_strings)
+
+    #: Help string documenting the trigger
+    docs: str = attr.ib()
+
+    #: Function invoked when the trigger fires.
+    func: TriggerHandler = attr.ib()
+
+    # Whether `func` takes the bot as an argument, computed once.
+    _needs_bot_arg: bool = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self._needs_bot_arg = _needs_bot_arg(self.func)
+
+    def bind(self, obj):
+        self.func = MethodType(self.func, obj)
+        self._needs_bot_arg = _needs_bot_arg(self.func)
+
+    def execute(self, event: Any, bot: Bot):
+        self.func(event, bot) if self._needs_bot_arg else self.func(event)
+
+    def pretty(self):
+        """Pretty print trigger, for info-level logging."""
+        names = ", ".join([*self.keywords, *(f"/{p}/" for p in self.patterns)])
+        return f"{Colors.blue(names)} ⟶  {Colors.green(self.func.__name__)}"
+
+
+def trigger(*keywords: str, patterns: Iterable[str] = ()):
+    """Decorator for defining triggers.
+
+    Args:
+        keywords: Words or phrases which fire the trigger. They are matched
+            case-insensitively, and only on word boundaries, so "hi" doesn't fire on
+            "this".
+        patterns: Regular expressions which fire the trigger when they match anywhere
+            in a message. Since patterns may be merged into a single regex to rule
+            out messages they can't match, they may not use numbered
+            backreferences.
+
+    The decorated function is called at most once per message, with a
+    `core_events.TriggerEvent` (and optionally the `Bot`). Triggers don't fire on
+    messages sent by the bot itself.
+
+    Examples:
+        >>> @bot.trigger("good bot", patterns=[r"thank(s| you)"])
+        >>> def thanks(e: TriggerEvent):
+        >>>     e.thread.send_text("<3")
+    """
+    patterns = tuple(patterns)
+    assert keywords or patterns, "A trigger needs at least one keyword or pattern"
+    for pattern in patterns:
+        re.compile(pattern)
+
+    def decorator(func: TriggerHandler) -> Trigger:
+        docs = (func.__doc__ or "").strip()
+        return Trigger(keywords=keywords, patterns=patterns, docs=docs, func=func)
+
+    return decorator
+
+
+class AhoCorasick:
+    """An Aho-Corasick automaton, finding every occurrence of many strings at once."""
+
+    def __init__(self, words: Sequence[str]):
+        # State 0 is the root. goto[s] maps a character to the next state, and out[s]
+        # lists the indices of the words ending at state s (including via fail links).
+        self.goto: List[Dict[str, int]] = [{}]
+        fail = [0]
+        out: List[List[int]] = [[]]
+        for i, word in enumerate(words):
+            state = 0
+            for ch in word:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = self.goto[state][ch] = len(self.goto)
+                    self.goto.append({})
+                    fail.append(0)
+                    out.append([])
+                state = next_state
+            out[state].append(i)
+
+        # Breadth-first, so that fail links always point to already finished states.
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                f = fail[state]
+                while f and ch not in self.goto[f]:
+                    f = fail[f]
+                fail[next_state] = self.goto[f].get(ch, 0)
+                if fail[next_state] == next_state:
+                    fail[next_state] = 0
+                out[next_state].extend(out[fail[next_state]])
+
+        self.fail = fail
+        self.out: List[Tuple[int, ...]] = [tuple(o) for o in out]
+        self.lengths = [len(w) for w in words]
+
+    def find(self, text: str) -> Iterable[Tuple[int, int]]:
+        """Yield (start offset, word index) for every occurrence of every word."""
+        goto, fail, out, lengths = self.goto, self.fail, self.out, self.lengths
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for i in out[state]:
+                yield end - lengths[i], i
+
+
+def _is_word_char(text: str, i: int) -> bool:
+    return 0 <= i < len(text) and (text[i].isalnum() or text[i] == "_")
+
+
+_QUANTIFIERS = "*+?{"
+_SPECIAL = ".^$*+?{}[]\\|()"
+
+
+def literal_prefix(pattern: str) -> str:
+    """Return a string which every match of a regex must start with.
+
+    This is conservative: patterns with top-level alternation, or which don't start
+    with plain characters, have an empty prefix.
+    """
+    # Any top-level alternation means the prefix isn't required.
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            i += 1
+        elif in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return ""
+        i += 1
+
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                # Character classes like \d, or escapes like \n
+                break
+            ch = pattern[i + 1]
+            i += 1
+        elif ch in _SPECIAL:
+            break
+        # A quantified character is optional or repeated, so it isn't part of the prefix.
+        if i + 1 < len(pattern) and pattern[i + 1] in _QUANTIFIERS:
+            break
+        prefix.append(ch)
+        i += 1
+    return "".join(prefix)
+
+
+#: Regexes with a literal prefix at least this long are only run on messages
+#: containing the prefix.
+MIN_PREFIX_LENGTH = 3
+
+
+class TriggerMatcher:
+    """All the triggers available in a thread, compiled to scan a message once.
+
+    Keywords, along with the literal prefixes of regexes, are found with a single
+    Aho-Corasick scan. A regex with a literal prefix is only run when its prefix
+    occurs in the message. The remaining regexes are merged into one alternation,
+    and only run when it matches: the alternation alone would miss overlapping
+    matches, since each match consumes its span.
+    """
+
+    def __init__(self, triggers: Sequence[Trigger]):
+        self.triggers = tuple(triggers)
+
+        # String found by the automaton -> indices of the triggers with it as a
+        # keyword, and the (trigger index, regex) pairs with it as a prefix.
+        words: Dict[str, Tuple[List[int], List[Tuple[int, Pattern]]]] = {}
+        # (trigger index, regex) pairs for the regexes without a prefix.
+        self._unprefixed: List[Tuple[int, Pattern]] = []
+        for i, t in enumerate(self.triggers):
+            for keyword in t.keywords:
+                words.setdefault(keyword.lower(), ([], []))[0].append(i)
+            for pattern in t.patterns:
+                regex = re.compile(pattern)
+                prefix = literal_prefix(pattern)
+                if len(prefix) >= MIN_PREFIX_LENGTH:
+                    words.setdefault(prefix.lower(), ([], []))[1].append((i, regex))
+                else:
+                    self._unprefixed.append((i, regex))
+
+        self._words = list(words)
+        self._word_triggers = [words[w] for w in self._words]
+        self._automaton = AhoCorasick(self._words) if words else None
+        self._prefilter: Optional[Pattern] = None
+        if self._unprefixed:
+            try:
+                self._prefilter = re.compile(
+                    "|".join(f"(?:{r.pattern})" for _, r in self._unprefixed)
+                )
+            except re.error:
+                # Patterns which can't be merged, e.g. because they use the same
+                # group name, are just all run.
+                pass
+
+    def match(self, text: str) -> List[Tuple[Trigger, str]]:
+        """Return each trigger fired by a text, with the text which fired it.
+
+        Triggers are returned in registration order, at most once each.
+        """
+        matched: Dict[int, str] = {}
+        if self._automaton is not None:
+            lowered = text.lower()
+            # Lowercasing may change the length of some strings; fall back to
+            # reporting the keyword itself rather than slicing the original text.
+            same_length = len(lowered) == len(text)
+            candidates: Dict[int, Pattern] = {}
+            for start, w in self._automaton.find(lowered):
+                keyword_triggers, prefixed_regexes = self._word_triggers[w]
+                candidates.update(prefixed_regexes)
+                if not keyword_triggers:
+                    continue
+                end = start + len(self._words[w])
+                if _is_word_char(lowered, start - 1) or _is_word_char(lowered, end):
+                    continue
+                for i in keyword_triggers:
+                    if i not in matched:
+                        matched[i] = text[start:end] if same_length else self._words[w]
+            for i, regex in candidates.items():
+                if i not in matched:
+                    m = regex.search(text)
+                    if m:
+                        matched[i] = m.group()
+        if self._unprefixed and (
+            self._prefilter is None or self._prefilter.search(text)
+        ):
+            for i, regex in self._unprefixed:
+                if i not in matched:
+                    m = regex.search(text)
+                    if m:
+                        matched[i] = m.group()
+        return [(self.triggers[i], matched[i]) for i in sorted(matched)]
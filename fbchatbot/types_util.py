@@ -1,4 +1,4 @@
-from typing import Protocol, Any
+from typing import Protocol, Any, Optional, Tuple
 
 
 class Bot(Protocol):
@@ -7,8 +7,72 @@ class Bot(Protocol):
     def handle(self, event: Any):
         ...
 
-    def get_all_commands(self, specified_command: str = ""):
+    def derive(self, rule, event: Any):
+        ...
+
+    def get_all_commands(
+        self, specified_command: str = "", thread_id: Optional[str] = None
+    ):
         ...
 
     def get_client(self):
         ...
+
+    def get_history(self, thread_id: str):
+        ...
+
+    def is_admin(self, user_id: str) -> bool:
+        ...
+
+    def start_profile(
+        self, on_done, events: Optional[int] = None, seconds: Optional[float] = None
+    ) -> str:
+        ...
+
+    def get_attachments(self):
+        ...
+
+    def get_metadata(self):
+        ...
+
+    def submit_task(self, func, *args: Any, thread: Any = None, **kwargs: Any) -> str:
+        ...
+
+    def get_state(self, namespace: str):
+        ...
+
+    def subscribe(self, *topics: str):
+        ...
+
+    def publish(self, topic: str, event: Any) -> int:
+        ...
+
+    def invalidate_cache(
+        self,
+        command_name: str,
+        thread_id: Optional[str] = None,
+        body: Optional[str] = None,
+    ):
+        ...
+
+
+class Backend(Protocol):
+    """Where a `ChatbotManager` gets its session, events and client from.
+
+    See `chatbot_manager.FacebookBackend` and `testing.FakeBackend`. Backends can
+    also have a ``fetch_messages(session, thread_id, since)`` method, returning
+    events for the messages sent to a thread after a time, to recover the messages
+    missed while disconnected.
+    """
+
+    def connect(self) -> Tuple[Any, str]:
+        """Return a session, and a status message to print."""
+        ...
+
+    def listener(self, session: Any) -> Any:
+        """Return a listener, like `fbchat.Listener`."""
+        ...
+
+    def client(self, session: Any) -> Any:
+        """Return a client, like `fbchat.Client`."""
+        ...
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+
+import fbchat
+
+from fbchatbot.archive import ArchivePlugin, MessageArchive
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.core_events import ReactionEvent, TextMessageEvent
+
+T0 = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def text_event(session, message_id, thread_id, author_id, text, at):
+    thread = fbchat.Group(session=session, id=thread_id)
+    message = fbchat.MessageData(
+        thread=thread, id=message_id, author=author_id, created_at=at, text=text
+    )
+    return TextMessageEvent(
+        author=fbchat.User(session=session, id=author_id),
+        thread=thread,
+        message=message,
+        at=at,
+        text=text,
+        sent_by_bot=False,
+    )
+
+
+def test_archive_messages(tmp_path):
+    session = fbchat.Session(user_id="bot", fb_dtsg="", revision=1)
+    archive = MessageArchive(str(tmp_path / "archive.db"), flush_interval=60)
+
+    archive.record_message(text_event(session, "m1", "t1", "a", "hi", T0))
+    archive.record_message(text_event(session, "m2", "t1", "b", "yo", T0 + timedelta(1)))
+    archive.record_message(text_event(session, "m3", "t2", "a", "hey", T0 + timedelta(2)))
+    # Duplicates are ignored
+    archive.record_message(text_event(session, "m1", "t1", "a", "hi", T0))
+
+    # Nothing is written until the buffer is flushed.
+    assert archive.writer.pending() == 4
+
+    assert [m.id for m in archive.messages()] == ["m3", "m2", "m1"]
+    assert archive.writer.pending() == 0
+    assert [m.id for m in archive.messages(thread_id="t1")] == ["m2", "m1"]
+    assert [m.id for m in archive.messages(author_id="a")] == ["m3", "m1"]
+    assert [m.id for m in archive.messages(since=T0 + timedelta(1))] == ["m3", "m2"]
+    assert archive.messages(limit=1)[0].text == "hey"
+
+    archive.close()
+
+
+def test_archive_plugin(tmp_path, monkeypatch):
+    monkeypatch.setattr("atexit.register", lambda f: None)
+    session = fbchat.Session(user_id="bot", fb_dtsg="", revision=1)
+    plugin = ArchivePlugin(str(tmp_path / "archive.db"), flush_interval=60)
+    bot = ChatbotManager(config={}).add_bot("bot").load_plugin(plugin)
+
+    message = text_event(session, "m1", "t1", "a", "hi", T0)
+    bot.handle(message)
+    bot.handle(
+        ReactionEvent(
+            author=message.author,
+            thread=message.thread,
+            message=message.message,
+            reaction="😍",
+            at=T0,
+        )
+    )
+
+    archive = plugin.archive
+    assert [m.id for m in archive.messages()] == ["m1"]
+    with archive.writer.lock:
+        reactions = archive.writer.conn.execute("SELECT * FROM reactions").fetchall()
+    assert reactions == [("m1", "t1", "a", "😍", 1577836800000)]
+    archive.close()
@@ -0,0 +1,89 @@
+from datetime import timedelta
+from unittest.mock import Mock
+
+import fbchat
+import pytest
+
+from fbchatbot.args import ArgParser, ArgumentError
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.core_events import CommandEvent
+
+
+def command_event(body, text=None, mentions=()):
+    message = Mock(text=text or f".remind {body}", mentions=list(mentions))
+    return CommandEvent(  # type: ignore
+        author=Mock(id="a"),
+        thread=Mock(id="t"),
+        message=message,
+        at=None,
+        command="remind",
+        command_body=body,
+        sent_by_bot=False,
+    )
+
+
+def test_parse():
+    parser = ArgParser.compile("n:int [when:duration] [--loud] [--times:int]")
+
+    assert parser.parse(command_event("3")) == {
+        "n": 3,
+        "when": None,
+        "loud": False,
+        "times": None,
+    }
+    assert parser.parse(command_event("--loud 3 1h30m --times 2")) == {
+        "n": 3,
+        "when": timedelta(hours=1, minutes=30),
+        "loud": True,
+        "times": 2,
+    }
+    for body in ["", "x", "3 soon", "3 1h 4", "3 --quiet", "3 --times"]:
+        with pytest.raises(ArgumentError):
+            parser.parse(command_event(body))
+
+
+def test_quoted_strings_and_rest():
+    parser = ArgParser.compile("title:str body:rest")
+    args = parser.parse(command_event(r'"a \"quoted\" title"  the  rest '))
+    assert args == {"title": 'a "quoted" title', "body": "the  rest "}
+
+
+def test_mentions():
+    parser = ArgParser.compile("who:mention what:rest")
+    text = ".remind @Jane Doe to call"
+    mention = fbchat.Mention(thread_id="42", offset=8, length=9)
+    args = parser.parse(command_event("@Jane Doe to call", text, [mention]))
+    assert args == {"who": "42", "what": "to call"}
+
+    with pytest.raises(ArgumentError):
+        parser.parse(command_event("Jane to call"))
+
+
+def test_invalid_schemas():
+    for schema in ["a:nope", "a:rest b", "[a] b", "--flag", "a a"]:
+        with pytest.raises(AssertionError):
+            ArgParser.compile(schema)
+
+
+def test_command_args():
+    bot = ChatbotManager(config={}).add_bot("bot")
+    calls = []
+
+    @bot.command("remind", args="when:duration what:rest")
+    def remind(e):
+        """Set a reminder"""
+        calls.append(e.args)
+
+    bot.handle(command_event("5m take a break"))
+    assert calls == [{"when": timedelta(minutes=5), "what": "take a break"}]
+
+    invalid = command_event("later take a break")
+    bot.handle(invalid)
+    assert len(calls) == 1
+    assert "Usage: .remind <when:duration> <what...>" in (
+        invalid.thread.send_text.call_args.args[0]
+    )
+
+    assert bot.get_all_commands("remind") == [
+        ("remind", ".remind <when:duration> <what...>\nSet a reminder")
+    ]
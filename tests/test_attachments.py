@@ -0,0 +1,91 @@
+import hashlib
+import threading
+
+import fbchat
+
+from fbchatbot.attachments import AttachmentStore
+
+
+def image(id, url="https://example.com/image.png"):
+    return fbchat.ImageAttachment(id=id, previews={fbchat.Image(url=url, width=100)})
+
+
+def test_concurrent_fetches_share_a_download(tmp_path, monkeypatch):
+    monkeypatch.setattr("atexit.register", lambda f: None)
+    release = threading.Event()
+    urls = []
+
+    def downloader(url):
+        urls.append(url)
+        release.wait(5)
+        yield b"hello "
+        yield b"world"
+
+    store = AttachmentStore(str(tmp_path), downloader=downloader)
+    futures = store.fetch_all([image("1"), image("1"), image("1")])
+    release.set()
+
+    cached = {f.result(timeout=5) for f in futures}
+    assert len(cached) == 1
+    (attachment,) = cached
+    assert attachment.digest == hashlib.sha256(b"hello world").hexdigest()
+    with attachment.mmap() as data:
+        assert data[:] == b"hello world"
+    with attachment.open() as f:
+        assert f.read(5) == b"hello"
+
+    assert store.fetch(image("1")).result() == attachment
+    assert urls == ["https://example.com/image.png"]
+    assert (store.downloads, store.hits) == (1, 1)
+
+    # The cache survives restarts.
+    restarted = AttachmentStore(str(tmp_path), downloader=downloader)
+    assert restarted.get("1") == attachment
+    assert restarted.total_bytes == 11
+    store.shutdown()
+
+
+def test_identical_content_stored_once(tmp_path, monkeypatch):
+    monkeypatch.setattr("atexit.register", lambda f: None)
+    store = AttachmentStore(str(tmp_path), downloader=lambda url: [b"same"])
+
+    a = store.fetch(image("1")).result()
+    b = store.fetch(image("2")).result()
+    assert a.path == b.path
+    assert store.total_bytes == 4
+    store.shutdown()
+
+
+def test_size_based_eviction(tmp_path, monkeypatch):
+    monkeypatch.setattr("atexit.register", lambda f: None)
+    store = AttachmentStore(
+        str(tmp_path), max_bytes=63, downloader=lambda url: [url.encode()]
+    )
+
+    for i in range(3):
+        store.fetch(image(str(i), url=f"https://example.com/{i}")).result()
+    # Use the oldest, so the second one is evicted instead. Each file is 21 bytes.
+    assert store.get("0") is not None
+    store.fetch(image("3", url="https://example.com/3")).result()
+
+    assert store.get("1") is None
+    assert store.get("0") is not None
+    assert store.total_bytes == 63
+    # The evicted attachment's index entry is deleted with its file.
+    assert sorted(p.name for p in (tmp_path / "index").iterdir()) == ["0", "2", "3"]
+    store.shutdown()
+
+
+def test_stale_index_entries_are_deleted_on_startup(tmp_path, monkeypatch):
+    monkeypatch.setattr("atexit.register", lambda f: None)
+    store = AttachmentStore(str(tmp_path), downloader=lambda url: [url.encode()])
+    evicted = store.fetch(image("1", url="https://example.com/1")).result()
+    store.fetch(image("2", url="https://example.com/2")).result()
+    store.shutdown()
+    # As if another process evicted the file.
+    (tmp_path / evicted.digest[:2] / evicted.digest).unlink()
+
+    restarted = AttachmentStore(str(tmp_path))
+    assert restarted.get("1") is None
+    assert restarted.get("2") is not None
+    assert [p.name for p in (tmp_path / "index").iterdir()] == ["2"]
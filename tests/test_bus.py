@@ -0,0 +1,82 @@
+import threading
+
+import attr
+
+from fbchatbot.bus import EventBus
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.core_events import CommandEvent
+from fbchatbot.testing import FakeBackend
+
+
+def test_subscriptions():
+    bus = EventBus(deliver=lambda s, e: None)
+    bus.subscribe("a", "bot1")
+    bus.subscribe("a", "bot2")
+    bus.subscribe("a", "bot1")
+    bus.subscribe("b", "bot2")
+    assert bus.subscribers("a") == ("bot1", "bot2")
+
+    bus.unsubscribe("a", "bot1")
+    bus.unsubscribe("b", "bot2")
+    assert bus.subscribers("a") == ("bot2",)
+    assert bus.subscribers("b") == ()
+    assert bus.publish("b", "event") == 0
+    assert bus.published == 0
+
+
+def test_delivers_in_order_without_blocking_publishers():
+    delivered = []
+    release = threading.Event()
+
+    def deliver(subscriber, event):
+        release.wait(10)
+        if event == "bad":
+            raise ValueError(event)
+        delivered.append((subscriber, event))
+
+    bus = EventBus(deliver)
+    bus.subscribe("a", "bot1")
+    bus.subscribe("a", "bot2")
+    bus.subscribe("b", "bot2")
+
+    assert bus.publish("a", 1) == 2
+    assert bus.publish("b", "bad") == 1
+    assert bus.publish("b", 2) == 1
+    assert not bus.drain(timeout=0.01)
+    release.set()
+    assert bus.drain(timeout=10)
+
+    assert delivered == [("bot1", 1), ("bot2", 1), ("bot2", 2)]
+    assert (bus.published, bus.delivered) == (3, 3)
+
+
+@attr.s(frozen=True, slots=True)
+class Alert:
+    text: str = attr.ib()
+
+
+def test_bots_share_events():
+    manager = ChatbotManager(config={})
+    alerter = manager.add_bot("alerter")
+    manager.assign_thread("ops", alerter)
+    pager = manager.add_bot("pager")
+    manager.assign_thread("oncall", pager)
+    pager.subscribe("alerts")
+    backend = FakeBackend()
+
+    @alerter.command("alert")
+    def alert(e: CommandEvent, b):
+        delivered_to = b.publish("alerts", Alert(e.command_body))
+        e.thread.send_text(f"Alerted {delivered_to} bot(s)")
+
+    @pager.listener
+    def page(e: Alert, b):
+        backend.thread("oncall").send_text(f"Page: {e.text}")
+
+    backend.message("ops", "alice", ".alert disk full")
+    manager.start(backend=backend)
+
+    assert [(m.thread_id, m.text) for m in backend.sent] == [
+        ("ops", "Alerted 1 bot(s)"),
+        ("oncall", "Page: disk full"),
+    ]
@@ -1,7 +1,14 @@
+from datetime import datetime, timezone
+import random
+
+import attr
+import fbchat
 import pytest
 
 from fbchatbot.chatbot_manager import ChatbotManager
 from fbchatbot.chatbot import Chatbot
+from fbchatbot.core_events import CommandEvent, TextMessageEvent
+from fbchatbot.event_listener import listener
 
 
 def test_claim_threads():
@@ -18,3 +25,85 @@ def test_claim_threads():
 
     with pytest.raises(AssertionError):
         bot2.claim_threads("123")
+
+
+def _command_names(bot, thread_id=None):
+    return {name for name, _ in bot.get_all_commands(thread_id=thread_id)}
+
+
+def test_exclude_commands():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+    bot.exclude_commands(["ping"])
+
+    assert _command_names(bot) == {"help", "profile"}
+    assert _command_names(bot, "123") == {"help", "profile"}
+
+
+def test_thread_policies():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+
+    @bot.command("rockets")
+    def fire_rockets(e):
+        """Fire the rockets"""
+
+    bot.exclude_commands(["rockets"], "123", "456")
+    bot.allow_commands(["help"], "789")
+
+    assert _command_names(bot) == {"help", "ping", "profile", "rockets"}
+    assert _command_names(bot, "123") == {"help", "ping", "profile"}
+    assert _command_names(bot, "789") == {"help"}
+
+    # Threads with the same policy share a single compiled table.
+    assert bot.dispatch_table("123") is bot.dispatch_table("456")
+
+    bot.reset_policy("123")
+    assert _command_names(bot, "123") == {"help", "ping", "profile", "rockets"}
+
+
+def test_plugin_policies():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+
+    @listener
+    def on_text(e: TextMessageEvent):
+        pass
+
+    bot.add_listener(on_text, "plugin")
+    bot.exclude_plugins(["plugin"], "123")
+
+    assert bot.dispatch_table().listeners[TextMessageEvent].all[-1] is on_text
+    assert on_text not in bot.dispatch_table("123").listeners[TextMessageEvent].all
+    # Core listeners can't be disabled.
+    assert bot.dispatch_table("123").listeners[TextMessageEvent].all
+
+    bot.allow_plugins([])
+    assert on_text not in bot.dispatch_table().listeners[TextMessageEvent].all
+
+
+def test_unknown_commands_dont_grow_registries():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+    session = fbchat.Session(user_id="bot", fb_dtsg="", revision=1)
+    thread = fbchat.Group(session=session, id="123")
+    at = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    template = CommandEvent(
+        author=fbchat.User(session=session, id="456"),
+        thread=thread,
+        message=fbchat.MessageData(thread=thread, id="m", author="456", created_at=at),
+        at=at,
+        command="",
+        command_body="",
+        sent_by_bot=False,
+    )
+
+    bot.handle(template)
+    before = bot.memory_audit()
+    rng = random.Random(0)
+    # See benchmarks/soak_registries.py for a longer run.
+    for _ in range(1000):
+        bot.handle(attr.evolve(template, command=f"{rng.getrandbits(40):x}"))
+
+    assert bot.memory_audit() == before
+    assert _command_names(bot) == {"help", "ping", "profile"}
@@ -85,6 +85,9 @@ def test_start(monkeypatch):
         handle1.assert_has_calls([call(e1), call(e2)])
         handle2.assert_has_calls([call(e1), call(e3)])
 
+    # The session is saved on shutdown, so the next process can reuse it.
+    save_session.assert_called_once_with(session)
+
 
 def test_start_specific_bot(monkeypatch):
     manager = ChatbotManager(config={})
@@ -196,3 +199,47 @@ def test_start_too_many_unassigned(monkeypatch):
         with pytest.raises(AssertionError):
             # This should raise an AssertionError because two bots are unassigned.
             manager.start()
+
+
+def test_start_shares_derived_events(monkeypatch):
+    manager = ChatbotManager(config={})
+    bot1 = manager.add_bot("bot1")
+    manager.assign_thread("123", bot1)
+    bot2 = manager.add_bot("bot2")
+
+    class Raw:
+        pass
+
+    class Derived:
+        pass
+
+    rule = Mock(side_effect=lambda e: [Derived()])
+    received = []
+
+    for bot in (bot1, bot2):
+
+        @bot.listener
+        def derive(e: Raw, b):
+            for derived in b.derive(rule, e):
+                b.handle(derived)
+
+        @bot.listener
+        def receive(e: Derived):
+            received.append(e)
+
+    session = Mock()
+    session.user.id = "fake id"
+    monkeypatch.setattr("atexit.register", Mock())
+    monkeypatch.setattr(
+        "fbchatbot.chatbot_manager.get_session", Mock(return_value=(session, ""))
+    )
+    monkeypatch.setattr("fbchatbot.chatbot_manager.save_session", Mock())
+
+    with patch("fbchat.Listener") as mock:
+        mock.return_value.listen = lambda: [Raw()]
+        manager.start()
+
+    # Both bots handled the same derived event, which was only derived once.
+    assert rule.call_count == 1
+    assert len(received) == 2
+    assert received[0] is received[1]
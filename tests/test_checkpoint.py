@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import os
+import signal
+import threading
+import time
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.checkpoint import Checkpoint
+from fbchatbot.testing import FakeBackend
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    assert Checkpoint.load(path) is None
+
+    at = datetime(2020, 1, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+    Checkpoint("mid.1", at, ["t2", "t1"]).save(path)
+    assert Checkpoint.load(path) == Checkpoint("mid.1", at, ("t2", "t1"))
+
+    with open(path, "w") as f:
+        f.write("{not json")
+    assert Checkpoint.load(path) is None
+
+
+def test_restart_resumes_from_checkpoint(tmp_path):
+    config = SimpleNamespace(CHECKPOINT_FILE=str(tmp_path / "checkpoint.json"))
+    backend = FakeBackend(stop_when_idle=False)
+
+    def run_bot():
+        manager = ChatbotManager(config=config)
+        bot = manager.add_bot("bot")
+
+        @bot.command("quit")
+        def quit(e, b):
+            # Stop without waiting, leaving the next message unhandled.
+            manager.stop(timeout=0)
+
+        manager.start(backend=backend)
+        return manager
+
+    backend.message("t1", "alice", ".ping")
+    quit = backend.message("t1", "alice", ".quit")
+    backend.message("t1", "alice", ".ping")
+    first = run_bot()
+
+    assert [m.text for m in backend.sent] == ["PONG"]
+    assert first.last_message == quit.message
+    assert Checkpoint.load(config.CHECKPOINT_FILE) == Checkpoint(
+        quit.message.id, quit.message.created_at, ["t1"]
+    )
+
+    # The next process fetches the message the previous one didn't get to.
+    backend.stop_when_idle = True
+    second = run_bot()
+
+    assert [m.text for m in backend.sent] == ["PONG", "PONG"]
+    assert second.supervisor.stats.backfilled == 1
+
+
+def test_signals_stop_after_draining():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+    backend = FakeBackend(stop_when_idle=False)
+
+    @bot.command("term")
+    def term(e, b):
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    previous = signal.getsignal(signal.SIGTERM)
+    backend.message("t1", "alice", ".term")
+    backend.message("t1", "alice", ".ping")
+
+    manager.start(backend=backend)
+
+    # Events received before the signal are still handled.
+    assert [m.text for m in backend.sent] == ["PONG"]
+    assert signal.getsignal(signal.SIGTERM) is previous
+
+
+def test_stop_during_reconnect_backoff():
+    config = SimpleNamespace(RECONNECT_DELAY=60, DRAIN_TIMEOUT=1)
+    manager = ChatbotManager(config=config)
+    manager.add_bot("bot")
+    backend = FakeBackend(stop_when_idle=False)
+    backend.message("t1", "alice", ".ping")
+    backend.fail(ConnectionError("dropped"))
+
+    stopper = threading.Timer(0.2, manager.stop)
+    stopper.start()
+    started = time.monotonic()
+    manager.start(backend=backend)
+
+    assert time.monotonic() - started < 5
+    assert [m.text for m in backend.sent] == ["PONG"]
+    assert manager.supervisor.stats.restarts == 0
@@ -0,0 +1,92 @@
+from unittest.mock import Mock
+
+import attr
+import fbchat
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.command import CachePolicy
+from fbchatbot.core_events import CommandEvent
+
+
+def command_event(body, thread_id="t", message_id="m"):
+    return CommandEvent(  # type: ignore
+        author=Mock(id="a"),
+        thread=Mock(id=thread_id),
+        message=Mock(id=message_id),
+        at=None,
+        command="stats",
+        command_body=body,
+        sent_by_bot=False,
+    )
+
+
+def test_cached_replies():
+    bot = ChatbotManager(config={}).add_bot("bot")
+    calls = []
+
+    @bot.command("stats", cache=CachePolicy(ttl=60))
+    def stats(e):
+        calls.append(e.command_body)
+        e.thread.send_text(f"stats for {e.command_body}", reply_to_id=e.message.id)
+
+    bot.handle(command_event("alice"))
+    event = command_event("  alice ", message_id="m2")
+    bot.handle(event)
+
+    assert calls == ["alice"]
+    event.thread.send_text.assert_called_once_with("stats for alice", reply_to_id="m2")
+    assert bot.cache_stats()["stats"].hits == 1
+
+    # Replies are cached per thread by default.
+    bot.handle(command_event("alice", thread_id="t2"))
+    assert calls == ["alice", "alice"]
+
+    assert bot.invalidate_cache("stats", thread_id="t") == 1
+    bot.handle(command_event("alice"))
+    assert calls == ["alice", "alice", "alice"]
+
+
+def test_global_cache():
+    bot = ChatbotManager(config={}).add_bot("bot")
+    calls = []
+
+    @bot.command("stats", cache=CachePolicy(ttl=60, per_thread=False))
+    def stats(e):
+        calls.append(e)
+        e.thread.send_text("hi")
+
+    bot.handle(command_event(""))
+    other = command_event("", thread_id="t2")
+    bot.handle(other)
+
+    assert len(calls) == 1
+    other.thread.send_text.assert_called_once_with("hi")
+    assert bot.invalidate_cache("stats", body="") == 1
+
+
+def test_handlers_which_dont_reply_are_not_cached():
+    bot = ChatbotManager(config={}).add_bot("bot")
+    calls = []
+
+    @bot.command("stats", cache=CachePolicy(ttl=60))
+    def stats(e):
+        calls.append(e.command_body)
+
+    bot.handle(command_event("alice"))
+    bot.handle(command_event("alice"))
+    assert calls == ["alice", "alice"]
+    assert bot.cache_stats()["stats"].size == 0
+
+
+def test_cached_handlers_see_the_thread():
+    bot = ChatbotManager(config={}).add_bot("bot")
+    session = fbchat.Session(user_id="bot", fb_dtsg="", revision=1)
+    thread = fbchat.Group(session=session, id="t")
+    seen = []
+
+    @bot.command("stats", cache=CachePolicy(ttl=60))
+    def stats(e):
+        seen.append((isinstance(e.thread, fbchat.Group), e.thread == thread))
+
+    bot.handle(attr.evolve(command_event("alice"), thread=thread))
+    assert seen == [(True, True)]
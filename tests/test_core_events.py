@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+
+import fbchat
+
+from fbchatbot.core_events import (
+    CommandEvent,
+    MentionEvent,
+    OtherMessageEvent,
+    TextMessageEvent,
+    derive_dot_command,
+    derive_mention_command,
+    derive_mentions,
+    derive_message,
+)
+
+SESSION = fbchat.Session(user_id="bot", fb_dtsg="", revision=1)
+T0 = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def raw_message(text, mentions=(), author_id="a"):
+    thread = fbchat.Group(session=SESSION, id="t")
+    message = fbchat.MessageData(
+        thread=thread,
+        id="m",
+        author=author_id,
+        created_at=T0,
+        text=text,
+        mentions=list(mentions),
+    )
+    return fbchat.MessageEvent(
+        author=fbchat.User(session=SESSION, id=author_id),
+        thread=thread,
+        message=message,
+        at=T0,
+    )
+
+
+def test_derive_other_message():
+    (other,) = derive_message(raw_message(None))
+    assert isinstance(other, OtherMessageEvent)
+
+
+def test_derive_dot_command():
+    (text,) = derive_message(raw_message(".echo  some text "))
+    assert isinstance(text, TextMessageEvent)
+    assert not text.sent_by_bot
+
+    (command,) = derive_dot_command(text)
+    assert isinstance(command, CommandEvent)
+    assert (command.command, command.command_body) == ("echo", "some text")
+
+
+def test_derive_mention_command():
+    mention = fbchat.Mention(thread_id="bot", offset=0, length=4)
+    (text,) = derive_message(raw_message("@Bot ping", mentions=[mention]))
+
+    (mention_event,) = derive_mentions(text)
+    assert isinstance(mention_event, MentionEvent)
+    (command,) = derive_mention_command(mention_event)
+    assert command.command == "ping"
+
+
+def test_bot_mentions_dont_trigger_commands():
+    mention = fbchat.Mention(thread_id="bot", offset=0, length=4)
+    (text,) = derive_message(raw_message("@Bot ping", [mention], author_id="bot"))
+
+    assert text.sent_by_bot
+    (mention_event,) = derive_mentions(text)
+    assert derive_mention_command(mention_event) == []
@@ -0,0 +1,69 @@
+import sqlite3
+
+from fbchatbot.db import WriteBehind, connect
+
+
+class FlakyConnection:
+    """Wraps a connection, failing the next `failures` transactions."""
+
+    def __init__(self, conn, failures):
+        self.conn = conn
+        self.failures = failures
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.conn.__exit__(*exc_info)
+
+    def executemany(self, sql, params):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.conn.executemany(sql, params)
+
+    def execute(self, sql, params=()):
+        return self.conn.execute(sql, params)
+
+    def close(self):
+        self.conn.close()
+
+
+def make_writer(tmp_path, failures, **kwargs):
+    conn = connect(str(tmp_path / "test.db"))
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    flaky = FlakyConnection(conn, failures)
+    # Flushed by hand, never by the background thread.
+    return WriteBehind(flaky, flush_interval=3600, **kwargs), flaky
+
+
+def rows(flaky):
+    return [x for (x,) in flaky.execute("SELECT x FROM t ORDER BY rowid")]
+
+
+def test_failed_batches_are_retried_in_order(tmp_path):
+    writer, flaky = make_writer(tmp_path, failures=2, max_retries=3)
+    writer.write("INSERT INTO t VALUES (?)", (1,))
+    assert not writer.flush()
+    writer.write("INSERT INTO t VALUES (?)", (2,))
+    assert not writer.flush()
+    assert writer.pending() == 2
+
+    assert writer.flush()
+    assert rows(flaky) == [1, 2]
+    assert (writer.written, writer.dropped) == (2, 0)
+    writer.close()
+
+
+def test_batches_are_dropped_after_too_many_retries(tmp_path):
+    writer, flaky = make_writer(tmp_path, failures=3, max_retries=2)
+    writer.write("INSERT INTO t VALUES (?)", (1,))
+    for _ in range(3):
+        assert not writer.flush()
+    assert writer.pending() == 0
+    assert writer.dropped == 1
+
+    writer.write("INSERT INTO t VALUES (?)", (2,))
+    assert writer.flush()
+    assert rows(flaky) == [2]
+    writer.close()
@@ -0,0 +1,148 @@
+from types import SimpleNamespace
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.core_events import MentionEvent, ReactionEvent, TextMessageEvent
+from fbchatbot.testing import FakeBackend
+
+
+def test_commands():
+    manager = ChatbotManager(config={})
+    manager.add_bot("bot")
+    backend = FakeBackend()
+    backend.message("t1", "alice", ".ping")
+    backend.mention("t2", "alice", "bot", "Bot", "ping")
+    backend.message("t1", "alice", "ping")
+
+    manager.start(backend=backend)
+
+    assert [(m.thread_id, m.text) for m in backend.sent] == [
+        ("t1", "PONG"),
+        ("t2", "PONG"),
+    ]
+
+
+def test_other_requests_are_recorded():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+    backend = FakeBackend()
+
+    @bot.listener
+    def react(e: TextMessageEvent):
+        e.message.react("👍")
+        e.thread.set_nickname("alice", "Al")
+
+    backend.message("t1", "alice", "hello")
+    manager.start(backend=backend)
+
+    assert backend.sent == []
+    assert [url for url, _ in backend.session.posts] == [
+        "/webgraphql/mutation",
+        "/messaging/save_thread_nickname/?source=thread_settings&dpr=1",
+    ]
+
+
+def test_events_are_parsed():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+    backend = FakeBackend()
+    seen = []
+
+    @bot.listener
+    def on_text(e: TextMessageEvent):
+        seen.append(("text", e.text, e.replied_to and e.replied_to.id))
+
+    @bot.listener
+    def on_mention(e: MentionEvent):
+        seen.append(("mention", e.mention.thread_id, None))
+
+    @bot.listener
+    def on_reaction(e: ReactionEvent):
+        seen.append(("reaction", e.reaction, e.message.id))
+
+    first = backend.message("t1", "alice", "hello")
+    backend.message("t1", "bob", "hi alice", reply_to=first.message)
+    backend.mention("t1", "bob", "alice", "Alice", "hey")
+    backend.mention("t1", "bob", "bot", "Bot", "hey")
+    backend.react(first.message, "bob", "😍")
+
+    manager.start(backend=backend)
+
+    assert seen == [
+        ("text", "hello", None),
+        ("text", "hi alice", first.message.id),
+        ("text", "@Alice hey", None),
+        # Only mentions of the bot are MentionEvents, derived by core listeners
+        # which run before the bot's own.
+        ("mention", "bot", None),
+        ("text", "@Bot hey", None),
+        ("reaction", "😍", first.message.id),
+    ]
+
+
+def test_metadata():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+    backend = FakeBackend()
+    backend.add_user("alice", "Alice Smith")
+
+    @bot.command("greet")
+    def greet(e, b):
+        info = b.get_metadata().get(e.author.id)
+        e.thread.send_text(f"Hi {info.first_name}!")
+
+    backend.message("t1", "alice", ".greet")
+    manager.start(backend=backend)
+
+    assert backend.sent_to("t1")[0].text == "Hi Alice!"
+
+
+def test_throughput():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+    manager.assign_thread("t0", bot)
+    backend = FakeBackend()
+    for i in range(2000):
+        backend.message(f"t{i % 2}", "alice", ".ping" if i % 4 == 0 else "hello")
+
+    manager.start(backend=backend)
+
+    # Messages in t1 go to no bot, since the only bot is assigned to t0.
+    assert len(backend.sent) == 500
+    assert {m.thread_id for m in backend.sent} == {"t0"}
+
+
+def test_profile_command(tmp_path):
+    config = SimpleNamespace(ADMIN_IDS={"admin"}, PROFILE_DIR=str(tmp_path))
+    manager = ChatbotManager(config=config)
+    manager.add_bot("bot")
+    backend = FakeBackend()
+    backend.message("t1", "alice", ".profile")
+    backend.message("t1", "admin", ".profile 0")
+    backend.message("t1", "admin", ".profile --seconds -1")
+    backend.message("t1", "admin", ".profile 3")
+    for _ in range(3):
+        backend.message("t1", "alice", ".ping")
+    backend.message("t1", "alice", "not profiled")
+
+    manager.start(backend=backend)
+
+    texts = [m.text for m in backend.sent]
+    usage = "Usage: .profile [<events:int>] [--seconds <float>]"
+    assert texts[:4] == [
+        "Only admins can profile the bot.",
+        f"Profile at least 1 event, for more than 0s. {usage}",
+        f"Profile at least 1 event, for more than 0s. {usage}",
+        "Profiling the next 3 events...",
+    ]
+    assert texts[4:7] == ["PONG"] * 3
+    assert texts[7].startswith("Profile written to")
+    assert "_handle (chatbot.py" in texts[7]
+    (profile,) = tmp_path.iterdir()
+    assert profile.name.startswith("profile-bot-")
+
+
+def test_admin_ids_may_be_a_single_id():
+    config = SimpleNamespace(ADMIN_IDS="1234")
+    bot = ChatbotManager(config=config).add_bot("bot")
+    assert bot.is_admin("1234")
+    assert not bot.is_admin("23")
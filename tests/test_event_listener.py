@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import attr
+import pytest
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.event_listener import listener, EventListener
+
+
+@attr.s(kw_only=True)
+class FakeEvent:
+    thread = attr.ib()
+    author = attr.ib()
+    sent_by_bot = attr.ib(False)
+    text = attr.ib("")
+
+
+def make_event(thread_id="1", author_id="a", sent_by_bot=False, text=""):
+    return FakeEvent(
+        thread=SimpleNamespace(id=thread_id),
+        author=SimpleNamespace(id=author_id),
+        sent_by_bot=sent_by_bot,
+        text=text,
+    )
+
+
+def test_listener_decorator_forms():
+    @listener
+    def annotated(e: FakeEvent):
+        pass
+
+    @listener(FakeEvent)
+    def explicit(e):
+        pass
+
+    @listener(threads=["1"])
+    def filtered(e: FakeEvent):
+        pass
+
+    for l in (annotated, explicit, filtered):
+        assert isinstance(l, EventListener)
+        assert l.event is FakeEvent
+    assert filtered.filters.threads == frozenset(["1"])
+
+    with pytest.raises(AssertionError):
+
+        @listener(sent_by_bot=False)
+        def no_type(e):
+            pass
+
+
+def test_filtered_dispatch():
+    bot = ChatbotManager(config={}).add_bot("bot")
+    calls = []
+
+    @bot.listener
+    def everything(e: FakeEvent):
+        calls.append("everything")
+
+    @bot.listener(threads=[1])
+    def thread_one(e: FakeEvent):
+        calls.append("thread_one")
+
+    @bot.listener(sent_by_bot=False)
+    def not_bot(e: FakeEvent):
+        calls.append("not_bot")
+
+    @bot.listener(authors=["b"], text_prefix="!")
+    def b_bang(e: FakeEvent):
+        calls.append("b_bang")
+
+    def handled(event):
+        calls.clear()
+        bot.handle(event)
+        return calls[:]
+
+    assert handled(make_event()) == ["everything", "thread_one", "not_bot"]
+    assert handled(make_event(thread_id="2")) == ["everything", "not_bot"]
+    assert handled(make_event(sent_by_bot=True)) == ["everything", "thread_one"]
+    assert handled(make_event(thread_id="2", author_id="b", text="!hi")) == [
+        "everything",
+        "not_bot",
+        "b_bang",
+    ]
+    assert handled(make_event(thread_id="2", author_id="b", text="hi")) == [
+        "everything",
+        "not_bot",
+    ]
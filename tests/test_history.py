@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+
+import fbchat
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.core_events import TextMessageEvent
+from fbchatbot.history import MessageHistory
+
+SESSION = fbchat.Session(user_id="bot", fb_dtsg="", revision=1)
+T0 = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def text_event(message_id, thread_id="t1", author_id="a", text="hi", reply_to_id=None):
+    thread = fbchat.Group(session=SESSION, id=thread_id)
+    message = fbchat.MessageData(
+        thread=thread,
+        id=message_id,
+        author=author_id,
+        created_at=T0,
+        text=text,
+        reply_to_id=reply_to_id,
+    )
+    return TextMessageEvent(
+        author=fbchat.User(session=SESSION, id=author_id),
+        thread=thread,
+        message=message,
+        at=T0,
+        text=text,
+        sent_by_bot=False,
+    )
+
+
+def test_thread_history():
+    history = MessageHistory(per_thread=3)
+    for i in range(5):
+        history.record(text_event(f"m{i}", reply_to_id=f"m{i - 1}"))
+
+    thread = history.thread("t1")
+    assert [e.id for e in thread] == ["m2", "m3", "m4"]
+    assert [e.id for e in thread.recent(2)] == ["m3", "m4"]
+    assert thread.get("m1") is None
+    assert thread.replied_to(thread.get("m4")).id == "m3"
+    assert len(history) == 3
+    assert history.thread("t2") is None
+
+
+def test_idle_threads_evicted_first():
+    history = MessageHistory(per_thread=2, max_messages=4)
+    history.record(text_event("a1", thread_id="a"))
+    history.record(text_event("b1", thread_id="b"))
+    history.record(text_event("a2", thread_id="a"))
+    history.record(text_event("c1", thread_id="c"))
+    history.record(text_event("c2", thread_id="c"))
+
+    # b was idle the longest, so it's evicted as a whole.
+    assert history.thread("b") is None
+    assert [e.id for e in history.thread("a")] == ["a1", "a2"]
+    assert len(history) == 4
+
+    history.record(text_event("c3", thread_id="c"))
+    assert len(history) == 4
+
+
+def test_bot_records_history():
+    bot = ChatbotManager(config={}).add_bot("bot")
+
+    @bot.listener
+    def check(e: TextMessageEvent):
+        # The message is already in the history when listeners are called
+        assert bot.get_history("t1").get(e.message.id) is not None
+
+    bot.handle(text_event("m1"))
+    assert [e.text for e in bot.get_history("t1")] == ["hi"]
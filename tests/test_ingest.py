@@ -0,0 +1,125 @@
+import threading
+
+import fbchat
+import pytest
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.ingest import ESSENTIAL, NORMAL, PASSIVE, IngestQueue, priority
+from fbchatbot.testing import FakeBackend
+
+
+@pytest.fixture
+def backend():
+    return FakeBackend()
+
+
+def test_priority(backend):
+    message = backend.message("t", "alice", "hello")
+    assert priority(message, "bot") == NORMAL
+    assert priority(backend.message("t", "alice", ".ping"), "bot") == ESSENTIAL
+    assert priority(backend.mention("t", "alice", "bot", "Bot"), "bot") == ESSENTIAL
+    assert priority(backend.mention("t", "alice", "bob", "Bob"), "bot") == NORMAL
+    assert priority(backend.react(message.message, "bob", "👍"), "bot") == PASSIVE
+    assert priority(fbchat.Connect(), "bot") == NORMAL
+
+
+def test_sheds_passive_events_when_half_full(backend):
+    queue = IngestQueue(max_size=4)
+    message = backend.message("t", "alice", "hello")
+    reactions = [backend.react(message.message, "bob", "👍") for _ in range(3)]
+    queue.put(message)
+    for reaction in reactions:
+        queue.put(reaction)
+    queue.close()
+
+    assert list(queue) == [message, reactions[0]]
+    stats = queue.stats()
+    assert (stats.received, stats.dispatched, stats.shed) == (4, 2, 2)
+    assert stats.max_depth == 2
+
+
+def test_full_queue_evicts_passive_events(backend):
+    queue = IngestQueue(max_size=2, shed_at=1)
+    message = backend.message("t", "alice", "hello")
+    reaction = backend.react(message.message, "bob", "👍")
+    command = backend.message("t", "alice", ".ping")
+    queue.put(reaction)
+    queue.put(message)
+    queue.put(command)
+    queue.close()
+
+    assert list(queue) == [message, command]
+    assert queue.stats().shed == 1
+
+
+def test_full_queue_waits_for_dispatch(backend):
+    queue = IngestQueue(max_size=1)
+    messages = [backend.message("t", "alice", f".ping {i}") for i in range(5)]
+    reader = threading.Thread(target=queue.run, args=(iter(messages),))
+    reader.start()
+
+    assert list(queue) == messages
+    reader.join()
+    assert queue.stats().shed == 0
+    assert queue.stats().max_depth == 1
+
+
+def test_drops_stale_events_except_essential_ones(backend):
+    now = [0.0]
+    queue = IngestQueue(max_age=10, clock=lambda: now[0])
+    old = backend.message("t", "alice", "old news")
+    command = backend.message("t", "alice", ".ping")
+    queue.put(old)
+    queue.put(command)
+    now[0] = 11
+    fresh = backend.message("t", "alice", "fresh")
+    queue.put(fresh)
+    queue.close()
+
+    assert list(queue) == [command, fresh]
+    stats = queue.stats()
+    assert stats.stale == 1
+    assert stats.lag == 0
+
+
+def test_listener_errors_are_raised(backend):
+    queue = IngestQueue()
+
+    def events():
+        yield backend.message("t", "alice", "hello")
+        raise fbchat.NotLoggedIn("Logged out")
+
+    queue.run(events())
+    it = iter(queue)
+    next(it)
+    with pytest.raises(fbchat.NotLoggedIn):
+        next(it)
+
+
+def test_stops_at_deadline_without_events(backend):
+    now = [0.0]
+    queue = IngestQueue(clock=lambda: now[0])
+    message = backend.message("t", "alice", "hello")
+    queue.put(message)
+    it = iter(queue)
+    assert next(it) is message
+
+    # Nothing more is coming, but the queue isn't closed.
+    threading.Timer(0.05, lambda: queue.stop_at(0.0)).start()
+    assert list(it) == []
+
+
+def test_manager_dispatches_through_queue(backend):
+    manager = ChatbotManager(config={})
+    manager.add_bot("bot")
+    first = backend.message("t1", "alice", ".ping")
+    backend.react(first.message, "bob", "👍")
+    backend.message("t1", "alice", "hi")
+
+    manager.start(backend=backend)
+
+    assert [m.text for m in backend.sent] == ["PONG"]
+    stats = manager.ingest.stats()
+    # The listener also yields a Connect event.
+    assert stats.received == stats.dispatched == 4
+    assert stats.depth == 0
@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import fbchat
+
+from fbchatbot.cache import TTLCache
+from fbchatbot.metadata import MetadataCache, ThreadInfo
+
+SESSION = fbchat.Session(user_id="bot", fb_dtsg="", revision=1)
+
+
+def user(id, name):
+    return fbchat.UserData(
+        session=SESSION,
+        id=id,
+        photo=None,
+        name=name,
+        is_friend=True,
+        first_name=name.split()[0],
+    )
+
+
+USERS = {"1": user("1", "Ada Lovelace"), "2": user("2", "Alan Turing")}
+GROUP = fbchat.GroupData(
+    session=SESSION,
+    id="g",
+    name="Computers",
+    participants={fbchat.User(session=SESSION, id=id) for id in USERS},
+    nicknames={"2": "Al"},
+    admins={"1"},
+)
+
+
+class FakeFetch:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, ids):
+        self.calls.append(list(ids))
+        return [USERS.get(id) or GROUP for id in ids if id in USERS or id == "g"]
+
+
+def test_ttl_cache():
+    now = [0.0]
+    cache = TTLCache(max_size=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    # b was the least recently used
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_get_caches():
+    fetch = FakeFetch()
+    metadata = MetadataCache(fetch=fetch, batch_window=0)
+
+    assert metadata.get("1").first_name == "Ada"
+    assert metadata.get("1").first_name == "Ada"
+    assert metadata.get("unknown") is None
+    assert metadata.get("unknown") is None
+    assert fetch.calls == [["1"], ["unknown"]]
+
+    assert metadata.nickname("g", "2") == "Al"
+    assert metadata.nickname("g", "1") == "Ada"
+    assert metadata.is_admin("g", "1")
+    assert metadata.get("g").participants == {"1", "2"}
+    assert fetch.calls[2:] == [["g", "2"]]
+
+
+def test_concurrent_misses_are_batched():
+    fetch = FakeFetch()
+    metadata = MetadataCache(fetch=fetch, batch_window=0.2)
+    barrier = threading.Barrier(4)
+
+    def get(id):
+        barrier.wait()
+        return metadata.get(id)
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(get, ["1", "1", "2", "g"]))
+
+    assert [r.id for r in results] == ["1", "1", "2", "g"]
+    assert len(fetch.calls) == 1
+    assert sorted(fetch.calls[0]) == ["1", "2", "g"]
+
+
+def test_unknown_ids_are_fetched_again_later():
+    now = [0.0]
+    fetch = FakeFetch()
+    metadata = MetadataCache(fetch=fetch, batch_window=0, miss_ttl=10)
+    metadata.cache.clock = lambda: now[0]
+
+    assert metadata.get("unknown") is None
+    now[0] = 11
+    assert metadata.get("unknown") is None
+    assert fetch.calls == [["unknown"], ["unknown"]]
+
+
+def test_snapshot(tmp_path):
+    metadata = MetadataCache(fetch=FakeFetch(), batch_window=0)
+    metadata.get_many(["1", "g", "unknown"])
+    metadata.save_snapshot(str(tmp_path / "snapshot.json"))
+
+    fetch = FakeFetch()
+    warm = MetadataCache(fetch=fetch)
+    assert warm.load_snapshot(str(tmp_path / "snapshot.json")) == 2
+    assert warm.get("g") == ThreadInfo.from_fbchat(GROUP)
+    assert fetch.calls == []
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.core_events import CommandEvent
+from fbchatbot.state import StateStore
+from fbchatbot.testing import FakeBackend
+
+
+def test_state_persists(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    state = store.namespace("plugin")
+    state["count"] = 1
+    state.set("config", {"enabled": True, "tags": ["a"]})
+    state.scoped(thread="t1")["count"] = 2
+    state.scoped(thread="t1", user="alice")["count"] = 3
+    store.namespace("other")["count"] = 4
+    state.scoped(user="bob")["gone"] = 5
+    del state.scoped(user="bob")["gone"]
+    store.close()
+
+    store = StateStore(path)
+    state = store.namespace("plugin")
+    assert dict(state.items()) == {"count": 1, "config": {"enabled": True, "tags": ["a"]}}
+    assert state.scoped(thread="t1")["count"] == 2
+    assert state.scoped(thread="t1", user="alice")["count"] == 3
+    assert state.scoped(user="alice").get("count") is None
+    assert "gone" not in state.scoped(user="bob")
+    assert store.namespace("other")["count"] == 4
+    with pytest.raises(KeyError):
+        del state["missing"]
+    store.close()
+
+
+def test_reads_are_cached(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"), flush_interval=60)
+    conn = store.writer.conn
+    store.writer.conn = Mock(wraps=conn)
+    state = store.namespace("plugin")
+
+    assert state.get("count") is None
+    state["count"] = 1
+    for thread in ("t1", "t2"):
+        state.scoped(thread=thread)["count"] = state.get("count") + 1
+
+    # Only the first read queried the database, and writes are still buffered.
+    assert store.writer.conn.execute.call_count == 1
+    assert store.writer.pending() == 3
+    store.writer.conn = conn
+    store.close()
+
+
+def test_bots_get_their_own_state(tmp_path):
+    config = SimpleNamespace(STATE_DB=str(tmp_path / "state.db"))
+    backend = FakeBackend()
+
+    def run_bots():
+        manager = ChatbotManager(config=config)
+        for name in ("bot1", "bot2"):
+            bot = manager.add_bot(name)
+            manager.assign_thread(f"t-{name}", bot)
+
+            @bot.command("inc")
+            def inc(e: CommandEvent, b):
+                state = b.get_state("counter").scoped(thread=e.thread.id)
+                state["n"] = state.get("n", 0) + 1
+                e.thread.send_text(str(state["n"]))
+
+        manager.start(backend=backend)
+        manager.get_state_store().close()
+
+    backend.message("t-bot1", "alice", ".inc")
+    backend.message("t-bot1", "alice", ".inc")
+    backend.message("t-bot2", "alice", ".inc")
+    run_bots()
+    backend.message("t-bot1", "alice", ".inc")
+    run_bots()
+
+    assert [(m.thread_id, m.text) for m in backend.sent] == [
+        ("t-bot1", "1"),
+        ("t-bot1", "2"),
+        ("t-bot2", "1"),
+        ("t-bot1", "3"),
+    ]
+
+
+def test_unflushed_state_is_saved_on_stop(tmp_path, monkeypatch):
+    monkeypatch.setattr("atexit.register", lambda f: None)
+    config = SimpleNamespace(STATE_DB=str(tmp_path / "state.db"))
+    manager = ChatbotManager(config=config)
+    bot = manager.add_bot("bot")
+    backend = FakeBackend(stop_when_idle=False)
+
+    @bot.command("remember")
+    def remember(e: CommandEvent, b):
+        b.get_state("notes")["note"] = e.command_body
+        manager.stop()
+
+    backend.message("t1", "alice", ".remember milk")
+    manager.start(backend=backend)
+
+    # The manager's store isn't closed, as when the process is killed after stopping.
+    store = StateStore(config.STATE_DB)
+    assert store.namespace("bot/notes")["note"] == "milk"
+    store.close()
@@ -0,0 +1,114 @@
+from unittest.mock import Mock
+import threading
+import time
+
+import fbchat
+import pytest
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.supervisor import Supervisor
+from fbchatbot.testing import FakeBackend
+
+
+def make_supervisor(backend, **kwargs):
+    delays = []
+    clock = iter(range(0, 1000, 5))
+    supervisor = Supervisor(
+        backend,
+        backend.session,
+        sleep=delays.append,
+        clock=lambda: next(clock),
+        **kwargs,
+    )
+    return supervisor, delays
+
+
+def texts(events):
+    return [e.message.text for e in events if isinstance(e, fbchat.MessageEvent)]
+
+
+def test_restarts_failed_listeners_with_backoff():
+    backend = FakeBackend()
+    supervisor, delays = make_supervisor(backend, initial_delay=1, max_delay=3)
+    backend.message("t", "alice", "one")
+    for _ in range(3):
+        backend.fail(RuntimeError("connection reset"))
+    backend.message("t", "alice", "two")
+    backend.fail(RuntimeError("connection reset"))
+
+    events = list(supervisor.events())
+
+    assert texts(events) == ["one", "two"]
+    # The delay is reset once a listener connects again.
+    assert delays == [1, 1, 1, 1]
+    assert supervisor.stats.restarts == 4
+    assert supervisor.stats.connects == 5
+    assert supervisor.stats.disconnects == 4
+    assert supervisor.stats.downtime == 20
+
+
+def test_backoff_grows_without_connecting():
+    backend = Mock()
+    backend.listener.return_value.listen.side_effect = RuntimeError("no network")
+    supervisor, delays = make_supervisor(
+        backend, initial_delay=1, max_delay=5, max_restarts=4
+    )
+    with pytest.raises(RuntimeError):
+        list(supervisor.events())
+    assert delays == [1, 2, 4, 5]
+
+
+def test_stop_cuts_backoff_short():
+    backend = FakeBackend()
+    backend.fail(RuntimeError("connection reset"))
+    supervisor = Supervisor(backend, backend.session, initial_delay=60)
+
+    threading.Timer(0.1, supervisor.stop).start()
+    started = time.monotonic()
+    assert list(supervisor.events()) == [fbchat.Connect()]
+    assert time.monotonic() - started < 5
+    assert supervisor.stats.restarts == 0
+
+
+def test_logged_out_sessions_are_not_restarted():
+    backend = FakeBackend()
+    supervisor, delays = make_supervisor(backend)
+    backend.fail(fbchat.NotLoggedIn("Logged out"))
+    with pytest.raises(fbchat.NotLoggedIn):
+        list(supervisor.events())
+    assert delays == []
+
+
+def test_backfills_missed_messages():
+    backend = FakeBackend()
+    supervisor, _ = make_supervisor(backend, threads=lambda: ["t1", "t2"])
+    backend.message("t1", "alice", "before")
+    backend.put(fbchat.Disconnect(reason="MQTT"))
+    backend.message("t1", "alice", "missed 1", missed=True)
+    backend.message("t3", "alice", "unclaimed", missed=True)
+    backend.put(fbchat.Connect())
+    # Messages arriving both live and through the backfill are only yielded once.
+    backend.message("t2", "bob", "missed 2")
+
+    events = list(supervisor.events())
+
+    assert texts(events) == ["before", "missed 1", "missed 2"]
+    assert supervisor.stats.backfilled == 2
+    assert supervisor.stats.disconnects == 1
+    assert supervisor.stats.downtime == 5
+
+
+def test_manager_recovers_messages_for_its_threads():
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+    manager.assign_thread("t1", bot)
+    backend = FakeBackend()
+    backend.message("t1", "alice", ".ping")
+    backend.fail(RuntimeError("connection reset"))
+    backend.message("t1", "alice", ".ping", missed=True)
+    backend.message("t2", "alice", ".ping", missed=True)
+
+    manager.start(backend=backend)
+
+    assert [m.thread_id for m in backend.sent] == ["t1", "t1"]
+    assert manager.supervisor.stats.restarts == 1
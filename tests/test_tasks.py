@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.tasks import TaskQueue, TaskResultEvent
+
+
+def square(x):
+    return x * x
+
+
+def fail():
+    raise ValueError("nope")
+
+
+def test_task_results_are_handled(monkeypatch):
+    monkeypatch.setattr("atexit.register", lambda f: None)
+    manager = ChatbotManager(config={})
+    bot = manager.add_bot("bot")
+    results = []
+    done = threading.Event()
+
+    @bot.listener
+    def on_result(e: TaskResultEvent):
+        results.append(e)
+        if len(results) == 2:
+            done.set()
+
+    thread = Mock(id="t")
+    ok_id = bot.submit_task(square, 7, thread=thread)
+    bot.submit_task(fail)
+
+    assert done.wait(10)
+    manager.tasks.shutdown()
+    by_name = {e.name: e for e in results}
+    assert by_name["square"].id == ok_id
+    assert by_name["square"].result == 49
+    assert by_name["square"].thread is thread
+    assert isinstance(by_name["fail"].error, ValueError)
+    assert manager.tasks.pending == 0
+
+
+def test_drain_waits_for_results(monkeypatch):
+    monkeypatch.setattr("atexit.register", lambda f: None)
+    tasks = TaskQueue(executor_factory=lambda n: ThreadPoolExecutor(2))
+    release = threading.Event()
+    results = []
+
+    tasks.submit(results.append, release.wait)
+    assert not tasks.drain(timeout=0.01)
+    release.set()
+    assert tasks.drain(timeout=10)
+    assert [e.result for e in results] == [True]
+    tasks.shutdown()
+
+
+def test_failed_submissions_are_not_pending(monkeypatch):
+    monkeypatch.setattr("atexit.register", lambda f: None)
+    pool = ThreadPoolExecutor(1)
+    tasks = TaskQueue(executor_factory=lambda n: pool)
+    pool.shutdown()
+
+    with pytest.raises(RuntimeError):
+        tasks.submit(lambda e: None, square, 2)
+    assert tasks.pending == 0
+    assert tasks.drain(timeout=0)
@@ -0,0 +1,111 @@
+from unittest.mock import Mock
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.core_events import CommandEvent
+from fbchatbot.throttle import Limit, Throttle, ThrottlePolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_buckets():
+    clock = FakeClock()
+    throttle = Throttle(ThrottlePolicy(per_author=Limit(2, per=10)), clock=clock)
+
+    assert throttle.check("ping", "a", "t") is None
+    assert throttle.check("ping", "a", "t") is None
+    rejection = throttle.check("ping", "a", "t")
+    assert rejection is not None and rejection.wait == 5
+    # Other authors have their own budget.
+    assert throttle.check("ping", "b", "t") is None
+
+    clock.now = 5
+    assert throttle.check("ping", "a", "t") is None
+    assert throttle.check("ping", "a", "t") is not None
+    assert throttle.rejected == 2
+
+
+def test_all_buckets_must_have_tokens():
+    clock = FakeClock()
+    throttle = Throttle(
+        ThrottlePolicy(per_author=Limit(2, per=10), per_thread=Limit(1, per=10)),
+        clock=clock,
+    )
+    assert throttle.check("ping", "a", "t") is None
+    assert throttle.check("ping", "a", "t") is not None
+    # The rejected command didn't use up the author's remaining token.
+    assert throttle.check("ping", "a", "other") is None
+
+
+def test_command_policies():
+    throttle = Throttle(ThrottlePolicy(overall=Limit(1)), clock=FakeClock())
+    throttle.set_policy(ThrottlePolicy(), "help")
+
+    assert throttle.check("ping", "a", "t") is None
+    assert throttle.check("echo", "a", "t") is not None
+    for _ in range(10):
+        assert throttle.check("help", "a", "t") is None
+
+
+def test_notice_sent_once_per_cooldown():
+    clock = FakeClock()
+    throttle = Throttle(
+        ThrottlePolicy(per_author=Limit(1, per=10), notice="Wait {wait:.0f}s"),
+        clock=clock,
+    )
+    assert throttle.check("ping", "a", "t") is None
+    assert throttle.check("ping", "a", "t").notice == "Wait 10s"
+    assert throttle.check("ping", "a", "t").notice is None
+
+    clock.now = 10
+    assert throttle.check("ping", "a", "t") is None
+    assert throttle.check("ping", "a", "t").notice == "Wait 10s"
+
+
+def test_buckets_are_bounded():
+    throttle = Throttle(
+        ThrottlePolicy(per_author=Limit(1)), max_keys=100, clock=FakeClock()
+    )
+    for i in range(1000):
+        throttle.check("ping", str(i), "t")
+    assert len(throttle) == 100
+
+
+def test_bot_throttles_commands():
+    bot = ChatbotManager(config={}).add_bot("bot")
+    ran = []
+
+    @bot.command("render")
+    def render(e):
+        ran.append(e)
+
+    bot.throttle_commands(ThrottlePolicy(per_thread=Limit(1), notice="Slow down"))
+
+    def command(name):
+        thread = Mock(id="t")
+        event = CommandEvent(  # type: ignore
+            author=Mock(id="a"),
+            thread=thread,
+            message=None,
+            at=None,
+            command=name,
+            command_body="",
+            sent_by_bot=False,
+        )
+        bot.handle(event)
+        return thread
+
+    command("render")
+    assert command("render").send_text.call_args_list[0].args == ("Slow down",)
+    assert not command("render").send_text.called
+    assert len(ran) == 1
+
+    # Unknown commands don't take up any buckets.
+    buckets = len(bot.throttle)
+    command("nope")
+    assert len(bot.throttle) == buckets
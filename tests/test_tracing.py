@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+import json
+
+import pytest
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.testing import FakeBackend
+from fbchatbot.tracing import Tracer, current_span, span
+
+
+def test_spans_nest_within_traces():
+    traces = []
+    tracer = Tracer(sink=traces.append, sample_rate=1)
+
+    with span("ignored"):
+        assert current_span() is None
+    with tracer.trace("root", kind="test"):
+        with span("child"):
+            with tracer.trace("grandchild"):
+                pass
+        with pytest.raises(ValueError):
+            with span("failing"):
+                raise ValueError("oops")
+    assert current_span() is None
+
+    (trace,) = traces
+    data = trace.to_json()
+    assert [(s["id"], s["parent"], s["name"]) for s in data["spans"]] == [
+        (1, None, "root"),
+        (2, 1, "child"),
+        (3, 2, "grandchild"),
+        (4, 1, "failing"),
+    ]
+    assert data["spans"][0]["kind"] == "test"
+    assert data["spans"][3]["error"] == "ValueError('oops')"
+    assert all(s["duration_ms"] >= 0 for s in data["spans"])
+
+
+def test_sampling():
+    traces = []
+    samples = iter([0.3, 0.1, 0.25, 0.9])
+    tracer = Tracer(sink=traces.append, sample_rate=0.25, rng=lambda: next(samples))
+    for i in range(4):
+        with tracer.trace(f"event {i}"):
+            pass
+    assert [t.spans[0].name for t in traces] == ["event 1"]
+    assert tracer.written == 1
+
+    # Without a sink or file, nothing is sampled.
+    with Tracer(sample_rate=1).trace("event"):
+        assert current_span() is None
+
+
+def test_traces_replies(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    config = SimpleNamespace(TRACE_FILE=str(path), TRACE_SAMPLE_RATE=1)
+    manager = ChatbotManager(config=config)
+    manager.add_bot("bot")
+    backend = FakeBackend()
+    backend.message("t1", "alice", ".ping")
+
+    manager.start(backend=backend)
+    manager.tracer.close()
+
+    connect, message = [json.loads(line) for line in path.read_text().splitlines()]
+    assert connect["name"] == "Connect"
+    spans = {s["id"]: s for s in message["spans"]}
+    (send,) = [s for s in spans.values() if s["name"] == "send"]
+    assert send["thread_id"] == "t1"
+    chain = []
+    while send["parent"] is not None:
+        send = spans[send["parent"]]
+        chain.append(send["name"])
+    assert chain == [
+        "command ping",
+        "listener handle_command",
+        "handle CommandEvent",
+        "listener _message_to_command",
+        "handle TextMessageEvent",
+        "listener _fbMessage_to_message",
+        # The raw fbchat event
+        "handle MessageEvent",
+        "MessageEvent",
+    ]
@@ -0,0 +1,91 @@
+import pytest
+
+from fbchatbot.chatbot_manager import ChatbotManager
+from fbchatbot.trigger import AhoCorasick, TriggerMatcher, literal_prefix, trigger
+
+
+def test_aho_corasick_finds_overlapping_words():
+    automaton = AhoCorasick(["he", "she", "his", "hers"])
+    found = sorted(automaton.find("ushers"))
+    assert found == [(1, 1), (2, 0), (2, 3)]
+
+
+def make_trigger(*keywords, patterns=()):
+    @trigger(*keywords, patterns=patterns)
+    def handler(e):
+        pass
+
+    return handler
+
+
+def test_matcher_keywords():
+    hi = make_trigger("hi", "hello there")
+    york = make_trigger("york")
+    matcher = TriggerMatcher([hi, york])
+
+    assert matcher.match("Hello there, New York!") == [
+        (hi, "Hello there"),
+        (york, "York"),
+    ]
+    # Keywords only match whole words.
+    assert matcher.match("this is yorkshire") == []
+
+
+def test_matcher_patterns():
+    number = make_trigger(patterns=[r"(\d+)\s*(km|mi)"])
+    thanks = make_trigger("ty", patterns=[r"thank(s| you)"])
+    matcher = TriggerMatcher([number, thanks])
+
+    assert matcher.match("thank you, it was 5 km") == [
+        (number, "5 km"),
+        (thanks, "thank you"),
+    ]
+    assert matcher.match("nothing to see") == []
+
+
+def test_matcher_overlapping_patterns():
+    letter = make_trigger(patterns=[r"a\d"])
+    digits = make_trigger(patterns=[r"\d+"])
+    matcher = TriggerMatcher([letter, digits])
+
+    assert matcher.match("a1") == [(letter, "a1"), (digits, "1")]
+
+
+def test_matcher_patterns_with_same_group_name():
+    km = make_trigger(patterns=[r"(?P<n>\d+)\s*km"])
+    mi = make_trigger(patterns=[r"(?P<n>\d+)\s*mi"])
+    matcher = TriggerMatcher([km, mi])
+
+    assert matcher.match("5 km, or 3 mi") == [(km, "5 km"), (mi, "3 mi")]
+    assert matcher.match("5 ft") == []
+
+
+def test_trigger_needs_keyword_or_pattern():
+    with pytest.raises(AssertionError):
+        make_trigger()
+
+
+def test_triggers_compiled_per_policy():
+    bot = ChatbotManager(config={}).add_bot("bot")
+    assert bot.dispatch_table().triggers is None
+
+    bot.add_trigger(make_trigger("rockets"), "rocket plugin")
+    bot.exclude_plugins(["rocket plugin"], "123")
+
+    assert bot.dispatch_table().triggers.match("launch the rockets")
+    assert bot.dispatch_table("123").triggers is None
+
+
+@pytest.mark.parametrize(
+    "pattern,prefix",
+    [
+        (r"hello\s+\d", "hello"),
+        (r"thank(s| you)", "thank"),
+        (r"\.foo", ".foo"),
+        (r"ab?c", "a"),
+        (r"abc|def", ""),
+        (r"(?i:abc)", ""),
+    ],
+)
+def test_literal_prefix(pattern, prefix):
+    assert literal_prefix(pattern) == prefix